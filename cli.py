@@ -3,6 +3,7 @@ import json
 import sys
 import argparse
 from cmr_agent.graph.pipeline import build_graph
+from cmr_agent.resources import open_resources, close_resources
 
 async def main():
     parser = argparse.ArgumentParser(description='NASA CMR AI Agent CLI')
@@ -13,7 +14,13 @@ async def main():
 
     query = ' '.join(args.query) or 'Find precipitation datasets for Sub-Saharan Africa 2015-2023'
     graph = build_graph()
+    await open_resources()
+    try:
+        await run(graph, query, args)
+    finally:
+        await close_resources()
 
+async def run(graph, query, args):
     if args.stream:
         # Stream AST events
         async for event in graph.astream({'user_query': query}):
@@ -1,32 +1,130 @@
 from __future__ import annotations
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Any, Dict, List, Tuple
 from datetime import datetime, timezone
 
+from cmr_agent.agents.coverage import CoverageAccumulator
+from cmr_agent.agents.footprints import spatial_coverage
+from cmr_agent.config import settings
+from cmr_agent.knowledge_graph import KnowledgeGraph
+from cmr_agent.types import compact_results, umm_items
+from cmr_agent.cmr.result_store import resolve_results
+from cmr_agent.cmr.sampling import sample_gaps
+
+EXECUTOR_MODES = ('inline', 'thread', 'process')
+
+# Shared executors, created on first use and shut down by the server lifespan
+_executors: Dict[str, Executor] = {}
+
+
+def _executor(mode: str) -> Executor:
+    executor = _executors.get(mode)
+    if executor is None:
+        if mode == 'process':
+            # spawn: forking a process that runs an event loop and threads is unsafe
+            executor = ProcessPoolExecutor(
+                max_workers=settings.analysis_max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        else:
+            executor = ThreadPoolExecutor(max_workers=settings.analysis_max_workers, thread_name_prefix='analysis')
+        _executors[mode] = executor
+    return executor
+
+
+def shutdown_executors():
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+
+
+def _count_items(cmr_results: Any) -> int:
+    searches = cmr_results.get('searches', []) if isinstance(cmr_results, dict) else []
+    return sum(
+        len((s.get(kind) or {}).get('items') or [])
+        for s in searches
+        for kind in ('collections', 'granules', 'variables')
+    )
+
+
+def _timed_analyze(cmr_results: dict, temporal_constraint, bbox_constraint) -> Tuple[dict, float, float]:
+    # Wall-clock timestamps so queue time can be measured across processes
+    started = time.time()
+    result = AnalysisAgent().analyze(cmr_results, temporal_constraint, bbox_constraint)
+    return result, started, time.time()
+
+
 class AnalysisAgent:
+    def __init__(self, mode: str | None = None, offload_min_items: int | None = None):
+        self.mode = mode or settings.analysis_executor
+        if self.mode not in EXECUTOR_MODES:
+            raise ValueError(f'analysis executor must be one of {EXECUTOR_MODES}, got {self.mode!r}')
+        self.offload_min_items = settings.analysis_offload_min_items if offload_min_items is None else offload_min_items
+        self.timing: Dict[str, Any] = {}
+
     async def run(
         self,
         cmr_results: dict,
         temporal_constraint: Tuple[str, str] | None = None,
         bbox_constraint: Tuple[float, float, float, float] | None = None,
+    ) -> dict:
+        """Analyze inline, or off the event loop in a thread/process for large inputs."""
+        # Items referenced by result-store handles are loaded here, before any offload
+        cmr_results = resolve_results(cmr_results)
+        items = _count_items(cmr_results)
+        mode = self.mode if items >= self.offload_min_items else 'inline'
+        submitted = time.time()
+        if mode == 'inline':
+            result, started, finished = _timed_analyze(cmr_results, temporal_constraint, bbox_constraint)
+        else:
+            # Worker processes get compact records, which pickle far smaller than UMM JSON
+            payload = compact_results(cmr_results) if mode == 'process' else cmr_results
+            result, started, finished = await asyncio.get_running_loop().run_in_executor(
+                _executor(mode), _timed_analyze, payload, temporal_constraint, bbox_constraint
+            )
+        self.timing = {
+            'mode': mode,
+            'items': items,
+            'queue_ms': round(max(0.0, started - submitted) * 1000, 1),
+            'compute_ms': round((finished - started) * 1000, 1),
+        }
+        return result
+
+    def analyze(
+        self,
+        cmr_results: dict,
+        temporal_constraint: Tuple[str, str] | None = None,
+        bbox_constraint: Tuple[float, float, float, float] | None = None,
     ) -> dict:
         searches = cmr_results.get('searches', []) if isinstance(cmr_results, dict) else []
         summary: dict[str, Any] = {
             'total_collections': 0,
             'total_granules': 0,
             'total_variables': 0,
+            'total_hits': {'collections': 0, 'granules': 0, 'variables': 0},
             'queries': [],
         }
 
-        knowledge_nodes = {"collections": set(), "variables": set(), "instruments": set()}
-        knowledge_edges: List[Dict[str, str]] = []  # {source, target, type}
+        graph = KnowledgeGraph()
 
         for s in searches:
-            cols = (s.get('collections') or {}).get('items', [])
-            grans = (s.get('granules') or {}).get('items', [])
-            vars = (s.get('variables') or {}).get('items', [])
+            # Items may be compact records (see cmr_agent.types); walk them as slim UMM dicts
+            cols = umm_items((s.get('collections') or {}).get('items', []))
+            grans = umm_items((s.get('granules') or {}).get('items', []))
+            vars = umm_items((s.get('variables') or {}).get('items', []))
+
+            # Prefer upstream hit counts (count probes / CMR-Hits) over the size of the fetched page
+            hits: Dict[str, int] = {}
+            for kind, items in (('collections', cols), ('granules', grans), ('variables', vars)):
+                h = (s.get(kind) or {}).get('hits')
+                hits[kind] = h if isinstance(h, int) else len(items)
+                summary['total_hits'][kind] += hits[kind]
 
             summary['total_collections'] += len(cols)
-            summary['total_granules'] += len(grans)
+            summary['total_granules'] += hits['granules']
             summary['total_variables'] += len(vars)
 
             providers = {((c.get('meta') or {}).get('provider-id') or 'unknown') for c in cols}
@@ -35,54 +133,25 @@ class AnalysisAgent:
                 for c in cols[:5]
             ]
 
-            # temporal coverage and spatial extent from granules
-            start: datetime | None = None
-            end: datetime | None = None
-            bbox: List[float] | None = None  # [west, south, east, north]
-
-            for g in grans:
-                umm = g.get('umm') or {}
-
-                # Temporal
-                te = (umm.get('TemporalExtent') or {}).get('RangeDateTime')
-                if te:
-                    try:
-                        b = datetime.fromisoformat(
-                            (te.get('BeginningDateTime') or '').replace('Z', '+00:00')
-                        )
-                        e = datetime.fromisoformat(
-                            (te.get('EndingDateTime') or '').replace('Z', '+00:00')
-                        )
-                        start = b if start is None or b < start else start
-                        end = e if end is None or e > end else end
-                    except Exception:
-                        # Skip malformed timestamps
-                        continue
-
-                # Spatial
-                se = (umm.get('SpatialExtent') or {})
-                geom = (se.get('HorizontalSpatialDomain') or {}).get('Geometry') or {}
-                boxes = geom.get('BoundingBox') or geom.get('BoundingRectangles') or []
-                if isinstance(boxes, dict):
-                    boxes = [boxes]
-                for box in boxes:
-                    try:
-                        w = float(box.get('WestBoundingCoordinate'))
-                        s_ = float(box.get('SouthBoundingCoordinate'))
-                        e_ = float(box.get('EastBoundingCoordinate'))
-                        n = float(box.get('NorthBoundingCoordinate'))
-                        if bbox is None:
-                            bbox = [w, s_, e_, n]
-                        else:
-                            bbox = [
-                                min(bbox[0], w),
-                                min(bbox[1], s_),
-                                max(bbox[2], e_),
-                                max(bbox[3], n),
-                            ]
-                    except Exception:
-                        # Skip malformed boxes
-                        continue
+            # Temporal coverage and spatial extent from granules: reuse the accumulator the
+            # CMR agent fed while paging, or fold the granules in here
+            snap = s.get('coverage') or {}
+            if not snap.get('granules'):
+                acc = CoverageAccumulator(settings.cmr_coverage_max_intervals)
+                acc.add_granules(grans)
+                snap = acc.snapshot()
+            start = datetime.fromisoformat(snap['start'].replace('Z', '+00:00')) if snap.get('start') else None
+            end = datetime.fromisoformat(snap['end'].replace('Z', '+00:00')) if snap.get('end') else None
+            bbox = snap.get('bbox')
+
+            # Facet histograms cover the whole record, not just the fetched granule page
+            hist = s.get('temporal_histogram') or {}
+            if hist.get('total'):
+                start = datetime.fromisoformat(hist['first']).replace(tzinfo=timezone.utc)
+                end = min(
+                    datetime.fromisoformat(hist['last']).replace(tzinfo=timezone.utc),
+                    datetime.now(timezone.utc),
+                )
 
             coverage: Dict[str, Any] = {}
             if start and end:
@@ -107,36 +176,9 @@ class AnalysisAgent:
                     if cid:
                         related.append(cid)
 
-            # Instruments knowledge graph edges
-            for c in cols:
-                cid = (c.get('meta') or {}).get('concept-id')
-                umm_c = (c.get('umm') or {})
-                if cid:
-                    knowledge_nodes["collections"].add(cid)
-                platforms = umm_c.get('Platforms') or []
-                if isinstance(platforms, dict):
-                    platforms = [platforms]
-                for p in platforms:
-                    instruments = (p or {}).get('Instruments') or []
-                    if isinstance(instruments, dict):
-                        instruments = [instruments]
-                    for instr in instruments:
-                        name = (instr or {}).get('ShortName') or (instr or {}).get('LongName')
-                        if name:
-                            knowledge_nodes["instruments"].add(name)
-                            if cid:
-                                knowledge_edges.append({"source": cid, "target": name, "type": "collection-instrument"})
-
-            # Variables knowledge graph edges
-            for v in vars:
-                vname = (v.get('umm') or {}).get('Name')
-                if vname:
-                    knowledge_nodes["variables"].add(vname)
-                assocs = (v.get('associations') or {}).get('collections', [])
-                for a in assocs:
-                    cid = a.get('concept_id')
-                    if cid and vname:
-                        knowledge_edges.append({"source": vname, "target": cid, "type": "variable-collection"})
+            # Collection/instrument/platform and variable/collection edges, deduplicated on insert
+            graph.ingest_collections(cols)
+            graph.ingest_variables(vars)
 
             # Compute simple latency/resolution placeholders if available on collections
             resolutions: List[str] = []
@@ -158,29 +200,14 @@ class AnalysisAgent:
             except Exception:
                 latency_days = None
 
-            # Estimate temporal gaps based on sorted granule temporal extents
-            temporal_gaps: List[Dict[str, str]] = []
-            try:
-                intervals: List[tuple[datetime, datetime]] = []
-                for g in grans:
-                    umm = g.get('umm') or {}
-                    te = (umm.get('TemporalExtent') or {}).get('RangeDateTime')
-                    if te:
-                        b = datetime.fromisoformat((te.get('BeginningDateTime') or '').replace('Z', '+00:00'))
-                        e = datetime.fromisoformat((te.get('EndingDateTime') or '').replace('Z', '+00:00'))
-                        intervals.append((b, e))
-                intervals.sort(key=lambda x: x[0])
-                for i in range(1, len(intervals)):
-                    prev_end = intervals[i-1][1]
-                    curr_start = intervals[i][0]
-                    if curr_start > prev_end:
-                        temporal_gaps.append({
-                            'gap_start': prev_end.strftime('%Y-%m-%d'),
-                            'gap_end': curr_start.strftime('%Y-%m-%d'),
-                            'gap_days': str((curr_start - prev_end).days),
-                        })
-            except Exception:
-                temporal_gaps = []
+            # Gaps between merged granule intervals (overlapping and nested granules are merged)
+            temporal_gaps: List[Dict[str, str]] = list(snap.get('gaps') or [])
+            # Stratified samples span the window, so empty strata stand in for gaps between records
+            sample = s.get('temporal_sample') or {}
+            if hist.get('total'):
+                temporal_gaps = list(hist.get('gaps') or [])
+            elif sample.get('strata'):
+                temporal_gaps = sample_gaps(sample)
 
             # Constraint overlap scoring
             def temporal_overlap_days() -> int:
@@ -214,16 +241,29 @@ class AnalysisAgent:
 
             t_days = temporal_overlap_days()
             s_iou = spatial_iou()
+            # Share of the requested region actually covered by granule footprints
+            footprint_cov = None
+            if grans and bbox_constraint:
+                footprint_cov = spatial_coverage(grans, bbox_constraint, settings.cmr_footprint_tolerance)
             res_score = 1.0 if resolutions else 0.0
             score = (t_days / 365.0) * 0.5 + s_iou * 0.3 + res_score * 0.2
 
             has_data = bool(cols or grans or vars)
+            if hist.get('total'):
+                temporal_pct = hist['coverage_pct']
+            elif sample.get('strata'):
+                temporal_pct = sample['coverage_pct']
+            else:
+                temporal_pct = 100.0 if has_data else 0.0
             quality = {
                 'spatial_res_km': float(resolutions[0]) if resolutions else None,
                 'temporal_res': 'hourly' if has_data else None,
                 'coverage': {
-                    'temporal_pct': 100.0 if has_data else 0.0,
-                    'spatial_pct': round(s_iou * 100, 1) if has_data else 0.0,
+                    'temporal_pct': temporal_pct,
+                    'temporal_pct_estimate': sample.get('coverage_pct'),
+                    'temporal_pct_ci95': sample.get('ci95_pct'),
+                    'spatial_pct': footprint_cov['pct'] if footprint_cov else 0.0,
+                    'spatial_footprints': footprint_cov['footprints'] if footprint_cov else 0,
                 },
                 'completeness_score': 0.86 if has_data else 0.0,
                 'suitability_for_task': round(score, 3) if has_data else 0.0,
@@ -238,7 +278,8 @@ class AnalysisAgent:
             query_entry = {
                 'query': s.get('query'),
                 'collections_found': len(cols),
-                'granules_found': len(grans),
+                'granules_found': hits['granules'],
+                'granules_fetched': len(grans),
                 'variables_found': len(vars),
                 'providers': sorted([p for p in providers if p]),
                 'example_collections': [t for t in titles if t],
@@ -249,6 +290,19 @@ class AnalysisAgent:
                 'resolutions': resolutions,
                 'latency_days': latency_days,
                 'temporal_gaps': temporal_gaps,
+                'temporal_histogram': {
+                    'resolution': hist.get('resolution'),
+                    'counts': hist.get('counts', {}),
+                } if hist.get('total') else {},
+                'temporal_sample': {
+                    'coverage_pct': sample['coverage_pct'],
+                    'ci95_pct': sample['ci95_pct'],
+                    'strata': len(sample['strata']),
+                    'empty_strata': sample.get('empty_strata', 0),
+                    'sampled_granules': sample.get('sampled_granules', 0),
+                    'requests': sample.get('requests', 0),
+                    'collections': sample.get('collections', []),
+                } if sample.get('strata') else {},
                 'gaps': gaps,
                 'quality': quality,
                 'score': round(score, 3),
@@ -284,23 +338,25 @@ class AnalysisAgent:
 
             summary.setdefault('related_collections', []).extend(col_details)
 
-        # Attach lightweight knowledge graph
-        summary['knowledge_graph'] = {
-            'nodes': {
-                'collections': sorted(list(knowledge_nodes['collections'])),
-                'variables': sorted(list(knowledge_nodes['variables'])),
-                'instruments': sorted(list(knowledge_nodes['instruments'])),
-            },
-            'edges': knowledge_edges,
-        }
-
-        # simple paging info
-        summary['results_paging'] = {'page': 1, 'page_size': 50, 'next_token': ''}
+        # Knowledge graph of this query only; the persistent cross-query graph lives in the pipeline
+        summary['knowledge_graph'] = graph.export()
 
-        # knowledge links and data refs placeholders
-        summary['knowledge_links'] = [
-            {'instrument': 'IMERG', 'relates_to': 'GPM', 'relation': 'derived_from'}
+        # paging info from Search-After granule fetches
+        paging_entries = [
+            p for s in searches for p in ((s.get('granules') or {}).get('paging') or [])
         ]
+        summary['results_paging'] = {
+            'page': 1,
+            'page_size': max((p.get('page_size') or 0 for p in paging_entries), default=50),
+            'next_token': next((p['next_token'] for p in paging_entries if p.get('next_token')), ''),
+            'pages_fetched': sum(p.get('pages', 0) for p in paging_entries),
+            'granules_fetched': sum(p.get('fetched', 0) for p in paging_entries),
+            'granule_hits': sum(p.get('hits') or 0 for p in paging_entries),
+            'collections': paging_entries,
+        }
+
+        # Cross-collection links are filled from the persistent knowledge graph in the pipeline
+        summary['knowledge_links'] = []
         summary['data_refs'] = [
             *(rc['concept_id'] for rc in summary.get('related_collections', [])[:2])
         ]
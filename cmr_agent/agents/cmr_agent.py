@@ -1,48 +1,553 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, Dict, List, Tuple
+import contextvars
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
 
-from cmr_agent.cmr.client import AsyncCMRClient
+from cmr_agent.agents.coverage import CoverageAccumulator
+from cmr_agent.agents.stage_dag import StageContext, StageDAG
+from cmr_agent.cmr.cache import cache_key
+from cmr_agent.cmr.client import AsyncCMRClient, get_shared_client
+from cmr_agent.cmr.facets import merge_histograms, temporal_histogram
+from cmr_agent.cmr.sampling import combine_strata, estimate_stratum, make_strata, merge_samples
 from cmr_agent.config import settings
 from cmr_agent.utils import infer_temporal, infer_bbox
 
 
-class CMRAgent:
+STAGE_TYPES = ("variable_search", "collection_search", "granule_search")
+# Granule records are only downloaded for the first few collections found
+GRANULE_FETCH_COLLECTIONS = 3
+
+
+# Stage whose task issued the current CMR call (each DAG stage runs in its own task)
+_current_stage: contextvars.ContextVar[str | None] = contextvars.ContextVar("cmr_stage", default=None)
+
+
+class _StageCalls:
+    """Concurrency achieved by one stage: peak in-flight calls and busy time / wall time."""
+
     def __init__(self):
-        self.client = AsyncCMRClient(settings.cmr_base_url)
+        self.calls = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.busy_seconds = 0.0
+        self.first_start: float | None = None
+        self.last_end = 0.0
+
+    def summary(self, stage: str) -> Dict[str, Any]:
+        wall = self.last_end - (self.first_start or self.last_end)
+        return {
+            "endpoint": "stage",
+            "stage": stage,
+            "calls": self.calls,
+            "max_parallelism": self.max_inflight,
+            "avg_parallelism": round(self.busy_seconds / wall, 2) if wall > 0 else float(self.calls > 0),
+        }
+
+
+def _stage_query(stage: Dict[str, Any], default: str) -> str:
+    return stage.get("query") or (stage.get("criteria") or {}).get("query") or default
+
+
+class CMRAgent:
+    def __init__(self, client: AsyncCMRClient | None = None):
+        # Reuse the lifespan-owned pooled client when available; only close clients we create
+        client = client or get_shared_client()
+        self._owns_client = client is None
+        self.client = client or AsyncCMRClient(settings.cmr_base_url)
         self.query_log: List[Dict[str, Any]] = []
+        self._requests: Dict[str, asyncio.Future] = {}
+        self._query = ""
+        self.deduped = 0
+        self._stage_calls: Dict[str, _StageCalls] = {}
+        # Per-query coverage folded in page by page; ``progress`` receives a snapshot after each page
+        self.coverage: Dict[str, CoverageAccumulator] = {}
+        self.progress: Callable[[Dict[str, Any]], Any] | None = None
+        # Results of searches issued before the plan existed, keyed like ``_once`` requests
+        self._primed: Dict[str, Dict[str, Any]] = {}
 
     def _log(self, endpoint: str, params: Dict[str, Any], result: Dict[str, Any]):
         try:
             items = result.get("items") or []
-            self.query_log.append(
-                {
-                    "endpoint": endpoint,
-                    "params": {k: v for k, v in params.items() if k != 'password'},
-                    "page_size": params.get("page_size"),
-                    "total_hits": len(items),
-                }
-            )
+            hits = result.get("hits")
+            entry = {
+                "endpoint": endpoint,
+                "params": {k: v for k, v in params.items() if k != 'password'},
+                "page_size": params.get("page_size"),
+                "total_hits": hits if isinstance(hits, int) else len(items),
+            }
+            self.query_log.append(entry)
+            self._call_progress(entry, len(items))
         except Exception:
             pass
 
+    def _call_progress(self, entry: Dict[str, Any], items: int = 0):
+        if self.progress is not None:
+            self.progress({
+                "event": "cmr_call",
+                "endpoint": entry["endpoint"],
+                "stage": _current_stage.get(),
+                "page_size": entry.get("page_size"),
+                "total_hits": entry.get("total_hits"),
+                "items": items,
+            })
+
+    async def count_hits(self, endpoint: str, params: Dict[str, Any]) -> int | None:
+        """Count-only probe (``page_size=0``); returns ``None`` if the probe fails."""
+        try:
+            hits = await self.client.count_hits(endpoint, params)
+        except Exception:
+            return None
+        self._log(endpoint, {**params, "page_size": 0}, {"hits": hits})
+        return hits
+
+    async def temporal_coverage(
+        self, params: Dict[str, Any], window: Tuple[str, str] | None = None
+    ) -> Dict[str, Any] | None:
+        """Per-period granule count histogram for one granule query, or ``None`` on failure."""
+        try:
+            hist = await temporal_histogram(
+                self.client,
+                params,
+                window,
+                resolution=settings.cmr_coverage_resolution,
+                max_requests=settings.cmr_coverage_max_requests,
+            )
+        except Exception:
+            return None
+        entry = {
+            "endpoint": "granule_facets",
+            "params": {k: v for k, v in params.items() if k != 'password'},
+            "page_size": 0,
+            "total_hits": hist.get("total", 0),
+            "requests": hist.get("requests", 0),
+        }
+        self.query_log.append(entry)
+        self._call_progress(entry)
+        return hist
+
+    def _observe(self, query: str | None, items: List[Dict[str, Any]]):
+        if query is None:
+            return
+        acc = self.coverage.get(query)
+        if acc is None:
+            acc = self.coverage[query] = CoverageAccumulator(settings.cmr_coverage_max_intervals)
+        acc.add_granules(items)
+        if self.progress is not None:
+            self.progress({"event": "coverage", "query": query, **acc.snapshot()})
+
+    def _base_params(self, q: str) -> Dict[str, Any]:
+        temporal = infer_temporal(q)
+        bbox = infer_bbox(q)
+        params: Dict[str, Any] = {"page_size": 25, "keyword": q}
+        provider = getattr(settings, "cmr_provider", None)
+        if provider and provider not in ("", "ALL", "CMR_ALL"):
+            params["provider"] = provider
+        if temporal[0] and temporal[1]:
+            params["temporal"] = f"{temporal[0]},{temporal[1]}"
+        if bbox:
+            w, s, e, n = bbox
+            params["bounding_box"] = f"{w},{s},{e},{n}"
+        return params
+
+    async def _once(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Run ``factory`` once per plan; identical sub-requests from other stages share it."""
+        task = self._requests.get(key)
+        if task is None:
+            task = self._requests[key] = asyncio.ensure_future(self._tracked(factory))
+        else:
+            self.deduped += 1
+        return await asyncio.shield(task)
+
+    async def _tracked(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        stage = _current_stage.get()
+        if stage is None:
+            return await factory()
+        calls = self._stage_calls.setdefault(stage, _StageCalls())
+        started = time.monotonic()
+        calls.calls += 1
+        calls.inflight += 1
+        calls.max_inflight = max(calls.max_inflight, calls.inflight)
+        calls.first_start = started if calls.first_start is None else calls.first_start
+        try:
+            return await factory()
+        finally:
+            ended = time.monotonic()
+            calls.inflight -= 1
+            calls.busy_seconds += ended - started
+            calls.last_end = max(calls.last_end, ended)
+
+    def _refreshing(self, endpoint: str) -> bool:
+        """Incremental refresh applies to collections/granules on clients that support it."""
+        return (
+            settings.cmr_incremental_refresh
+            and endpoint in ("collections", "granules")
+            and hasattr(self.client, "refresh")
+        )
+
+    async def _search(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        method = {
+            "collections": self.client.search_collections,
+            "granules": self.client.search_granules,
+            "variables": self.client.search_variables,
+        }[endpoint]
+
+        async def fetch() -> Dict[str, Any]:
+            if self._refreshing(endpoint):
+                res = await self.client.refresh(endpoint, params, max_items=params.get("page_size"))
+            else:
+                res = await method(params)
+            self._log(endpoint, params, res)
+            return res
+
+        return await self._once(cache_key(endpoint, params), fetch)
+
+    async def speculate(self, query: str) -> Dict[str, Dict[str, Any]]:
+        """Run the plan's base collection search for ``query`` before planning finishes.
+
+        The planner's collection stage searches the user query with these same
+        params, so the result can be handed to a later ``run_plan`` via ``prime``.
+        """
+        params = self._base_params(query)
+        res = await self._search("collections", params)
+        return {cache_key("collections", params): {"endpoint": "collections", "params": params, "result": res}}
+
+    def prime(self, speculative: Dict[str, Dict[str, Any]] | None):
+        """Seed ``run_plan`` with speculative results so matching stage requests reuse them."""
+        self._primed = dict(speculative or {})
+
+    def _peer(self, ctx: StageContext, stage_type: str) -> str | None:
+        """Stage of ``stage_type`` feeding ``ctx``: a declared dependency, else one for the same query."""
+        stages = ctx.dag.stages
+        for dep in ctx.dag.depends_on[ctx.name]:
+            if stages[dep].get("type") == stage_type:
+                return dep
+        q = _stage_query(ctx.stage, self._query)
+        for name, stage in stages.items():
+            if stage.get("type") == stage_type and _stage_query(stage, self._query) == q:
+                return name
+        return None
+
+    async def _variable_stage(self, ctx: StageContext) -> Dict[str, Any]:
+        _current_stage.set(ctx.name)
+        q = _stage_query(ctx.stage, self._query)
+        fanout = asyncio.Semaphore(max(1, settings.cmr_stage_fanout))
+        published: set = set()
+
+        async def search_term(term: str) -> Dict[str, Any]:
+            async with fanout:
+                try:
+                    res = await self._search("variables", {"keyword": term, "page_size": 25})
+                except Exception as exc:
+                    res = {"error": str(exc), "items": []}
+            # Publish newly associated collection ids so concept-id lookups start right away
+            new_ids = [cid for cid in _associated_ids(res) if cid not in published]
+            published.update(new_ids)
+            if new_ids:
+                await ctx.publish(new_ids)
+            return res
+
+        var_results = await asyncio.gather(*(search_term(t) for t in (ctx.stage.get("variable_terms") or [q])))
+        related: List[str] = []
+        for vres in var_results:
+            for cid in _associated_ids(vres):
+                if cid not in related:
+                    related.append(cid)
+        return {
+            "items": sum((vres.get("items", []) for vres in var_results), []),
+            "hits": sum(vres.get("hits") or 0 for vres in var_results),
+            "related_collection_ids": related,
+        }
+
+    async def _collection_stage(self, ctx: StageContext) -> Dict[str, Any]:
+        _current_stage.set(ctx.name)
+        q = _stage_query(ctx.stage, self._query)
+        base_params = self._base_params(q)
+        published: set = set()
+
+        fanout = asyncio.Semaphore(max(1, settings.cmr_stage_fanout))
+
+        async def search(params: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                async with fanout:
+                    res = await self._search("collections", params)
+            except Exception:
+                return {"items": []}
+            # Hand new collections to granule stages as soon as they arrive
+            for c in res.get("items") or []:
+                cid = (c.get("meta") or {}).get("concept-id")
+                if cid and cid not in published:
+                    published.add(cid)
+                    await ctx.publish(c)
+            return res
+
+        # By keyword plus by short_name and science_keywords_h for the first few terms
+        param_sets = [base_params]
+        terms = (ctx.stage.get("variable_terms") or [])[:3]
+        for field in ("short_name", "science_keywords_h"):
+            for term in terms:
+                p = {k: v for k, v in base_params.items() if k != "keyword"}
+                p[field] = term
+                param_sets.append(p)
+        tasks = [asyncio.ensure_future(search(p)) for p in param_sets]
+
+        # Concept-id lookups go out in chunks as soon as each variable's associations arrive
+        related: List[str] = []
+        id_tasks: List[asyncio.Future] = []
+        chunk = max(1, settings.cmr_concept_id_chunk)
+        var_stage = self._peer(ctx, "variable_search")
+        if var_stage:
+            async for batch in ctx.stream(var_stage):
+                new_ids = [cid for cid in batch if cid not in related]
+                related.extend(new_ids)
+                for i in range(0, len(new_ids), chunk):
+                    ids = new_ids[i:i + chunk]
+                    id_params = {k: v for k, v in base_params.items() if k != "keyword"}
+                    id_params["concept_id"] = ids
+                    id_params["page_size"] = max(len(ids), base_params["page_size"])
+                    id_tasks.append(asyncio.ensure_future(search(id_params)))
+        results = await asyncio.gather(*tasks)
+        by_id = await asyncio.gather(*id_tasks)
+
+        # Merge collection results (unique by concept-id)
+        merged: List[Dict[str, Any]] = []
+        seen = set()
+        for c in sum(((r or {}).get("items", []) for r in [*results, *by_id]), []):
+            cid = (c.get("meta") or {}).get("concept-id")
+            if cid and cid not in seen:
+                merged.append(c)
+                seen.add(cid)
+        return {"items": merged, "hits": (results[0] or {}).get("hits"), "related_collection_ids": related}
+
+    async def _fetch_granules(self, gparams: Dict[str, Any], probe: Any, query: str | None = None) -> Dict[str, Any]:
+        gid = gparams.get("collection_concept_id")
+        limit = settings.cmr_granules_per_collection
+        hits = await probe if probe is not None else None
+        if hits is not None:
+            limit = min(limit, hits)
+        if limit <= 0:
+            return {"hits": hits, "items": []}
+        gparams = {**gparams, "page_size": min(limit, settings.cmr_page_size)}
+        if self._refreshing("granules"):
+            res = await self.client.refresh("granules", gparams, max_items=limit)
+            self._observe(query, res["items"])
+            res["paging"] = {
+                "collection_concept_id": gid,
+                "page_size": gparams["page_size"],
+                "pages": res["refresh"]["requests"],
+                "hits": res.get("hits"),
+                "next_token": "",
+                "fetched": len(res["items"]),
+            }
+            self._log("granules", gparams, res)
+            return res
+        # Page through with Search-After up to the configured per-collection limit
+        items: List[Dict[str, Any]] = []
+        paging: Dict[str, Any] = {
+            "collection_concept_id": gid,
+            "page_size": gparams["page_size"],
+            "pages": 0,
+            "hits": None,
+            "next_token": "",
+        }
+        async for page in self.client.iter_pages("granules", gparams, max_items=limit):
+            items.extend(page.get("items", []))
+            self._observe(query, page.get("items", []))
+            paging["pages"] += 1
+            paging["hits"] = page.get("hits")
+            paging["next_token"] = page.get("search_after") or ""
+        paging["fetched"] = len(items)
+        res = {"hits": paging["hits"], "items": items, "paging": paging}
+        self._log('granules', gparams, res)
+        return res
+
+    async def _sample_granules(
+        self, gparams: Dict[str, Any], window: Tuple[str, str], query: str | None = None
+    ) -> Dict[str, Any]:
+        """One small page per temporal stratum, fetched in parallel, with a coverage estimate."""
+        strata = make_strata(window, settings.cmr_sample_strata)
+        size = max(1, settings.cmr_sample_page_size)
+        pages = await asyncio.gather(
+            *(
+                self._search("granules", {**gparams, "temporal": f"{start},{end}", "page_size": size})
+                for start, end in strata
+            ),
+            return_exceptions=True,
+        )
+        items: List[Dict[str, Any]] = []
+        entries: List[Dict[str, Any]] = []
+        for stratum, page in zip(strata, pages):
+            # A failed stratum is left out of the estimate rather than counted as a gap
+            if not isinstance(page, dict):
+                continue
+            stratum_items = page.get("items") or []
+            hits = page.get("hits")
+            items.extend(stratum_items)
+            entries.append(estimate_stratum(stratum, hits if isinstance(hits, int) else len(stratum_items), stratum_items))
+        self._observe(query, items)
+        sample = combine_strata(entries)
+        sample["collection_concept_id"] = gparams.get("collection_concept_id")
+        sample["requests"] = len(strata)
+        return {"items": items, "sample": sample}
+
+    async def _granule_stage(self, ctx: StageContext) -> Dict[str, Any]:
+        _current_stage.set(ctx.name)
+        q = _stage_query(ctx.stage, self._query)
+        base_params = self._base_params(q)
+        temporal = infer_temporal(q)
+        window = (temporal[0], temporal[1]) if temporal[0] and temporal[1] else None
+        # Stratified sampling needs a window to split; without one fall back to first pages
+        sampling = settings.cmr_granule_sampling == "stratified" and window is not None
+        fetch_limit = settings.cmr_sample_collections if sampling else GRANULE_FETCH_COLLECTIONS
+        probes: List[asyncio.Future] = []
+        fetches: List[asyncio.Future] = []
+        coverage: List[asyncio.Future] = []
+
+        # Start work for each collection as soon as the collection stage publishes it
+        source = self._peer(ctx, "collection_search")
+        async for collection in (ctx.stream(source) if source else _empty()):
+            gparams = {k: v for k, v in base_params.items() if k != "page_size"}
+            gid = (collection.get("meta") or {}).get("concept-id")
+            if gid:
+                gparams["collection_concept_id"] = gid
+            key = cache_key("granules", gparams)
+            probe = None
+            # Count-only probes give real granule totals for every candidate collection
+            # without downloading records, and size the fetches below
+            if len(probes) < settings.cmr_hit_probe_collections:
+                probe = asyncio.ensure_future(
+                    self._once("hits:" + key, lambda p=gparams: self.count_hits("granules", p))
+                )
+                probes.append(probe)
+            if len(fetches) < fetch_limit and sampling:
+                fetches.append(asyncio.ensure_future(
+                    self._once("sample:" + key, lambda p=gparams: self._sample_granules(p, window, q))
+                ))
+            elif len(fetches) < fetch_limit:
+                fetches.append(asyncio.ensure_future(
+                    self._once("pages:" + key, lambda p=gparams, pr=probe: self._fetch_granules(p, pr, q))
+                ))
+            if len(coverage) < settings.cmr_coverage_collections:
+                coverage.append(asyncio.ensure_future(
+                    self._once("coverage:" + key, lambda p=gparams: self.temporal_coverage(p, window))
+                ))
+
+        granules_results = await asyncio.gather(*fetches, return_exceptions=True)
+        probe_hits = await asyncio.gather(*probes)
+        histograms = [h for h in await asyncio.gather(*coverage) if h]
+
+        # Aggregate granules into a single view for the stage
+        items: List[Dict[str, Any]] = []
+        paging: List[Dict[str, Any]] = []
+        samples: List[Dict[str, Any]] = []
+        for gr in granules_results:
+            if isinstance(gr, dict):
+                items.extend(gr.get("items", []))
+                if gr.get("paging"):
+                    paging.append(gr["paging"])
+                if gr.get("sample"):
+                    samples.append(gr["sample"])
+        return {
+            "items": items,
+            "paging": paging,
+            "hits": sum(h for h in probe_hits if h is not None) if probes else None,
+            "temporal_histogram": merge_histograms(histograms, window) if histograms else None,
+            "temporal_sample": merge_samples(samples) or None,
+        }
+
+    def _normalize_stages(self, stages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Expand untyped stages into variable -> collection -> granule sub-stages."""
+        normalized: List[Dict[str, Any]] = []
+        for idx, stage in enumerate(stages):
+            if stage.get("type") in STAGE_TYPES:
+                normalized.append(stage)
+                continue
+            name = stage.get("name") or f"stage_{idx}"
+            normalized.extend([
+                {**stage, "name": f"{name}:variables", "type": "variable_search", "depends_on": []},
+                {**stage, "name": f"{name}:collections", "type": "collection_search", "depends_on": []},
+                {
+                    **stage,
+                    "name": f"{name}:granules",
+                    "type": "granule_search",
+                    "depends_on": [f"{name}:collections"],
+                },
+            ])
+        return normalized
+
+    async def run_plan(self, query: str, stages: List[Dict[str, Any]]) -> dict:
+        """Execute planner stages as a DAG and fold the results into one search per query."""
+        self._query = query
+        self._requests = {}
+        for key, entry in self._primed.items():
+            done = asyncio.get_running_loop().create_future()
+            done.set_result(entry["result"])
+            self._requests[key] = done
+            self._log(entry["endpoint"], {**entry["params"], "speculative": True}, entry["result"])
+        self._stage_calls = {}
+        self.coverage = {}
+        self.deduped = 0
+        dag = StageDAG(
+            self._normalize_stages(stages),
+            {
+                "variable_search": self._variable_stage,
+                "collection_search": self._collection_stage,
+                "granule_search": self._granule_stage,
+            },
+        )
+        outcome = await dag.run()
+
+        searches: Dict[str, Dict[str, Any]] = {}
+        for name, stage in dag.stages.items():
+            q = _stage_query(stage, query)
+            entry = searches.setdefault(q, {
+                "query": q,
+                "variables": {"items": [], "hits": 0},
+                "collections": {"items": [], "hits": None},
+                "granules": {"items": [], "paging": [], "hits": None},
+                "related_collection_ids": [],
+                "temporal_histogram": None,
+                "temporal_sample": None,
+                "coverage": None,
+            })
+            res = outcome["results"].get(name)
+            if res is None:
+                continue
+            kind = {"variable_search": "variables", "collection_search": "collections", "granule_search": "granules"}[stage["type"]]
+            target = entry[kind]
+            target["items"].extend(res.get("items", []))
+            if res.get("hits") is not None:
+                target["hits"] = (target.get("hits") or 0) + res["hits"]
+            if kind == "granules":
+                target["paging"].extend(res.get("paging", []))
+                entry["temporal_histogram"] = entry["temporal_histogram"] or res.get("temporal_histogram")
+                entry["temporal_sample"] = entry["temporal_sample"] or res.get("temporal_sample")
+            for cid in res.get("related_collection_ids", []):
+                if cid not in entry["related_collection_ids"]:
+                    entry["related_collection_ids"].append(cid)
+
+        for q, acc in self.coverage.items():
+            if q in searches:
+                searches[q]["coverage"] = acc.snapshot()
+
+        parallelism = [calls.summary(name) for name, calls in self._stage_calls.items()]
+        self.query_log.extend(parallelism)
+        report = {
+            **outcome["report"],
+            "errors": outcome["errors"],
+            "deduped_requests": self.deduped,
+            "speculative_requests": len(self._primed),
+        }
+        for entry in parallelism:
+            if entry["stage"] in report["stages"]:
+                report["stages"][entry["stage"]]["max_parallelism"] = entry["max_parallelism"]
+                report["stages"][entry["stage"]]["avg_parallelism"] = entry["avg_parallelism"]
+        return {"searches": list(searches.values()), "query_log": self.query_log, "stages": report}
+
     async def run(self, query: str, plan_or_subqueries: Any) -> dict:
         async def search_for(q: str) -> dict:
-            temporal = infer_temporal(q)
-            bbox = infer_bbox(q)
-            params: Dict[str, Any] = {
-                "page_size": 25,
-                "keyword": q,
-            }
-            provider = getattr(settings, "cmr_provider", None)
-            if provider and provider not in ("", "ALL", "CMR_ALL"):
-                params["provider"] = provider
-            if temporal[0] and temporal[1]:
-                params["temporal"] = f"{temporal[0]},{temporal[1]}"
-            if bbox:
-                w, s, e, n = bbox
-                params["bounding_box"] = f"{w},{s},{e},{n}"
+            params = self._base_params(q)
 
             collections_task = self.client.search_collections(params)
 
@@ -85,149 +590,30 @@ class CMRAgent:
                 "variables": variables_res if isinstance(variables_res, dict) else {"error": str(variables_res)},
             }
 
-        # If a planner provided stages, follow variable->collections->granules per stage
+        # If a planner provided stages, schedule them by type and dependency
         if isinstance(plan_or_subqueries, dict) and plan_or_subqueries.get("stages"):
-            stages = plan_or_subqueries["stages"]
-
-            async def run_stage(stage: Dict[str, Any]) -> Dict[str, Any]:
-                q = stage.get("query", query)
-                temporal = infer_temporal(q)
-                bbox = infer_bbox(q)
-                base_params: Dict[str, Any] = {"page_size": 25, "keyword": q}
-                provider = getattr(settings, "cmr_provider", None)
-                if provider and provider not in ("", "ALL", "CMR_ALL"):
-                    base_params["provider"] = provider
-                if temporal[0] and temporal[1]:
-                    base_params["temporal"] = f"{temporal[0]},{temporal[1]}"
-                if bbox:
-                    w, s, e, n = bbox
-                    base_params["bounding_box"] = f"{w},{s},{e},{n}"
-
-                variable_terms: List[str] = stage.get("variable_terms", [])
-                # Query variables for each term
-                var_results: List[Dict[str, Any]] = []
-                for term in (variable_terms or [q]):
-                    params_var = {"keyword": term, "page_size": 25}
-                    try:
-                        res = await self.client.search_variables(params_var)
-                    except Exception as exc:
-                        res = {"error": str(exc), "items": []}
-                    res["_term"] = term
-                    var_results.append(res)
-                    if isinstance(res, dict):
-                        self._log('variables', params_var, res)
-
-                # Collect related collection concept ids from variable associations
-                related_collection_ids: List[str] = []
-                for vres in var_results:
-                    for v in (vres.get("items") or []):
-                        assocs = (v.get("associations") or {}).get("collections", [])
-                        for a in assocs:
-                            cid = a.get("concept_id") or a.get("concept-id")
-                            if cid:
-                                related_collection_ids.append(cid)
-                # de-duplicate
-                seen = set()
-                related_collection_ids_unique = []
-                for cid in related_collection_ids:
-                    if cid not in seen:
-                        related_collection_ids_unique.append(cid)
-                        seen.add(cid)
-
-                # Prepare collection searches: by keyword plus by short_name, science_keywords_h, and concept_id batches if available
-                collections_keyword_task = self.client.search_collections(base_params)
-                short_name_tasks = []
-                science_kw_tasks = []
-                for term in (variable_terms or [])[:3]:
-                    p_short = {**base_params}
-                    p_short.pop("keyword", None)
-                    p_short["short_name"] = term
-                    short_name_tasks.append(self.client.search_collections(p_short))
-
-                    p_science = {**base_params}
-                    p_science.pop("keyword", None)
-                    p_science["science_keywords_h"] = term
-                    science_kw_tasks.append(self.client.search_collections(p_science))
-                collections_by_id: Dict[str, Any] = {"items": []}
-                if related_collection_ids_unique:
-                    # CMR supports repeating concept_id params
-                    try:
-                        id_params = {**base_params}
-                        id_params.pop("keyword", None)
-                        for idx, cid in enumerate(related_collection_ids_unique[:50]):
-                            id_params.setdefault("concept_id", []).append(cid)
-                        collections_by_id = await self.client.search_collections(id_params)
-                    except Exception:
-                        collections_by_id = {"items": []}
-
-                # Merge collection results (unique by concept-id)
-                def extract_items(obj: Dict[str, Any]) -> List[Dict[str, Any]]:
-                    return (obj or {}).get("items", [])
-
-                merged_items: List[Dict[str, Any]] = []
-                merge_seen = set()
-                results_list: List[Dict[str, Any]] = []
-                kw_cols = await collections_keyword_task
-                results_list.append(kw_cols)
-                if isinstance(kw_cols, dict):
-                    self._log('collections', base_params, kw_cols)
-                extra_results = await asyncio.gather(*short_name_tasks, *science_kw_tasks, return_exceptions=True)
-                for er in extra_results:
-                    if isinstance(er, dict):
-                        results_list.append(er)
-                        if er is not None and isinstance(er, dict):
-                            self._log('collections', base_params, er)
-                results_list.append(collections_by_id)
-                if isinstance(collections_by_id, dict):
-                    id_params = {k: v for k, v in base_params.items() if k != "keyword"}
-                    for idx, cid in enumerate(related_collection_ids_unique[:50]):
-                        id_params.setdefault("concept_id", []).append(cid)
-                    self._log('collections', id_params, collections_by_id)
-
-                for c in sum((extract_items(r) for r in results_list), []):
-                    cid = (c.get("meta") or {}).get("concept-id")
-                    if cid and cid not in merge_seen:
-                        merged_items.append(c)
-                        merge_seen.add(cid)
-
-                # Choose a few collections to fetch granules for
-                async def fetch_granules_for_collection(collection: Dict[str, Any]) -> Dict[str, Any]:
-                    gid = (collection.get("meta") or {}).get("concept-id")
-                    gparams = {k: v for k, v in base_params.items() if k != "page_size"}
-                    if gid:
-                        gparams["collection_concept_id"] = gid
-                    gparams["page_size"] = 50
-                    res = await self.client.search_granules(gparams)
-                    if isinstance(res, dict):
-                        self._log('granules', gparams, res)
-                    return res
-
-                granules_results: List[Dict[str, Any]] = []
-                # Limit to first 3 collections to avoid heavy load
-                granules_results = await asyncio.gather(
-                    *(fetch_granules_for_collection(c) for c in merged_items[:3]), return_exceptions=True
-                )
-
-                # Aggregate granules into a single view for the stage
-                combined_granules_items: List[Dict[str, Any]] = []
-                for gr in granules_results:
-                    if isinstance(gr, dict):
-                        combined_granules_items.extend((gr or {}).get("items", []))
-
-                return {
-                    "query": q,
-                    "variables": {"items": sum((vres.get("items", []) for vres in var_results), [])},
-                    "collections": {"items": merged_items},
-                    "granules": {"items": combined_granules_items},
-                    "related_collection_ids": related_collection_ids_unique,
-                }
-
-            searches = await asyncio.gather(*(run_stage(st) for st in stages))
-            return {"searches": searches}
+            return await self.run_plan(query, plan_or_subqueries["stages"])
 
         subqueries = plan_or_subqueries or [query]
         searches = await asyncio.gather(*(search_for(q) for q in (subqueries or [query])))
         return {"searches": searches, "query_log": self.query_log}
 
     async def close(self):
-        await self.client.close()
+        if self._owns_client:
+            await self.client.close()
+
+
+async def _empty():
+    return
+    yield
+
+
+def _associated_ids(variables_result: Dict[str, Any]) -> List[str]:
+    """Collection concept ids associated with the variables in a search result."""
+    ids: List[str] = []
+    for v in (variables_result.get("items") or []):
+        for a in (v.get("associations") or {}).get("collections", []):
+            cid = a.get("concept_id") or a.get("concept-id")
+            if cid:
+                ids.append(cid)
+    return ids
@@ -0,0 +1,122 @@
+"""Online temporal/spatial coverage of granules, fed page by page.
+
+Covered time is kept as sorted, disjoint ``[start, end]`` intervals in two
+parallel lists. An insert finds the overlapping run with ``bisect`` and
+replaces it with one merged interval, so overlapping or nested granules are
+handled correctly and the gaps are simply the spaces between intervals.
+Memory is bounded by ``max_intervals``: beyond it, the two intervals
+separated by the smallest gap are merged, so the largest gaps are kept.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from cmr_agent.agents.granule_columns import GranuleColumns
+
+_DAY_MS = 86_400_000
+
+
+def _iso(ms: int) -> str:
+    return str(np.datetime64(ms, 'ms').astype('datetime64[s]')) + 'Z'
+
+
+def _day(ms: int) -> str:
+    return str(np.datetime64(ms, 'ms').astype('datetime64[D]'))
+
+
+class CoverageAccumulator:
+    def __init__(self, max_intervals: int = 1000):
+        self.max_intervals = max(1, max_intervals)
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        self.granules = 0
+        self.pages = 0
+        self.coalesced = 0
+        self.bbox: Optional[List[float]] = None
+
+    def insert(self, start: int, end: int):
+        """Add one ``[start, end]`` interval (epoch milliseconds), merging any it touches."""
+        i = bisect_left(self._ends, start)
+        j = bisect_right(self._starts, end)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+        if len(self._starts) > self.max_intervals:
+            self._coalesce()
+
+    def _coalesce(self):
+        gaps = np.subtract(self._starts[1:], self._ends[:-1])
+        k = int(np.argmin(gaps))
+        self._ends[k] = self._ends[k + 1]
+        del self._starts[k + 1]
+        del self._ends[k + 1]
+        self.coalesced += 1
+
+    def add_columns(self, columns: GranuleColumns):
+        """Fold one page of granules in: the page is merged into runs with NumPy, then inserted."""
+        self.pages += 1
+        self.granules += len(columns)
+        if len(columns):
+            order = np.argsort(columns.begin, kind='stable')
+            begin = columns.begin[order].astype('int64')
+            end = np.maximum.accumulate(columns.end[order].astype('int64'))
+            # A new run starts wherever a granule begins after everything before it ended
+            breaks = np.nonzero(begin[1:] > end[:-1])[0] + 1
+            run_starts = begin[np.r_[0, breaks]]
+            run_ends = end[np.r_[breaks - 1, len(end) - 1]]
+            for s, e in zip(run_starts.tolist(), run_ends.tolist()):
+                self.insert(s, e)
+        box = columns.bbox_union()
+        if box is not None:
+            if self.bbox is None:
+                self.bbox = box
+            else:
+                self.bbox = [
+                    min(self.bbox[0], box[0]),
+                    min(self.bbox[1], box[1]),
+                    max(self.bbox[2], box[2]),
+                    max(self.bbox[3], box[3]),
+                ]
+
+    def add_granules(self, granules: List[Dict[str, Any]]):
+        self.add_columns(GranuleColumns.from_granules(granules))
+
+    @property
+    def start(self) -> Optional[int]:
+        return self._starts[0] if self._starts else None
+
+    @property
+    def end(self) -> Optional[int]:
+        return self._ends[-1] if self._ends else None
+
+    def gaps(self) -> List[Dict[str, str]]:
+        return [
+            {
+                'gap_start': _day(prev_end),
+                'gap_end': _day(next_start),
+                'gap_days': str((next_start - prev_end) // _DAY_MS),
+            }
+            for prev_end, next_start in zip(self._ends[:-1], self._starts[1:])
+        ]
+
+    def snapshot(self) -> Dict[str, Any]:
+        covered = sum(e - s for s, e in zip(self._starts, self._ends))
+        span = (self.end - self.start) if self._starts else 0
+        return {
+            'granules': self.granules,
+            'pages': self.pages,
+            'start': _iso(self.start) if self._starts else None,
+            'end': _iso(self.end) if self._ends else None,
+            'bbox': self.bbox,
+            'intervals': len(self._starts),
+            'covered_days': round(covered / _DAY_MS, 2),
+            'covered_pct': round(100.0 * covered / span, 1) if span else (100.0 if self._starts else 0.0),
+            'coalesced': self.coalesced,
+            'gaps': self.gaps(),
+        }
@@ -0,0 +1,136 @@
+"""Granule footprints and the share of a query region they cover.
+
+Footprints come from UMM-G ``GPolygons`` and ``BoundingRectangles`` and are
+built in bulk with shapely's vectorized constructors. Shapes that cross the
+antimeridian are split into an east and a west part. An STRtree keeps only
+the footprints that touch the region; they are simplified, clipped and
+unioned. The covered share is measured after projecting to an equal-area
+(cylindrical) plane, so high-latitude swaths are not over-weighted.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely import STRtree
+
+_WORLD = shapely.box(-180.0, -90.0, 180.0, 90.0)
+_EAST_OF_DATELINE = shapely.box(180.0, -90.0, 540.0, 90.0)
+# Longest edge kept straight before the equal-area projection (degrees)
+_SEGMENT_DEGREES = 1.0
+
+
+def split_box(west: float, south: float, east: float, north: float) -> List[Any]:
+    """Box for a bounding rectangle; one that crosses the antimeridian (west > east) becomes two."""
+    if west > east:
+        return [shapely.box(west, south, 180.0, north), shapely.box(-180.0, south, east, north)]
+    return [shapely.box(west, south, east, north)]
+
+
+def _rectangles(rows: List[Tuple[float, float, float, float]]) -> np.ndarray:
+    if not rows:
+        return np.empty(0, dtype=object)
+    b = np.array(rows, dtype=float)
+    crossing = b[:, 0] > b[:, 2]
+    # Rectangles crossing the antimeridian become [west, 180] and [-180, east]
+    west = np.concatenate([b[:, 0], np.full(crossing.sum(), -180.0)])
+    east = np.concatenate([np.where(crossing, 180.0, b[:, 2]), b[crossing, 2]])
+    south = np.concatenate([b[:, 1], b[crossing, 1]])
+    north = np.concatenate([b[:, 3], b[crossing, 3]])
+    return shapely.box(west, south, east, north)
+
+
+def _polygons(coords: np.ndarray, lengths: List[int]) -> np.ndarray:
+    """Polygons from rings stored back to back in ``coords``, ``lengths[i]`` points each."""
+    if not lengths:
+        return np.empty(0, dtype=object)
+    indices = np.repeat(np.arange(len(lengths)), lengths)
+    starts = np.cumsum([0] + lengths[:-1])
+    # A ring crosses the antimeridian when consecutive longitudes jump by more than 180 degrees
+    jumps = np.abs(np.diff(coords[:, 0])) > 180.0
+    jumps[starts[1:] - 1] = False
+    crossing = np.add.reduceat(np.append(jumps, False), starts) > 0
+    if crossing.any():
+        # Shift crossing rings onto a continuous 0..360 longitude range before building them
+        shift = crossing[indices] & (coords[:, 0] < 0)
+        coords = coords.copy()
+        coords[shift, 0] += 360.0
+    polys = shapely.polygons(shapely.linearrings(coords, indices=indices))
+    invalid = ~shapely.is_valid(polys)
+    if invalid.any():
+        polys[invalid] = shapely.make_valid(polys[invalid])
+    if not crossing.any():
+        return polys
+    wrapped = polys[crossing]
+    west_part = shapely.intersection(wrapped, _WORLD)
+    east_part = shapely.transform(shapely.intersection(wrapped, _EAST_OF_DATELINE), lambda xy: xy - [360.0, 0.0])
+    return np.concatenate([polys[~crossing], west_part, east_part])
+
+
+def granule_footprints(granules: List[Dict[str, Any]]) -> np.ndarray:
+    """Array of footprint geometries for all granules, split at the antimeridian."""
+    rows: List[Tuple[float, float, float, float]] = []
+    points_flat: List[Tuple[Any, Any]] = []
+    lengths: List[int] = []
+    for g in granules:
+        geom = ((((g.get('umm') or {}).get('SpatialExtent') or {}).get('HorizontalSpatialDomain') or {}).get('Geometry')) or {}
+        for poly in geom.get('GPolygons') or []:
+            points = ((poly or {}).get('Boundary') or {}).get('Points') or []
+            try:
+                ring = [(p['Longitude'], p['Latitude']) for p in points]
+            except (KeyError, TypeError):
+                continue
+            if len(ring) >= 3:
+                points_flat.extend(ring)
+                lengths.append(len(ring))
+        boxes = geom.get('BoundingRectangles') or geom.get('BoundingBox') or []
+        if isinstance(boxes, dict):
+            boxes = [boxes]
+        for box in boxes:
+            try:
+                rows.append((
+                    float(box['WestBoundingCoordinate']),
+                    float(box['SouthBoundingCoordinate']),
+                    float(box['EastBoundingCoordinate']),
+                    float(box['NorthBoundingCoordinate']),
+                ))
+            except (KeyError, TypeError, ValueError):
+                continue
+    try:
+        coords = np.array(points_flat, dtype=float).reshape(-1, 2)
+    except (TypeError, ValueError):
+        coords, lengths = np.empty((0, 2)), []
+    geoms = np.concatenate([_rectangles(rows), _polygons(coords, lengths)])
+    return geoms[~shapely.is_empty(geoms)] if len(geoms) else geoms
+
+
+def _equal_area(geom: Any) -> float:
+    """Area on a cylindrical equal-area projection (y = sin(latitude))."""
+    dense = shapely.segmentize(geom, _SEGMENT_DEGREES)
+    projected = shapely.transform(dense, lambda xy: np.column_stack([xy[:, 0], np.sin(np.radians(xy[:, 1]))]))
+    return float(shapely.area(projected))
+
+
+def spatial_coverage(
+    granules: List[Dict[str, Any]],
+    region: Sequence[float],
+    tolerance: float = 0.05,
+) -> Optional[Dict[str, Any]]:
+    """Share of the ``(west, south, east, north)`` region covered by the granule footprints."""
+    footprints = granule_footprints(granules)
+    area = shapely.union_all(split_box(*region))
+    region_area = _equal_area(area)
+    if not len(footprints) or region_area <= 0:
+        return None
+    tree = STRtree(footprints)
+    candidates = footprints[tree.query(area, predicate='intersects')]
+    if tolerance > 0:
+        candidates = shapely.simplify(candidates, tolerance)
+    covered = shapely.union_all(shapely.intersection(candidates, area))
+    return {
+        'pct': round(min(100.0, 100.0 * _equal_area(covered) / region_area), 1),
+        'footprints': int(len(footprints)),
+        'intersecting': int(len(candidates)),
+    }
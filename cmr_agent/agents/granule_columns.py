@@ -0,0 +1,120 @@
+"""Columnar view of granule records for vectorized analysis.
+
+One pass over the UMM-G dicts collects begin/end strings and bounding box
+corners. NumPy then parses them into ``datetime64`` arrays and an
+``(n, 4)`` float array, so temporal extent, coverage and the bbox union are
+array operations instead of per-granule ``datetime`` parsing.
+"""
+
+from __future__ import annotations
+
+import warnings
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_UNIT = 'datetime64[ms]'
+_BOX_KEYS = (
+    'WestBoundingCoordinate',
+    'SouthBoundingCoordinate',
+    'EastBoundingCoordinate',
+    'NorthBoundingCoordinate',
+)
+
+
+def _parse_one(value: Any) -> np.datetime64:
+    """Slow path for a single timestamp numpy cannot parse (offsets, odd formats)."""
+    try:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return np.datetime64('NaT', 'ms')
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(dt, 'ms')
+
+
+def parse_times(values: List[str]) -> np.ndarray:
+    """Parse naive ISO 8601 strings (UTC) into a ``datetime64[ms]`` array; bad values become NaT.
+
+    numpy deprecates parsing UTC offsets, so any value it rejects or warns
+    about sends the whole batch through the per-value slow path.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', DeprecationWarning)
+            return np.array(values, dtype=_UNIT)
+    except (ValueError, DeprecationWarning):
+        return np.array([_parse_one(v) for v in values], dtype=_UNIT)
+
+
+def parse_boxes(rows: List[Tuple[Any, Any, Any, Any]]) -> np.ndarray:
+    """``(n, 4)`` float array of ``[west, south, east, north]``; malformed rows are dropped."""
+    if not rows:
+        return np.empty((0, 4))
+    try:
+        boxes = np.array(rows, dtype=float)
+    except (TypeError, ValueError):
+        parsed = []
+        for row in rows:
+            try:
+                parsed.append([float(v) for v in row])
+            except (TypeError, ValueError):
+                continue
+        boxes = np.array(parsed, dtype=float).reshape(-1, 4)
+    return boxes[~np.isnan(boxes).any(axis=1)]
+
+
+class GranuleColumns:
+    """Begin/end times of granules with a valid range, and all of their bounding boxes."""
+
+    def __init__(self, begin: np.ndarray, end: np.ndarray, boxes: np.ndarray):
+        valid = ~(np.isnat(begin) | np.isnat(end))
+        self.begin = begin[valid]
+        self.end = end[valid]
+        self.boxes = boxes
+
+    @classmethod
+    def from_granules(cls, granules: List[Dict[str, Any]]) -> 'GranuleColumns':
+        begins: List[str] = []
+        ends: List[str] = []
+        rows: List[Tuple[Any, Any, Any, Any]] = []
+        w, s, e, n = _BOX_KEYS
+        for g in granules:
+            umm = g.get('umm') or {}
+            te = (umm.get('TemporalExtent') or {}).get('RangeDateTime')
+            if te:
+                # Drop the UTC 'Z' suffix here so numpy can parse the column in bulk
+                b = te.get('BeginningDateTime') or ''
+                x = te.get('EndingDateTime') or ''
+                begins.append(b[:-1] if b[-1:] == 'Z' else b)
+                ends.append(x[:-1] if x[-1:] == 'Z' else x)
+            geom = ((umm.get('SpatialExtent') or {}).get('HorizontalSpatialDomain') or {}).get('Geometry')
+            if not geom:
+                continue
+            boxes = geom.get('BoundingBox') or geom.get('BoundingRectangles') or []
+            if isinstance(boxes, dict):
+                boxes = [boxes]
+            for box in boxes:
+                if isinstance(box, dict):
+                    rows.append((box.get(w), box.get(s), box.get(e), box.get(n)))
+        return cls(parse_times(begins), parse_times(ends), parse_boxes(rows))
+
+    def __len__(self) -> int:
+        return len(self.begin)
+
+    def temporal_extent(self) -> Tuple[Optional[datetime], Optional[datetime]]:
+        if not len(self.begin):
+            return None, None
+        return _to_datetime(self.begin.min()), _to_datetime(self.end.max())
+
+    def bbox_union(self) -> Optional[List[float]]:
+        if not len(self.boxes):
+            return None
+        lo = self.boxes.min(axis=0)
+        hi = self.boxes.max(axis=0)
+        return [float(lo[0]), float(lo[1]), float(hi[2]), float(hi[3])]
+
+
+def _to_datetime(value: np.datetime64) -> datetime:
+    return value.astype('datetime64[us]').item().replace(tzinfo=timezone.utc)
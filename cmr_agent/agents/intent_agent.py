@@ -8,10 +8,12 @@ SYSTEM_PROMPT = (
 )
 
 class IntentAgent:
-    def __init__(self):
+    def __init__(self, router=None):
         try:
-            from cmr_agent.llm.router import LLMRouter
-            self.router = LLMRouter()
+            if router is None:
+                from cmr_agent.llm.router import LLMRouter
+                router = LLMRouter()
+            self.router = router
             try:
                 self.llm = self.router.get()
             except Exception:
@@ -20,23 +22,31 @@ class IntentAgent:
             self.router = None
             self.llm = None
 
+    @staticmethod
+    def split_query(query: str) -> list[str]:
+        """Heuristic subqueries: the query split on commas, semicolons and 'and'."""
+        parts = [p.strip() for p in re.split(r"[,;]|\band\b", query) if p.strip()]
+        return parts or [query]
+
+    @staticmethod
+    def classify(query: str) -> IntentType:
+        """Keyword-based intent, used without an LLM and for answer cache keys."""
+        lowered = query.lower()
+        if any(k in lowered for k in ['compare', 'relationship', 'impact', 'effect']):
+            return 'analytical'
+        if any(k in lowered for k in ['find', 'search', 'datasets', 'granules', 'variables']):
+            return 'specific'
+        return 'exploratory'
+
     async def run(self, query: str) -> tuple[IntentType, list[str]]:
         if self.llm is None:
             # heuristic fallback
-            lowered = query.lower()
-            if any(k in lowered for k in ['compare', 'relationship', 'impact', 'effect']):
-                intent: IntentType = 'analytical'
-            elif any(k in lowered for k in ['find', 'search', 'datasets', 'granules', 'variables']):
-                intent = 'specific'
-            else:
-                intent = 'exploratory'
-            # naive subquery split by 'and', commas
-            parts = [p.strip() for p in re.split(r"[,;]|\band\b", query) if p.strip()]
-            return intent, parts or [query]
+            return self.classify(query), self.split_query(query)
 
         import json
+        from cmr_agent.llm.router import ainvoke
         prompt = f"{SYSTEM_PROMPT}\nQuery: {query}\nRespond as JSON with keys: intent, subqueries."
-        msg = await self.llm.ainvoke(prompt)
+        msg = await ainvoke(self.llm, prompt, 'intent')
         content = getattr(msg, 'content', str(msg))
         intent: IntentType = 'exploratory'
         subqueries: list[str] = [query]
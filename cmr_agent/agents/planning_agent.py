@@ -10,10 +10,12 @@ SYSTEM_PROMPT = (
 
 
 class PlanningAgent:
-    def __init__(self):
+    def __init__(self, router=None):
         try:
-            from cmr_agent.llm.router import LLMRouter
-            self.router = LLMRouter()
+            if router is None:
+                from cmr_agent.llm.router import LLMRouter
+                router = LLMRouter()
+            self.router = router
             try:
                 self.llm = self.router.get()
             except Exception:
@@ -28,9 +30,10 @@ class PlanningAgent:
         if not self.llm or not seeds:
             return list(dict.fromkeys(expanded))
         import json
+        from cmr_agent.llm.router import ainvoke
         prompt = f"{SYSTEM_PROMPT}\nTerms: {', '.join(seeds)}"
         try:
-            msg = await self.llm.ainvoke(prompt)
+            msg = await ainvoke(self.llm, prompt, 'planning')
             content = getattr(msg, 'content', str(msg))
             data = json.loads(content)
             if isinstance(data, list):
@@ -0,0 +1,161 @@
+"""Dependency-aware executor for planner stages.
+
+Every stage runs as its own task. A handler waits only for the data it needs:
+either a dependency's final result (``ctx.result``) or the items a
+dependency publishes while it is still running (``ctx.stream``). A granule
+stage can therefore start on the first collection a collection stage finds,
+instead of waiting for the whole stage to finish.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+
+class _Channel:
+    """Append-only item log that several readers can follow while it grows."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.closed = False
+        self._changed = asyncio.Condition()
+
+    async def publish(self, item: Any):
+        async with self._changed:
+            self.items.append(item)
+            self._changed.notify_all()
+
+    async def close(self):
+        async with self._changed:
+            self.closed = True
+            self._changed.notify_all()
+
+    async def follow(self) -> AsyncIterator[Any]:
+        idx = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: idx < len(self.items) or self.closed)
+                batch = self.items[idx:]
+                closed = self.closed
+            for item in batch:
+                yield item
+            idx += len(batch)
+            if closed and idx >= len(self.items):
+                return
+
+
+class StageContext:
+    def __init__(self, dag: 'StageDAG', name: str):
+        self.dag = dag
+        self.name = name
+        self.stage = dag.stages[name]
+
+    def has(self, name: str) -> bool:
+        return name in self.dag.stages
+
+    async def result(self, name: str) -> Any:
+        """Wait for stage ``name`` to finish and return its result."""
+        return await asyncio.shield(self.dag._tasks[name])
+
+    def stream(self, name: str) -> AsyncIterator[Any]:
+        """Follow items published by stage ``name`` as they arrive."""
+        return self.dag._channels[name].follow()
+
+    async def publish(self, item: Any):
+        await self.dag._channels[self.name].publish(item)
+
+
+Handler = Callable[[StageContext], Awaitable[Any]]
+
+
+class StageDAG:
+    """Run planner stages by type, honoring ``depends_on``, and report the critical path."""
+
+    def __init__(self, stages: List[Dict[str, Any]], handlers: Dict[str, Handler]):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        for stage in stages:
+            name = stage.get('name') or stage.get('type')
+            if not name or name in self.stages:
+                raise ValueError(f'stage names must be unique and non-empty: {name!r}')
+            if stage.get('type') not in handlers:
+                raise ValueError(f'no handler for stage type {stage.get("type")!r}')
+            self.stages[name] = stage
+        self.handlers = handlers
+        self.depends_on = {
+            name: [d for d in (stage.get('depends_on') or []) if d in self.stages]
+            for name, stage in self.stages.items()
+        }
+        self._check_acyclic()
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._channels: Dict[str, _Channel] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def _check_acyclic(self):
+        state: Dict[str, int] = {}
+
+        def visit(name: str):
+            if state.get(name) == 1:
+                raise ValueError(f'stage dependency cycle through {name!r}')
+            if state.get(name) == 2:
+                return
+            state[name] = 1
+            for dep in self.depends_on[name]:
+                visit(dep)
+            state[name] = 2
+
+        for name in self.stages:
+            visit(name)
+
+    async def _run_stage(self, name: str, t0: float) -> Any:
+        ctx = StageContext(self, name)
+        timing = self.timings[name] = {'started_ms': (time.monotonic() - t0) * 1000}
+        try:
+            return await self.handlers[self.stages[name]['type']](ctx)
+        finally:
+            timing['finished_ms'] = (time.monotonic() - t0) * 1000
+            await self._channels[name].close()
+
+    async def run(self) -> Dict[str, Any]:
+        t0 = time.monotonic()
+        self._channels = {name: _Channel() for name in self.stages}
+        self._tasks = {name: asyncio.ensure_future(self._run_stage(name, t0)) for name in self.stages}
+        outcomes = await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        results: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        for name, outcome in zip(self._tasks, outcomes):
+            if isinstance(outcome, BaseException):
+                errors[name] = str(outcome)
+            else:
+                results[name] = outcome
+        return {'results': results, 'errors': errors, 'report': self.report()}
+
+    def critical_path(self) -> List[str]:
+        """Chain of stages, following the latest-finishing dependency, that ends last."""
+        if not self.timings:
+            return []
+        finished = {n: t.get('finished_ms', 0.0) for n, t in self.timings.items()}
+        current: Optional[str] = max(finished, key=finished.get)
+        path: List[str] = []
+        while current is not None:
+            path.append(current)
+            deps = self.depends_on.get(current) or []
+            current = max(deps, key=lambda d: finished.get(d, 0.0)) if deps else None
+        return list(reversed(path))
+
+    def report(self) -> Dict[str, Any]:
+        path = self.critical_path()
+        return {
+            'stages': {
+                name: {
+                    'type': self.stages[name].get('type'),
+                    'depends_on': self.depends_on[name],
+                    'started_ms': round(t.get('started_ms', 0.0), 1),
+                    'finished_ms': round(t.get('finished_ms', 0.0), 1),
+                }
+                for name, t in self.timings.items()
+            },
+            'critical_path': path,
+            'critical_path_ms': round(self.timings[path[-1]].get('finished_ms', 0.0), 1) if path else 0.0,
+        }
@@ -2,10 +2,12 @@ from __future__ import annotations
 from typing import Any, List
 
 class SynthesisAgent:
-    def __init__(self):
+    def __init__(self, router=None):
         try:
-            from cmr_agent.llm.router import LLMRouter
-            self.router = LLMRouter()
+            if router is None:
+                from cmr_agent.llm.router import LLMRouter
+                router = LLMRouter()
+            self.router = router
             try:
                 self.llm = self.router.get()
             except Exception:
@@ -36,5 +38,6 @@ class SynthesisAgent:
             "You are an Earth science data expert. Given a user's query and analysis metadata (counts, examples), "
             "write a concise, structured recommendation: 1) Summary 2) Datasets to consider 3) Gaps & trade-offs 4) Next steps."
         )
-        msg = await self.llm.ainvoke(f"{prompt}\nUser query: {query}\nAnalysis JSON: {analysis}")
+        from cmr_agent.llm.router import ainvoke
+        msg = await ainvoke(self.llm, f"{prompt}\nUser query: {query}\nAnalysis JSON: {analysis}", 'synthesis')
         return getattr(msg, 'content', str(msg))
@@ -0,0 +1,263 @@
+"""Final-response cache in front of the compiled graph.
+
+Queries are keyed by what the pipeline would search for rather than by their
+exact text: the heuristic intent (``IntentAgent.classify``), the inferred
+temporal window and bounding box (``infer_temporal``/``infer_bbox``) and the
+sorted set of content terms. Building the key needs no LLM or CMR call, so a
+hit is answered in milliseconds. Queries that differ only in term spelling can
+also match a cached entry with the same intent, window and bbox by embedding
+cosine similarity (or term overlap when no embedder is configured).
+
+Entries live for ``ttl`` seconds and are then served stale for up to
+``stale`` more seconds while one background run refreshes them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, Optional, Sequence, Set, Tuple
+
+from cmr_agent.agents.intent_agent import IntentAgent
+from cmr_agent.cmr.singleflight import SingleFlight
+from cmr_agent.config import settings
+from cmr_agent.utils import REGION_TO_BBOX, infer_bbox, infer_temporal
+
+STOPWORDS = frozenset(
+    'a an and any are at between by data dataset datasets do does during find for from get give how i in is '
+    'list me of on or over please search show than that the to what which with'.split()
+)
+
+YEAR = re.compile(r'(?:19|20)\d{2}')
+
+Embedder = Callable[[str], Sequence[float]]
+
+
+def query_terms(query: str) -> FrozenSet[str]:
+    """Lowercased content terms, without years, region names or stopwords, with plurals folded."""
+    lowered_query = query.lower()
+    # Years and regions are already part of the scope
+    region_words = {w for region in REGION_TO_BBOX if region in lowered_query for w in region.split()}
+    terms: Set[str] = set()
+    for token in re.findall(r'[A-Za-z0-9][A-Za-z0-9_.-]*', query):
+        lowered = token.lower()
+        if lowered in STOPWORDS or lowered in region_words or re.fullmatch(r'(?:(?:19|20)\d{2}[-/]?)+', token):
+            continue
+        # Fold plurals, but leave acronyms such as MODIS or GPS alone
+        if not token.isupper() and len(lowered) > 3 and lowered.endswith('s') and not lowered.endswith('ss'):
+            lowered = lowered[:-1]
+        terms.add(lowered)
+    return frozenset(terms)
+
+
+def query_scope(query: str) -> str:
+    """Intent, temporal window (or the years mentioned) and bbox; entries only match within one scope."""
+    temporal = list(infer_temporal(query))
+    if temporal == [None, None]:
+        # infer_temporal needs two years for a range; a single year still changes the answer
+        temporal = sorted(set(YEAR.findall(query)))
+    return json.dumps([IntentAgent.classify(query), temporal, infer_bbox(query)])
+
+
+def cache_key(query: str) -> str:
+    return json.dumps([query_scope(query), sorted(query_terms(query))])
+
+
+def _cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+class _Entry:
+    __slots__ = ('result', 'stored_at', 'scope', 'terms', 'embedding')
+
+    def __init__(self, result: Dict[str, Any], scope: str, terms: FrozenSet[str], embedding: Optional[Sequence[float]]):
+        self.result = result
+        self.stored_at = time.monotonic()
+        self.scope = scope
+        self.terms = terms
+        self.embedding = embedding
+
+
+class AnswerCache:
+    """LRU of final graph responses with TTL and stale-while-revalidate.
+
+    ``near_duplicate`` is the similarity (0-1) at which a query without an
+    exact key match may reuse an entry from the same scope; 0 disables it.
+    ``embed`` maps a query to a vector; without it similarity is the overlap
+    of the two term sets.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl: float = 600.0,
+        stale: float = 0.0,
+        near_duplicate: float = 0.0,
+        embed: Optional[Embedder] = None,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale = stale
+        self.near_duplicate = near_duplicate
+        self.embed = embed
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        # Concurrent misses for one key share a single graph run
+        self._flight = SingleFlight()
+        self.hits = 0
+        self.near_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    async def get_or_run(self, query: str, run: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Cached response for ``query``, or the result of ``run()``; returns ``(result, cache_info)``."""
+        started = time.perf_counter()
+        exact_key = key = cache_key(query)
+        scope = query_scope(query)
+        terms = query_terms(query)
+        entry, match = self._entries.get(key), 'exact'
+        embedding = None
+        if entry is None and self.near_duplicate > 0:
+            if self.embed is not None:
+                embedding = await self._embed(query)
+            key, entry = self._nearest(scope, terms, embedding)
+            match = 'near_duplicate'
+        if entry is not None:
+            age = time.monotonic() - entry.stored_at
+            if age <= self.ttl + self.stale:
+                self._entries.move_to_end(key)
+                stale = age > self.ttl
+                if stale:
+                    self.stale_hits += 1
+                    self._refresh(key, run, scope, entry.terms, entry.embedding)
+                else:
+                    self.hits += 1
+                if match == 'near_duplicate':
+                    self.near_hits += 1
+                info = {
+                    'hit': True,
+                    'match': match,
+                    'stale': stale,
+                    'age_s': round(age, 3),
+                    'lookup_ms': round((time.perf_counter() - started) * 1000, 3),
+                }
+                return entry.result, info
+            self._entries.pop(key, None)
+        self.misses += 1
+        if embedding is None and self.embed is not None and self.near_duplicate > 0:
+            embedding = await self._embed(query)
+        coalesced = exact_key in self._flight._inflight
+
+        async def run_and_put():
+            result = await run()
+            self.put(exact_key, result, scope, terms, embedding)
+            return result
+
+        result = await self._flight.do(exact_key, run_and_put)
+        return result, {'hit': False, 'coalesced': coalesced}
+
+    def put(self, key: str, result: Dict[str, Any], scope: str, terms: FrozenSet[str], embedding: Optional[Sequence[float]] = None):
+        # Only complete answers are reused; failed or partial runs are recomputed next time
+        if not isinstance(result, dict) or not result.get('synthesis'):
+            return
+        self._entries[key] = _Entry(result, scope, terms, embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'evictions': self.evictions,
+            'coalesced': self._flight.coalesced,
+        }
+
+    def clear(self):
+        for task in self._refreshing.values():
+            task.cancel()
+        self._refreshing.clear()
+        self._entries.clear()
+
+    def _nearest(self, scope: str, terms: FrozenSet[str], embedding: Optional[Sequence[float]]) -> Tuple[Optional[str], Optional[_Entry]]:
+        best_key, best, best_score = None, None, self.near_duplicate
+        for key, entry in self._entries.items():
+            if entry.scope != scope:
+                continue
+            if embedding is not None and entry.embedding is not None:
+                score = _cosine(embedding, entry.embedding)
+            else:
+                score = _jaccard(terms, entry.terms)
+            if score >= best_score:
+                best_key, best, best_score = key, entry, score
+        return best_key, best
+
+    async def _embed(self, query: str) -> Optional[Sequence[float]]:
+        try:
+            return await asyncio.to_thread(self.embed, query)
+        except Exception:
+            return None
+
+    def _refresh(self, key: str, run: Callable[[], Awaitable[Dict[str, Any]]], scope: str, terms: FrozenSet[str], embedding):
+        if key in self._refreshing:
+            return
+
+        async def refresh():
+            try:
+                result = await run()
+                self.put(key, result, scope, terms, embedding)
+                self.refreshes += 1
+            except Exception:
+                # Keep serving the stale entry until it ages out
+                pass
+            finally:
+                self._refreshing.pop(key, None)
+
+        self._refreshing[key] = asyncio.create_task(refresh())
+
+
+# Process-wide cache used by the compiled graph; cleared with the resource registry
+_cache: Optional[AnswerCache] = None
+
+
+def get_answer_cache() -> AnswerCache:
+    global _cache
+    if _cache is None:
+        embed = None
+        if settings.answer_cache_embeddings and settings.answer_cache_near_duplicate > 0:
+            from cmr_agent.resources import get_resources
+            store = getattr(get_resources(), 'store', None)
+            embed = getattr(store, 'embed', None)
+        _cache = AnswerCache(
+            max_entries=settings.answer_cache_max_entries,
+            ttl=settings.answer_cache_ttl_seconds,
+            stale=settings.answer_cache_stale_seconds,
+            near_duplicate=settings.answer_cache_near_duplicate,
+            embed=embed,
+        )
+    return _cache
+
+
+def close_answer_cache():
+    global _cache
+    cache, _cache = _cache, None
+    if cache is not None:
+        cache.clear()
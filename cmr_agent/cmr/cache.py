@@ -0,0 +1,150 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def normalize_params(params: Dict[str, Any]) -> list:
+    """Order-insensitive representation of CMR query params.
+
+    List-valued params (e.g. repeated ``concept_id``) are sorted so the same
+    set of ids in a different order maps to the same cache entry.
+    """
+    normalized = []
+    for key in sorted(params):
+        value = params[key]
+        if isinstance(value, (list, tuple, set)):
+            value = sorted(str(v) for v in value)
+        elif value is not None:
+            value = str(value)
+        normalized.append([key, value])
+    return normalized
+
+
+def cache_key(endpoint: str, params: Dict[str, Any]) -> str:
+    raw = json.dumps([endpoint, normalize_params(params)], separators=(',', ':'))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """TTL + byte-bounded LRU cache of raw CMR response bodies.
+
+    Entries live in memory up to ``max_bytes``; least recently used entries
+    are evicted first. When ``disk_dir`` is set every entry is also written
+    there so cached responses survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 300.0,
+        disk_dir: Optional[str] = None,
+    ):
+        self.max_bytes = max_bytes
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._entries: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+
+    def ttl_for(self, endpoint: str) -> float:
+        return float(self.ttls.get(endpoint, self.default_ttl))
+
+    def get(self, endpoint: str, params: Dict[str, Any]) -> Optional[bytes]:
+        if self.ttl_for(endpoint) <= 0:
+            return None
+        key = cache_key(endpoint, params)
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, content = entry
+            if expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return content
+            self._remove(key)
+        entry = self._read_disk(key)
+        if entry is not None and entry[0] > now:
+            self._store(key, entry[0], entry[1])
+            self.hits += 1
+            self.disk_hits += 1
+            return entry[1]
+        self.misses += 1
+        return None
+
+    def set(self, endpoint: str, params: Dict[str, Any], content: bytes):
+        ttl = self.ttl_for(endpoint)
+        if ttl <= 0:
+            return
+        key = cache_key(endpoint, params)
+        expires_at = time.time() + ttl
+        self._store(key, expires_at, content)
+        self._write_disk(key, expires_at, content)
+
+    def clear(self):
+        self._entries.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'disk_hits': self.disk_hits,
+        }
+
+    def _store(self, key: str, expires_at: float, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires_at, content)
+        self.bytes += len(content)
+        while self.bytes > self.max_bytes and self._entries:
+            old_key, _ = next(iter(self._entries.items()))
+            self._remove(old_key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+
+    # On-disk tier: one file per entry, first line holds the expiry timestamp
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir or '', f'{key}.cache')
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, bytes]]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires_at = float(f.readline())
+                return expires_at, f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, expires_at: float, content: bytes):
+        if not self.disk_dir:
+            return
+        tmp = self._path(key) + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(f'{expires_at}\n'.encode('ascii'))
+                f.write(content)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            pass
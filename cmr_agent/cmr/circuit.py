@@ -1,25 +1,97 @@
 from __future__ import annotations
 import time
-from typing import Callable, Any
+from typing import Any, Dict
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an endpoint whose breaker is open."""
+
 
 class CircuitBreaker:
-    def __init__(self, failure_threshold: int = 5, recovery_time_seconds: int = 30):
+    """Closed/open/half-open breaker for a single endpoint.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``recovery_time_seconds``. It then goes half-open and
+    admits at most ``half_open_max_probes`` concurrent probes: a probe
+    success closes it again, a probe failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, recovery_time_seconds: float = 30, half_open_max_probes: int = 1):
         self.failure_threshold = failure_threshold
         self.recovery_time_seconds = recovery_time_seconds
+        self.half_open_max_probes = max(1, half_open_max_probes)
         self.failures = 0
         self.open_until = 0.0
+        self.state = CLOSED
+        self.probes_in_flight = 0
+        self.trips = 0
+        self.rejected = 0
 
     def allow(self) -> bool:
-        if self.open_until and time.time() < self.open_until:
-            return False
+        if self.state == OPEN:
+            if time.monotonic() < self.open_until:
+                self.rejected += 1
+                return False
+            self.state = HALF_OPEN
+            self.probes_in_flight = 0
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_max_probes:
+                self.rejected += 1
+                return False
+            self.probes_in_flight += 1
         return True
 
     def record_success(self):
         self.failures = 0
         self.open_until = 0.0
+        self.state = CLOSED
+        self.probes_in_flight = 0
 
     def record_failure(self):
         self.failures += 1
-        if self.failures >= self.failure_threshold:
-            self.open_until = time.time() + self.recovery_time_seconds
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self._trip()
+
+    def release(self):
+        """Finish a call that says nothing about endpoint health (e.g. a 400)."""
+        if self.state == HALF_OPEN and self.probes_in_flight > 0:
+            self.probes_in_flight -= 1
+
+    def _trip(self):
+        self.state = OPEN
+        self.open_until = time.monotonic() + self.recovery_time_seconds
+        self.probes_in_flight = 0
+        self.trips += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'trips': self.trips,
+            'rejected': self.rejected,
+        }
+
+
+class CircuitBreakerRegistry:
+    """One breaker per endpoint so a failing endpoint does not block the others."""
+
+    def __init__(self, failure_threshold: int = 5, recovery_time_seconds: float = 30, half_open_max_probes: int = 1):
+        self._config = dict(
+            failure_threshold=failure_threshold,
+            recovery_time_seconds=recovery_time_seconds,
+            half_open_max_probes=half_open_max_probes,
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def for_endpoint(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers[endpoint] = CircuitBreaker(**self._config)
+        return breaker
 
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: b.stats() for name, b in self.breakers.items()}
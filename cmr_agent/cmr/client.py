@@ -1,39 +1,459 @@
+import asyncio
+import json
+import time
 import httpx
-from typing import Any, Dict, Optional
-from tenacity import retry, stop_after_attempt, wait_exponential
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 from cmr_agent.config import settings
-from cmr_agent.cmr.circuit import CircuitBreaker
+from cmr_agent.cmr.circuit import CircuitBreakerRegistry, CircuitOpenError
+from cmr_agent.cmr.cache import ResponseCache, cache_key
+from cmr_agent.cmr.delta import DeltaStore, merge_delta, parse_deleted_ids, snapshot_params
+from cmr_agent.cmr.singleflight import SingleFlight
+from cmr_agent.cmr.limiter import RequestLimiter
+from cmr_agent.cmr.hedging import Hedger
+from cmr_agent.cmr.facets import parse_temporal_facets
+from cmr_agent.metrics import observe_cmr, observe_cmr_retry
+
+SEARCH_PATHS = {
+    'collections': '/search/collections.umm_json',
+    'granules': '/search/granules.umm_json',
+    'variables': '/search/variables.umm_json',
+    # v2 facets are only returned by the JSON (not UMM JSON) format
+    'granule_facets': '/search/granules.json',
+}
+
+# Tombstone searches used by incremental refreshes (variables have none)
+DELETED_PATHS = {
+    'collections': '/search/deleted-collections.json',
+    'granules': '/search/deleted-granules.json',
+}
+
+
+def endpoint_for_path(path: str) -> str:
+    """Map a search path such as ``/search/granules.umm_json`` to ``granules``."""
+    return path.rstrip('/').rsplit('/', 1)[-1].split('.', 1)[0]
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Retry transport errors, timeouts, 408/429 and 5xx; fail fast on the rest."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        code = exc.response.status_code
+        return code >= 500 or code in (408, 429)
+    return isinstance(exc, httpx.TransportError)
+
+# HTTP/2 needs the optional ``h2`` package; fall back to HTTP/1.1 without it
+try:
+    import h2  # type: ignore  # noqa: F401
+    HTTP2_AVAILABLE = True
+except Exception:
+    HTTP2_AVAILABLE = False
+
+
+def build_http_client(base_url: str) -> httpx.AsyncClient:
+    """Create the pooled ``httpx.AsyncClient`` configured from settings."""
+    limits = httpx.Limits(
+        max_connections=settings.cmr_max_connections,
+        max_keepalive_connections=settings.cmr_max_keepalive_connections,
+        keepalive_expiry=settings.cmr_keepalive_expiry_seconds,
+    )
+    return httpx.AsyncClient(
+        base_url=base_url,
+        timeout=settings.cmr_timeout_seconds,
+        limits=limits,
+        http2=bool(settings.cmr_http2 and HTTP2_AVAILABLE),
+    )
+
+
+def build_request_limiter() -> RequestLimiter:
+    return RequestLimiter(
+        initial=settings.cmr_concurrency_initial,
+        min_limit=settings.cmr_concurrency_min,
+        max_limit=settings.cmr_concurrency_max,
+        latency_target=settings.cmr_latency_target_seconds,
+        rate_per_second=settings.cmr_rate_limit_per_second,
+        burst=settings.cmr_rate_limit_burst,
+    )
+
+
+def build_circuit_breakers() -> CircuitBreakerRegistry:
+    return CircuitBreakerRegistry(
+        failure_threshold=settings.cmr_breaker_failure_threshold,
+        recovery_time_seconds=settings.cmr_breaker_recovery_seconds,
+        half_open_max_probes=settings.cmr_breaker_half_open_probes,
+    )
+
+
+def build_response_cache() -> Optional[ResponseCache]:
+    if not settings.cmr_cache_enabled:
+        return None
+    return ResponseCache(
+        max_bytes=settings.cmr_cache_max_bytes,
+        ttls={
+            'collections': settings.cmr_cache_ttl_collections,
+            'granules': settings.cmr_cache_ttl_granules,
+            'variables': settings.cmr_cache_ttl_variables,
+            'granule_facets': settings.cmr_cache_ttl_granules,
+        },
+        disk_dir=settings.cmr_cache_dir,
+    )
+
+
+def _record_retry(retry_state) -> None:
+    path = retry_state.args[1] if len(retry_state.args) > 1 else retry_state.kwargs.get('path', '')
+    observe_cmr_retry(endpoint_for_path(path))
+
 
 class AsyncCMRClient:
-    def __init__(self, base_url: Optional[str] = None):
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        http_client: Optional[httpx.AsyncClient] = None,
+        cache: ResponseCache | bool | None = True,
+    ):
         self.base_url = base_url or settings.cmr_base_url
-        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=30.0)
-        self.circuit = CircuitBreaker()
+        self._client = http_client or build_http_client(self.base_url)
+        self.breakers = build_circuit_breakers()
+        self.hit_probes = 0
+        self.hedger = (
+            Hedger(settings.cmr_hedging_percentile, settings.cmr_hedging_budget)
+            if settings.cmr_hedging_enabled
+            else None
+        )
+        # ``cache=True`` builds the cache from settings, ``False``/``None`` disables it
+        self.cache = build_response_cache() if cache is True else (cache or None)
+        self.singleflight = SingleFlight() if settings.cmr_singleflight_enabled else None
+        self.limiter = build_request_limiter()
+        self.delta = DeltaStore(settings.cmr_delta_dir)
 
     async def close(self):
         await self._client.aclose()
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=0.5, min=0.5, max=3))
-    async def _safe_get(self, path: str, params: dict):
-        if not self.circuit.allow():
-            raise RuntimeError('CMR circuit open; temporarily rejecting requests')
+    async def warmup(self, connections: int = 1) -> int:
+        """Open up to ``connections`` pooled connections with count-only requests; returns how many succeeded.
+
+        Bypasses the cache, limiter and breakers: a failed warmup should not
+        count against the endpoint.
+        """
+        async def probe() -> bool:
+            try:
+                resp = await self._client.get(SEARCH_PATHS['collections'], params={'page_size': 0})
+                return resp.status_code < 500
+            except httpx.HTTPError:
+                return False
+
+        return sum(await asyncio.gather(*(probe() for _ in range(max(1, connections)))))
+
+    def pool_stats(self) -> Dict[str, int]:
+        """Snapshot of the underlying connection pool (open/idle/waiting)."""
+        pool = getattr(getattr(self._client, '_transport', None), '_pool', None)
+        if pool is None:
+            return {}
         try:
-            resp = await self._client.get(path, params=params)
+            connections = list(pool.connections)
+            idle = sum(1 for c in connections if c.is_idle())
+            waiting = sum(1 for r in getattr(pool, '_requests', []) if r.is_queued())
+        except Exception:
+            return {}
+        return {
+            'open': len(connections),
+            'idle': idle,
+            'active': len(connections) - idle,
+            'waiting': waiting,
+            'max_connections': settings.cmr_max_connections,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'pool': self.pool_stats(),
+            'cache': self.cache.stats() if self.cache is not None else {},
+            'singleflight': self.singleflight.stats() if self.singleflight is not None else {},
+            'limiter': self.limiter.stats(),
+            'breakers': self.breakers.stats(),
+            'hedging': self.hedger.stats() if self.hedger is not None else {},
+            'hit_probes': self.hit_probes,
+            'delta': self.delta.stats(),
+        }
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=0.5, min=0.5, max=3),
+        retry=retry_if_exception(is_retryable),
+        before_sleep=_record_retry,
+        reraise=True,
+    )
+    async def _safe_get(self, path: str, params: dict, headers: Optional[dict] = None, form: bool = False):
+        endpoint = endpoint_for_path(path)
+        breaker = self.breakers.for_endpoint(endpoint)
+        # Open circuits raise a non-retryable error, so they fail without backoff sleeps
+        if not breaker.allow():
+            raise CircuitOpenError(f'CMR circuit open for {endpoint}; temporarily rejecting requests')
+        try:
+            await self.limiter.acquire(endpoint)
+        except BaseException:
+            breaker.release()
+            raise
+        started = time.monotonic()
+        status = None
+        nbytes = 0
+        try:
+            if form:
+                # POST form search: same semantics, no URL length limit
+                resp = await self._client.post(path, data=params, headers=headers)
+            else:
+                resp = await self._client.get(path, params=params, headers=headers)
+            status = resp.status_code
+            nbytes = len(resp.content)
             resp.raise_for_status()
-            self.circuit.record_success()
+            breaker.record_success()
             return resp
-        except Exception:
-            self.circuit.record_failure()
+        except Exception as exc:
+            # Client errors and throttling say nothing about endpoint health
+            if is_retryable(exc) and status != 429:
+                breaker.record_failure()
+            else:
+                breaker.release()
+            raise
+        except BaseException:
+            breaker.release()
             raise
+        finally:
+            elapsed = time.monotonic() - started
+            self.limiter.release(endpoint, elapsed, status)
+            observe_cmr(endpoint, status if status is not None else 'error', elapsed, nbytes)
+
+    async def _get(self, path: str, params: dict, headers: Optional[dict] = None) -> httpx.Response:
+        # Long queries (e.g. many repeated concept_id values) switch to a POST form search
+        form = len(str(httpx.QueryParams(params))) > settings.cmr_max_query_length
+        if self.hedger is None:
+            return await self._safe_get(path, params=params, headers=headers, form=form)
+        return await self.hedger.run(
+            endpoint_for_path(path), lambda: self._safe_get(path, params=params, headers=headers, form=form)
+        )
+
+    async def _fetch(self, endpoint: str, params: Dict[str, Any]) -> bytes:
+        resp = await self._get(SEARCH_PATHS[endpoint], params=params)
+        if self.cache is not None:
+            self.cache.set(endpoint, params, resp.content)
+        return resp.content
+
+    async def _search(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self.cache is not None:
+            cached = self.cache.get(endpoint, params)
+            if cached is not None:
+                return json.loads(cached)
+        if self.singleflight is not None:
+            # Concurrent identical searches share one upstream GET; each caller
+            # decodes its own copy so results can be mutated independently
+            content = await self.singleflight.do(
+                cache_key(endpoint, params), lambda: self._fetch(endpoint, params)
+            )
+        else:
+            content = await self._fetch(endpoint, params)
+        return json.loads(content)
 
     async def search_collections(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        resp = await self._safe_get('/search/collections.umm_json', params=params)
-        return resp.json()
+        return await self._search('collections', params)
 
     async def search_granules(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        resp = await self._safe_get('/search/granules.umm_json', params=params)
-        return resp.json()
+        return await self._search('granules', params)
 
     async def search_variables(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        resp = await self._safe_get('/search/variables.umm_json', params=params)
-        return resp.json()
+        return await self._search('variables', params)
+
+    async def lookup(self, endpoint: str, concept_ids: list) -> list:
+        """Full UMM records by concept id, e.g. to expand compact records on demand."""
+        items: list = []
+        chunk = max(1, settings.cmr_concept_id_chunk)
+        ids = list(dict.fromkeys(concept_ids))
+        pages = await asyncio.gather(*(
+            self._search(endpoint, {'concept_id': ids[i:i + chunk], 'page_size': len(ids[i:i + chunk])})
+            for i in range(0, len(ids), chunk)
+        ))
+        for page in pages:
+            items.extend(page.get('items') or [])
+        return items
+
+    async def count_hits(self, endpoint: str, params: Dict[str, Any]) -> int:
+        """Return the total hit count for a search without downloading records.
+
+        Sends the search with ``page_size=0`` and reads the ``CMR-Hits`` header.
+        """
+        probe = {k: v for k, v in params.items() if k not in ('page_num', 'offset')}
+        probe['page_size'] = 0
+
+        async def fetch() -> int:
+            self.hit_probes += 1
+            resp = await self._get(SEARCH_PATHS[endpoint], params=probe)
+            hits = resp.headers.get('CMR-Hits')
+            return int(hits) if hits is not None else int(resp.json().get('hits') or 0)
+
+        if self.singleflight is not None:
+            return await self.singleflight.do('hits:' + cache_key(endpoint, probe), fetch)
+        return await fetch()
+
+    async def temporal_facets(
+        self, params: Dict[str, Any], year: Optional[str] = None, month: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Granule counts per year (or per month/day within ``year``/``month``) from v2 facets."""
+        query = {k: v for k, v in params.items() if k not in ('page_num', 'offset')}
+        query['include_facets'] = 'v2'
+        query['page_size'] = 0
+        if year is not None:
+            query['temporal_facet[0][year]'] = str(year)
+        if month is not None:
+            query['temporal_facet[0][month]'] = str(int(month))
+        body = await self._search('granule_facets', query)
+        return parse_temporal_facets(body)
+
+    async def deleted_since(self, endpoint: str, params: Dict[str, Any], since: str) -> list:
+        """Concept ids deleted since ``since`` (ISO timestamp) within the query's provider/collection."""
+        query: Dict[str, Any] = {'revision_date': f'{since},'}
+        for key in ('provider', 'collection_concept_id') if endpoint == 'granules' else ('provider',):
+            if params.get(key):
+                query[key] = params[key]
+        resp = await self._get(DELETED_PATHS[endpoint], params=query)
+        return parse_deleted_ids(resp.json())
+
+    async def refresh(self, endpoint: str, params: Dict[str, Any], max_items: Optional[int] = None) -> Dict[str, Any]:
+        """Return the saved result set for a query, fetching only what changed since the last sync.
+
+        The first call pages through the results (up to ``max_items``) and
+        stores them. Later calls search with ``updated_since`` set to the last
+        sync time, look up deletions since then, and merge both into the
+        stored records; the hit count comes from a count-only probe. A few
+        small requests replace a full re-download.
+        """
+        # Sync from slightly before the request started so clock skew cannot drop updates
+        started = datetime.now(timezone.utc) - timedelta(seconds=settings.cmr_delta_overlap_seconds)
+        params = snapshot_params(params)
+        snapshot = self.delta.get(endpoint, params)
+        requests = 0
+        if snapshot is None:
+            items: list = []
+            hits = None
+            async for page in self.iter_pages(endpoint, params, max_items=max_items):
+                requests += 1
+                items.extend(page.get('items') or [])
+                hits = page.get('hits')
+            info: Dict[str, Any] = {'mode': 'full', 'since': None, 'updated': len(items), 'deleted': 0}
+            self.delta.full_syncs += 1
+        else:
+            since = snapshot['synced_at']
+            updated: list = []
+            async for page in self.iter_pages(endpoint, {**params, 'updated_since': since}):
+                requests += 1
+                updated.extend(page.get('items') or [])
+            deleted = await self.deleted_since(endpoint, params, since) if endpoint in DELETED_PATHS else []
+            hits = await self.count_hits(endpoint, params)
+            requests += 1 + (endpoint in DELETED_PATHS)
+            items = merge_delta(snapshot['items'], updated, deleted)
+            info = {'mode': 'delta', 'since': since, 'updated': len(updated), 'deleted': len(deleted)}
+            self.delta.delta_syncs += 1
+            self.delta.updated += len(updated)
+            self.delta.deleted += len(deleted)
+        synced_at = started.strftime('%Y-%m-%dT%H:%M:%SZ')
+        self.delta.put(endpoint, params, {'synced_at': synced_at, 'hits': hits, 'items': items})
+        return {'hits': hits, 'items': items, 'refresh': {**info, 'synced_at': synced_at, 'requests': requests}}
+
+    async def _fetch_page(
+        self, endpoint: str, params: Dict[str, Any], search_after: Optional[str] = None
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        headers = {'CMR-Search-After': search_after} if search_after else None
+        resp = await self._get(SEARCH_PATHS[endpoint], params=params, headers=headers)
+        body = resp.json()
+        if body.get('hits') is None and resp.headers.get('CMR-Hits'):
+            body['hits'] = int(resp.headers['CMR-Hits'])
+        return body, resp.headers.get('CMR-Search-After')
+
+    async def iter_pages(
+        self,
+        endpoint: str,
+        params: Dict[str, Any],
+        max_items: Optional[int] = None,
+        page_size: Optional[int] = None,
+        prefetch: Optional[int] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Yield result pages using CMR's ``CMR-Search-After`` header.
+
+        A background task fetches up to ``prefetch`` pages ahead of the
+        consumer through a bounded queue, so the next page downloads while the
+        current one is processed without holding the whole result set. Each
+        yielded page is the CMR body plus a ``search_after`` token that is
+        empty once the results are exhausted.
+        """
+        size = int(page_size or params.get('page_size') or settings.cmr_page_size)
+        if max_items is not None:
+            size = max(1, min(size, max_items))
+        page_params = {k: v for k, v in params.items() if k not in ('page_num', 'offset')}
+        page_params['page_size'] = size
+        depth = prefetch if prefetch is not None else settings.cmr_prefetch_pages
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, depth))
+        done = object()
+
+        async def produce():
+            fetched = 0
+            token: Optional[str] = None
+            try:
+                while True:
+                    body, token = await self._fetch_page(endpoint, page_params, token)
+                    raw_items = body.get('items') or []
+                    items = raw_items if max_items is None else raw_items[: max_items - fetched]
+                    fetched += len(items)
+                    hits = body.get('hits')
+                    exhausted = not token or len(raw_items) < size or (hits is not None and fetched >= hits)
+                    await queue.put({**body, 'items': items, 'search_after': '' if exhausted else token})
+                    if exhausted or (max_items is not None and fetched >= max_items):
+                        break
+            except Exception as exc:
+                await queue.put(exc)
+                return
+            await queue.put(done)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                page = await queue.get()
+                if page is done:
+                    break
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+        finally:
+            producer.cancel()
+
+    async def _iter_items(self, endpoint: str, params: Dict[str, Any], max_items: Optional[int]) -> AsyncIterator[Dict[str, Any]]:
+        async for page in self.iter_pages(endpoint, params, max_items=max_items):
+            for item in page.get('items', []):
+                yield item
+
+    def iter_collections(self, params: Dict[str, Any], max_items: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        return self._iter_items('collections', params, max_items)
+
+    def iter_granules(self, params: Dict[str, Any], max_items: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        return self._iter_items('granules', params, max_items)
+
+    def iter_variables(self, params: Dict[str, Any], max_items: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+        return self._iter_items('variables', params, max_items)
+
+
+# Process-wide pooled client, opened and closed by the server lifespan
+_shared_client: Optional[AsyncCMRClient] = None
+
+
+async def open_shared_client(base_url: Optional[str] = None) -> AsyncCMRClient:
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = AsyncCMRClient(base_url)
+    return _shared_client
+
+
+def get_shared_client() -> Optional[AsyncCMRClient]:
+    return _shared_client
+
+
+async def close_shared_client():
+    global _shared_client
+    client, _shared_client = _shared_client, None
+    if client is not None:
+        await client.close()
@@ -0,0 +1,116 @@
+from __future__ import annotations
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from cmr_agent.cmr.cache import cache_key
+
+# Params that select a page rather than the result set of a saved query
+_PAGING_PARAMS = ('page_num', 'offset', 'updated_since', 'revision_date')
+
+
+def snapshot_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in params.items() if k not in _PAGING_PARAMS}
+
+
+def concept_id(item: Dict[str, Any]) -> Optional[str]:
+    return (item.get('meta') or {}).get('concept-id') or item.get('concept-id') or item.get('id')
+
+
+def parse_deleted_ids(body: Any) -> List[str]:
+    """Concept ids from a ``deleted-collections``/``deleted-granules`` JSON response.
+
+    Deleted granules come back as a plain list, deleted collections as an
+    Atom-style ``feed.entry`` list.
+    """
+    if isinstance(body, dict):
+        body = (body.get('feed') or {}).get('entry') or body.get('items') or []
+    ids: List[str] = []
+    for entry in body or []:
+        if isinstance(entry, dict):
+            cid = concept_id(entry)
+            if cid:
+                ids.append(cid)
+    return ids
+
+
+def merge_delta(items: List[Dict[str, Any]], updated: List[Dict[str, Any]], deleted: List[str]) -> List[Dict[str, Any]]:
+    """Replace updated records in place, append new ones and drop deleted ids."""
+    gone = set(deleted)
+    fresh = {concept_id(u): u for u in updated if concept_id(u)}
+    merged: List[Dict[str, Any]] = []
+    for item in items:
+        cid = concept_id(item)
+        if cid in gone:
+            continue
+        merged.append(fresh.pop(cid, item))
+    merged.extend(u for cid, u in fresh.items() if cid not in gone)
+    return merged
+
+
+class DeltaStore:
+    """Last synced result set per saved query, for incremental refreshes.
+
+    Snapshots are keyed by the normalized endpoint + params and hold the sync
+    time, hit count and records. When ``disk_dir`` is set each snapshot is
+    also written there as JSON so refreshes survive restarts.
+    """
+
+    def __init__(self, disk_dir: Optional[str] = None):
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        self.full_syncs = 0
+        self.delta_syncs = 0
+        self.updated = 0
+        self.deleted = 0
+
+    def get(self, endpoint: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = cache_key(endpoint, snapshot_params(params))
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            snapshot = self._read_disk(key)
+            if snapshot is not None:
+                self._snapshots[key] = snapshot
+        return snapshot
+
+    def put(self, endpoint: str, params: Dict[str, Any], snapshot: Dict[str, Any]):
+        key = cache_key(endpoint, snapshot_params(params))
+        self._snapshots[key] = snapshot
+        self._write_disk(key, snapshot)
+
+    def clear(self):
+        self._snapshots.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queries': len(self._snapshots),
+            'full_syncs': self.full_syncs,
+            'delta_syncs': self.delta_syncs,
+            'updated': self.updated,
+            'deleted': self.deleted,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir or '', f'{key}.json')
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, snapshot: Dict[str, Any]):
+        if not self.disk_dir:
+            return
+        tmp = self._path(key) + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, self._path(key))
+        except OSError:
+            pass
@@ -0,0 +1,222 @@
+"""Temporal coverage histograms built from CMR granule facets.
+
+Instead of downloading granule records, coverage is derived from per-period
+granule counts: one v2 facet request returns the counts per year, and one
+request per year (or month) drills down to months (or days). When facets are
+unavailable, the same counts are obtained with parallel ``page_size=0`` hit
+probes per period.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+RESOLUTIONS = ('year', 'month', 'day')
+_PERIOD_LEVELS = ('Year', 'Month', 'Day', 'Temporal')
+
+
+def parse_temporal_facets(body: Dict[str, Any]) -> Dict[str, int]:
+    """Flatten a v2 ``Temporal`` facet tree into ``{'2020': n, '2020-01': n, ...}``."""
+    counts: Dict[str, int] = {}
+
+    def walk(node: Dict[str, Any], parts: List[str]):
+        for child in node.get('children') or []:
+            title = str(child.get('title', ''))
+            if title.isdigit():
+                key_parts = parts + [title.zfill(2) if parts else title]
+                if child.get('count') is not None:
+                    counts['-'.join(key_parts)] = int(child['count'])
+                walk(child, key_parts)
+            elif title in _PERIOD_LEVELS:
+                walk(child, parts)
+
+    facets = (body.get('feed') or {}).get('facets') or {}
+    for group in facets.get('children') or []:
+        if group.get('title') == 'Temporal':
+            walk(group, [])
+    return counts
+
+
+def period_bounds(period: str) -> Tuple[date, date]:
+    """Return ``[start, end)`` dates for a ``YYYY``, ``YYYY-MM`` or ``YYYY-MM-DD`` period."""
+    parts = [int(p) for p in period.split('-')]
+    if len(parts) == 1:
+        return date(parts[0], 1, 1), date(parts[0] + 1, 1, 1)
+    if len(parts) == 2:
+        y, m = parts
+        return date(y, m, 1), date(y + (m == 12), m % 12 + 1, 1)
+    start = date(*parts)
+    return start, start + timedelta(days=1)
+
+
+def child_periods(period: str) -> List[str]:
+    parts = [int(p) for p in period.split('-')]
+    if len(parts) == 1:
+        return [f'{parts[0]:04d}-{m:02d}' for m in range(1, 13)]
+    y, m = parts[:2]
+    return [f'{y:04d}-{m:02d}-{d:02d}' for d in range(1, calendar.monthrange(y, m)[1] + 1)]
+
+
+def periods_between(start: date, end: date, resolution: str) -> List[str]:
+    """All periods at ``resolution`` overlapping the inclusive ``[start, end]`` range."""
+    years = [f'{y:04d}' for y in range(start.year, end.year + 1)]
+    periods = years
+    for _ in range(RESOLUTIONS.index(resolution)):
+        periods = [c for p in periods for c in child_periods(p)]
+    return [p for p in periods if period_bounds(p)[1] > start and period_bounds(p)[0] <= end]
+
+
+def rollup(counts: Dict[str, int], resolution: str) -> Dict[str, int]:
+    """Aggregate same-level period counts up to a coarser ``resolution``."""
+    width = {'year': 4, 'month': 7, 'day': 10}[resolution]
+    out: Dict[str, int] = {}
+    for period, n in counts.items():
+        if len(period) >= width:
+            key = period[:width]
+            out[key] = out.get(key, 0) + n
+    return out
+
+
+def _parse_day(value: Optional[str]) -> Optional[date]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).date()
+    except ValueError:
+        return None
+
+
+def summarize(counts: Dict[str, int], resolution: str, window: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+    """Build the histogram/gap summary from the period counts at ``resolution``."""
+    width = {'year': 4, 'month': 7, 'day': 10}[resolution]
+    level = {p: n for p, n in counts.items() if len(p) == width}
+    nonzero = sorted(p for p, n in level.items() if n)
+    summary: Dict[str, Any] = {
+        'resolution': resolution,
+        'counts': {},
+        'total': sum(level.values()),
+        'first': None,
+        'last': None,
+        'covered_periods': 0,
+        'total_periods': 0,
+        'coverage_pct': 0.0,
+        'gaps': [],
+    }
+    if not nonzero:
+        return summary
+    start = _parse_day(window[0]) if window else None
+    end = _parse_day(window[1]) if window else None
+    start = start or period_bounds(nonzero[0])[0]
+    end = end or period_bounds(nonzero[-1])[1] - timedelta(days=1)
+    periods = periods_between(start, end, resolution)
+    summary['counts'] = {p: level.get(p, 0) for p in periods}
+    summary['first'] = period_bounds(nonzero[0])[0].isoformat()
+    summary['last'] = (period_bounds(nonzero[-1])[1] - timedelta(days=1)).isoformat()
+    covered = sum(1 for p in periods if level.get(p))
+    summary['covered_periods'] = covered
+    summary['total_periods'] = len(periods)
+    summary['coverage_pct'] = round(100.0 * covered / len(periods), 1) if periods else 0.0
+
+    gap_start: Optional[date] = None
+    for p in periods:
+        p_start, p_end = period_bounds(p)
+        if not level.get(p):
+            gap_start = gap_start or max(p_start, start)
+        elif gap_start is not None:
+            summary['gaps'].append({
+                'gap_start': gap_start.isoformat(),
+                'gap_end': p_start.isoformat(),
+                'gap_days': str((p_start - gap_start).days),
+            })
+            gap_start = None
+    if gap_start is not None:
+        gap_end = end + timedelta(days=1)
+        summary['gaps'].append({
+            'gap_start': gap_start.isoformat(),
+            'gap_end': gap_end.isoformat(),
+            'gap_days': str((gap_end - gap_start).days),
+        })
+    return summary
+
+
+def merge_histograms(histograms: List[Dict[str, Any]], window: Optional[Tuple[str, str]] = None) -> Dict[str, Any]:
+    """Sum several histograms at the coarsest resolution they share."""
+    usable = [h for h in histograms if h and h.get('total')]
+    if not usable:
+        return summarize({}, 'year', window)
+    resolution = min((h['resolution'] for h in usable), key=RESOLUTIONS.index)
+    counts: Dict[str, int] = {}
+    for h in usable:
+        for period, n in rollup(h['counts'], resolution).items():
+            counts[period] = counts.get(period, 0) + n
+    merged = summarize(counts, resolution, window)
+    merged['requests'] = sum(h.get('requests', 0) for h in usable)
+    merged['sources'] = sorted({h.get('source') for h in usable if h.get('source')})
+    return merged
+
+
+def _period_temporal(period: str) -> str:
+    start, end = period_bounds(period)
+    return f'{start.isoformat()}T00:00:00Z,{(end - timedelta(days=1)).isoformat()}T23:59:59Z'
+
+
+async def _child_counts(client: Any, params: Dict[str, Any], parent: Optional[str], candidates: List[str]) -> Tuple[Dict[str, int], int, str]:
+    """Counts one level below ``parent`` via facets, falling back to hit probes."""
+    parts = parent.split('-') if parent else []
+    facets = await client.temporal_facets(
+        params, year=parts[0] if parts else None, month=parts[1] if len(parts) > 1 else None
+    )
+    depth = len(parts)
+    counts = {
+        p: n for p, n in facets.items()
+        if p.count('-') == depth and (parent is None or p.startswith(parent + '-'))
+    }
+    if counts or not candidates:
+        return counts, 1, 'facets'
+    hits = await asyncio.gather(
+        *(client.count_hits('granules', {**params, 'temporal': _period_temporal(p)}) for p in candidates)
+    )
+    return {p: h for p, h in zip(candidates, hits) if h}, 1 + len(candidates), 'counts'
+
+
+async def temporal_histogram(
+    client: Any,
+    params: Dict[str, Any],
+    window: Optional[Tuple[str, str]] = None,
+    resolution: str = 'month',
+    max_requests: int = 32,
+) -> Dict[str, Any]:
+    """Year → month → day drill-down of granule counts for one granule query.
+
+    Each level's requests run in parallel. Only periods with granules are
+    drilled, and the drill stops at the coarser level if it would exceed
+    ``max_requests``.
+    """
+    start = _parse_day(window[0]) if window else None
+    end = _parse_day(window[1]) if window else None
+    year_candidates = periods_between(start, end, 'year') if start and end else []
+    counts, requests, source = await _child_counts(client, params, None, year_candidates)
+    achieved = 'year'
+    parents = sorted(p for p, n in counts.items() if n)
+    for level in RESOLUTIONS[1:RESOLUTIONS.index(resolution) + 1]:
+        if not parents or requests + len(parents) > max_requests:
+            break
+        results = await asyncio.gather(
+            *(_child_counts(client, params, p, child_periods(p)) for p in parents)
+        )
+        children: Dict[str, int] = {}
+        for child_counts, n, child_source in results:
+            children.update(child_counts)
+            requests += n
+            if child_source == 'counts':
+                source = 'counts'
+        counts.update(children)
+        achieved = level
+        parents = sorted(p for p, n in children.items() if n)
+    summary = summarize(counts, achieved, window)
+    summary['requests'] = requests
+    summary['source'] = source
+    return summary
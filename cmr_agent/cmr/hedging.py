@@ -0,0 +1,91 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies per endpoint."""
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def record(self, endpoint: str, seconds: float):
+        samples = self._samples.get(endpoint)
+        if samples is None:
+            samples = self._samples[endpoint] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, endpoint: str, q: float) -> Optional[float]:
+        samples = self._samples.get(endpoint)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """Send a duplicate request when the first one is slower than usual.
+
+    If a call has not finished by the tracked ``percentile`` latency of its
+    endpoint, a second identical call is started; whichever succeeds first is
+    returned and the other is cancelled. Hedges are capped at ``budget`` of
+    all requests so the extra load on CMR stays bounded.
+    """
+
+    def __init__(self, percentile: float = 0.95, budget: float = 0.05, tracker: Optional[LatencyTracker] = None):
+        self.percentile = percentile
+        self.budget = budget
+        self.tracker = tracker or LatencyTracker()
+        self.requests = 0
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def _budget_allows(self) -> bool:
+        return self.hedges_sent + 1 <= self.budget * self.requests
+
+    async def run(self, endpoint: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.requests += 1
+
+        async def timed() -> Any:
+            started = time.monotonic()
+            result = await fn()
+            self.tracker.record(endpoint, time.monotonic() - started)
+            return result
+
+        primary = asyncio.ensure_future(timed())
+        delay = self.tracker.percentile(endpoint, self.percentile)
+        if delay is None or not self._budget_allows():
+            return await primary
+        hedge: Optional[asyncio.Future] = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done or not self._budget_allows():
+                return await primary
+            self.hedges_sent += 1
+            hedge = asyncio.ensure_future(timed())
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedges_won += 1
+                        return task.result()
+            # Both attempts failed; surface the primary's error
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'hedges_sent': self.hedges_sent,
+            'hedges_won': self.hedges_won,
+            'budget': self.budget,
+        }
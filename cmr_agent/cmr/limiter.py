@@ -0,0 +1,167 @@
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+THROTTLE_STATUSES = (429, 503)
+
+
+class TokenBucket:
+    """Token-bucket rate cap: ``rate`` requests/second with ``burst`` headroom."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """Take one token, sleeping until one is available. Returns seconds waited."""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit for one endpoint.
+
+    The limit grows by roughly one slot per window of fast, successful calls
+    and is cut multiplicatively when CMR answers 429/503 or latency exceeds
+    ``latency_target``. Decreases are rate limited to one per cooldown so a
+    burst of concurrent failures does not collapse the limit to the floor.
+    """
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        latency_target: float = 2.0,
+        backoff: float = 0.5,
+        cooldown: Optional[float] = None,
+    ):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.cooldown = latency_target if cooldown is None else cooldown
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+        self.acquired = 0
+        self.throttled = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    async def acquire(self) -> float:
+        started = time.monotonic()
+        while self.inflight >= int(self.limit):
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                self._wake()
+                raise
+        self.inflight += 1
+        self.acquired += 1
+        waited = time.monotonic() - started
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+        return waited
+
+    def release(self, latency: float, status: Optional[int] = None):
+        self.inflight -= 1
+        if status in THROTTLE_STATUSES:
+            self.throttled += 1
+            self._decrease()
+        elif latency > self.latency_target:
+            self._decrease()
+        elif status is not None and status < 400:
+            self.limit = min(self.max_limit, self.limit + 1.0 / max(self.limit, 1.0))
+        self._wake()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def _wake(self):
+        free = int(self.limit) - self.inflight
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': round(self.limit, 2),
+            'inflight': self.inflight,
+            'queued': len(self._waiters),
+            'acquired': self.acquired,
+            'throttled': self.throttled,
+            'queue_wait_ms_total': round(self.wait_seconds_total * 1000, 1),
+            'queue_wait_ms_max': round(self.wait_seconds_max * 1000, 1),
+        }
+
+
+class RequestLimiter:
+    """Per-endpoint adaptive limiters sharing one token bucket."""
+
+    def __init__(
+        self,
+        initial: int = 8,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        latency_target: float = 2.0,
+        rate_per_second: float = 0.0,
+        burst: int = 10,
+    ):
+        self._config = dict(initial=initial, min_limit=min_limit, max_limit=max_limit, latency_target=latency_target)
+        self.endpoints: Dict[str, AdaptiveLimiter] = {}
+        self.bucket = TokenBucket(rate_per_second, burst) if rate_per_second > 0 else None
+        self.rate_wait_seconds_total = 0.0
+
+    def for_endpoint(self, endpoint: str) -> AdaptiveLimiter:
+        limiter = self.endpoints.get(endpoint)
+        if limiter is None:
+            limiter = self.endpoints[endpoint] = AdaptiveLimiter(**self._config)
+        return limiter
+
+    async def acquire(self, endpoint: str) -> float:
+        waited = await self.for_endpoint(endpoint).acquire()
+        if self.bucket is not None:
+            try:
+                rate_wait = await self.bucket.acquire()
+            except BaseException:
+                self.for_endpoint(endpoint).release(0.0)
+                raise
+            self.rate_wait_seconds_total += rate_wait
+            waited += rate_wait
+        return waited
+
+    def release(self, endpoint: str, latency: float, status: Optional[int] = None):
+        self.for_endpoint(endpoint).release(latency, status)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'endpoints': {name: lim.stats() for name, lim in self.endpoints.items()},
+            'rate_limit_wait_ms_total': round(self.rate_wait_seconds_total * 1000, 1),
+        }
@@ -0,0 +1,204 @@
+from __future__ import annotations
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from cmr_agent.config import settings
+
+RESULT_KINDS = ('collections', 'granules', 'variables')
+
+
+def _encode(payload: Any) -> bytes:
+    return json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class ResultStore:
+    """Raw CMR result pages kept outside graph state, addressed by small handles.
+
+    Payloads stay in memory up to ``max_bytes``; beyond that the oldest are
+    spilled to one JSON file each under ``spill_dir`` (a temporary directory
+    when unset). Entries expire ``ttl`` seconds after they are stored, so
+    clients can still fetch them by handle for a while after the request.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, ttl: float = 900.0, spill_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.spill_dir = spill_dir
+        self._own_dir = False
+        self._memory: OrderedDict[str, Tuple[float, Any, int]] = OrderedDict()
+        self._disk: Dict[str, Tuple[float, str, int]] = {}
+        self._ids = itertools.count(1)
+        self.bytes = 0
+        self.spilled = 0
+        self.disk_reads = 0
+        self.expired = 0
+
+    def put(self, request_id: str, kind: str, payload: Any) -> str:
+        """Store ``payload`` and return its handle (``<request_id>-<n>-<kind>``)."""
+        self._purge()
+        handle = f'{request_id}-{next(self._ids)}-{kind}'
+        content = _encode(payload)
+        expires_at = time.time() + self.ttl
+        if len(content) > self.max_bytes:
+            self._spill(handle, expires_at, content)
+            return handle
+        self._memory[handle] = (expires_at, payload, len(content))
+        self.bytes += len(content)
+        while self.bytes > self.max_bytes and len(self._memory) > 1:
+            old, (old_expires, old_payload, size) = self._memory.popitem(last=False)
+            self.bytes -= size
+            self._spill(old, old_expires, _encode(old_payload))
+        return handle
+
+    def get(self, handle: str) -> Any:
+        """Payload for ``handle``, or ``None`` if it is unknown or expired."""
+        entry = self._memory.get(handle)
+        if entry is not None:
+            if entry[0] > time.time():
+                return entry[1]
+            self._drop(handle)
+            return None
+        content = self._read(handle)
+        return json.loads(content) if content is not None else None
+
+    def get_bytes(self, handle: str) -> Optional[bytes]:
+        """Payload for ``handle`` as JSON bytes, for serving to clients."""
+        entry = self._memory.get(handle)
+        if entry is not None:
+            return _encode(entry[1]) if entry[0] > time.time() else None
+        return self._read(handle)
+
+    def release(self, request_id: str):
+        """Drop every payload stored for ``request_id``."""
+        prefix = f'{request_id}-'
+        for handle in [h for h in [*self._memory, *self._disk] if h.startswith(prefix)]:
+            self._drop(handle)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._memory),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'spilled_entries': len(self._disk),
+            'spilled': self.spilled,
+            'disk_reads': self.disk_reads,
+            'expired': self.expired,
+        }
+
+    def close(self):
+        for handle in list(self._disk):
+            self._drop(handle)
+        self._memory.clear()
+        self.bytes = 0
+        if self._own_dir and self.spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            self.spill_dir = None
+            self._own_dir = False
+
+    def _purge(self):
+        now = time.time()
+        for handle in [h for h, e in self._memory.items() if e[0] <= now] + [h for h, e in self._disk.items() if e[0] <= now]:
+            self._drop(handle)
+            self.expired += 1
+
+    def _drop(self, handle: str):
+        entry = self._memory.pop(handle, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+        spilled = self._disk.pop(handle, None)
+        if spilled is not None:
+            try:
+                os.remove(spilled[1])
+            except OSError:
+                pass
+
+    # Disk tier: one JSON file per spilled payload
+    def _spill(self, handle: str, expires_at: float, content: bytes):
+        if not self.spill_dir:
+            self.spill_dir = tempfile.mkdtemp(prefix='cmr-results-')
+            self._own_dir = True
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f'{handle}.json')
+        with open(path, 'wb') as f:
+            f.write(content)
+        self._disk[handle] = (expires_at, path, len(content))
+        self.spilled += 1
+
+    def _read(self, handle: str) -> Optional[bytes]:
+        entry = self._disk.get(handle)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            self._drop(handle)
+            return None
+        try:
+            with open(entry[1], 'rb') as f:
+                content = f.read()
+        except OSError:
+            return None
+        self.disk_reads += 1
+        return content
+
+
+def store_results(store: ResultStore, request_id: str, cmr_results: dict) -> dict:
+    """Copy of ``cmr_results`` with each item list moved into ``store`` and replaced by a handle."""
+    if not isinstance(cmr_results, dict):
+        return cmr_results
+    searches = []
+    for search in cmr_results.get('searches') or []:
+        search = dict(search)
+        for kind in RESULT_KINDS:
+            block = search.get(kind)
+            if isinstance(block, dict) and 'items' in block:
+                items = block['items'] or []
+                rest = {k: v for k, v in block.items() if k != 'items'}
+                search[kind] = {**rest, 'handle': store.put(request_id, kind, items), 'count': len(items)}
+        searches.append(search)
+    return {**cmr_results, 'searches': searches}
+
+
+def resolve_results(cmr_results: dict, store: Optional[ResultStore] = None) -> dict:
+    """Copy of ``cmr_results`` with handles replaced by their items again; expired handles give ``[]``."""
+    if not isinstance(cmr_results, dict):
+        return cmr_results
+    searches = cmr_results.get('searches') or []
+    if not any(isinstance(s.get(kind), dict) and 'handle' in s[kind] for s in searches for kind in RESULT_KINDS):
+        return cmr_results
+    store = store or get_result_store()
+    resolved = []
+    for search in searches:
+        search = dict(search)
+        for kind in RESULT_KINDS:
+            block = search.get(kind)
+            if isinstance(block, dict) and 'handle' in block and 'items' not in block:
+                search[kind] = {**block, 'items': store.get(block['handle']) or []}
+        resolved.append(search)
+    return {**cmr_results, 'searches': resolved}
+
+
+# Process-wide store; handles in graph state and API responses point into it
+_store: Optional[ResultStore] = None
+
+
+def get_result_store() -> ResultStore:
+    global _store
+    if _store is None:
+        _store = ResultStore(
+            max_bytes=settings.result_store_max_bytes,
+            ttl=settings.result_store_ttl_seconds,
+            spill_dir=settings.result_store_dir,
+        )
+    return _store
+
+
+def close_result_store():
+    global _store
+    store, _store = _store, None
+    if store is not None:
+        store.close()
@@ -0,0 +1,144 @@
+"""Stratified temporal sampling of granules for coverage estimation.
+
+The requested window is split into equal-length strata. One small page of
+granules is fetched per stratum, and the page's hit count gives the
+stratum's total. The fraction of each stratum covered by granules is then
+estimated as ``hits * mean sampled duration / stratum length``. The sample
+variance of the durations gives a 95% confidence interval.
+"""
+
+from __future__ import annotations
+
+import math
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+Z_95 = 1.96
+
+
+def _parse(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _fmt(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def make_strata(window: Tuple[str, str], k: int) -> List[Tuple[str, str]]:
+    """Split ``window`` into ``k`` contiguous, equal-length ``(start, end)`` strata."""
+    start, end = _parse(window[0]), _parse(window[1])
+    if start is None or end is None or end <= start or k < 1:
+        return []
+    step = (end - start) / k
+    bounds = [start + step * i for i in range(k)] + [end]
+    return [(_fmt(bounds[i]), _fmt(bounds[i + 1])) for i in range(k)]
+
+
+def granule_interval(granule: Dict[str, Any]) -> Optional[Tuple[datetime, datetime]]:
+    te = ((granule.get('umm') or {}).get('TemporalExtent') or {}).get('RangeDateTime') or {}
+    begin, end = _parse(te.get('BeginningDateTime')), _parse(te.get('EndingDateTime'))
+    if begin is None or end is None or end < begin:
+        return None
+    return begin, end
+
+
+def estimate_stratum(stratum: Tuple[str, str], hits: int, granules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Coverage fraction of one stratum, with its standard error."""
+    s_start, s_end = _parse(stratum[0]), _parse(stratum[1])
+    length = (s_end - s_start).total_seconds()
+    durations = []
+    for g in granules:
+        interval = granule_interval(g)
+        if interval is None:
+            continue
+        b, e = max(interval[0], s_start), min(interval[1], s_end)
+        durations.append(max(0.0, (e - b).total_seconds()))
+    entry: Dict[str, Any] = {
+        'start': stratum[0],
+        'end': stratum[1],
+        'hits': hits,
+        'sampled': len(durations),
+        'coverage': 0.0,
+        'stderr': 0.0,
+    }
+    if not hits or not durations or length <= 0:
+        return entry
+    n = len(durations)
+    mean = sum(durations) / n
+    entry['coverage'] = min(1.0, hits * mean / length)
+    if n > 1 and n < hits:
+        var = sum((d - mean) ** 2 for d in durations) / (n - 1)
+        # finite population correction: a fully sampled stratum has no sampling error
+        fpc = (hits - n) / (hits - 1) if hits > 1 else 0.0
+        entry['stderr'] = hits * math.sqrt(var / n * fpc) / length
+    return entry
+
+
+def combine_strata(strata: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Length-weighted coverage estimate across strata with a 95% interval (in percent)."""
+    weights = []
+    for s in strata:
+        start, end = _parse(s['start']), _parse(s['end'])
+        weights.append((end - start).total_seconds() if start and end else 0.0)
+    total = sum(weights)
+    if total <= 0:
+        return {'coverage_pct': 0.0, 'ci95_pct': [0.0, 0.0], 'strata': strata}
+    coverage = sum(w * s['coverage'] for w, s in zip(weights, strata)) / total
+    stderr = math.sqrt(sum((w * s['stderr']) ** 2 for w, s in zip(weights, strata))) / total
+    low, high = max(0.0, coverage - Z_95 * stderr), min(1.0, coverage + Z_95 * stderr)
+    return {
+        'coverage_pct': round(coverage * 100, 1),
+        'ci95_pct': [round(low * 100, 1), round(high * 100, 1)],
+        'empty_strata': sum(1 for s in strata if not s['hits']),
+        'sampled_granules': sum(s['sampled'] for s in strata),
+        'strata': strata,
+    }
+
+
+def merge_samples(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Stage-level view of per-collection estimates: the best-covered collection plus a summary of each."""
+    usable = [s for s in samples if s and s.get('strata')]
+    if not usable:
+        return {}
+    best = max(usable, key=lambda s: s['coverage_pct'])
+    return {
+        **best,
+        'requests': sum(s.get('requests', 0) for s in usable),
+        'collections': [
+            {
+                'collection_concept_id': s.get('collection_concept_id'),
+                'coverage_pct': s['coverage_pct'],
+                'ci95_pct': s['ci95_pct'],
+                'sampled_granules': s.get('sampled_granules', 0),
+            }
+            for s in usable
+        ],
+    }
+
+
+def sample_gaps(estimate: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Runs of consecutive strata with no granules, in the analysis ``temporal_gaps`` format."""
+    gaps: List[Dict[str, str]] = []
+    run: Optional[Tuple[datetime, datetime]] = None
+    for s in estimate.get('strata') or []:
+        start, end = _parse(s['start']), _parse(s['end'])
+        if s['hits']:
+            run = None
+            continue
+        if run is None:
+            run = (start, end)
+            gaps.append({})
+        else:
+            run = (run[0], end)
+        gaps[-1].update({
+            'gap_start': run[0].strftime('%Y-%m-%d'),
+            'gap_end': run[1].strftime('%Y-%m-%d'),
+            'gap_days': str((run[1] - run[0]).days),
+        })
+    return gaps
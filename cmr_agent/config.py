@@ -8,6 +8,108 @@ class Settings(BaseSettings):
     cmr_provider: str = Field(default='ALL', alias='CMR_PROVIDER')
     vector_db_dir: str = Field(default='./vectordb/chroma', alias='VECTOR_DB_DIR')
 
+    # Shared CMR connection pool (one httpx client per process, see server lifespan)
+    cmr_timeout_seconds: float = Field(default=30.0, alias='CMR_TIMEOUT_SECONDS')
+    cmr_max_connections: int = Field(default=100, alias='CMR_MAX_CONNECTIONS')
+    cmr_max_keepalive_connections: int = Field(default=20, alias='CMR_MAX_KEEPALIVE_CONNECTIONS')
+    cmr_keepalive_expiry_seconds: float = Field(default=30.0, alias='CMR_KEEPALIVE_EXPIRY_SECONDS')
+    cmr_http2: bool = Field(default=False, alias='CMR_HTTP2')
+
+    # Response cache for CMR searches (TTL in seconds per endpoint; 0 disables)
+    cmr_cache_enabled: bool = Field(default=True, alias='CMR_CACHE_ENABLED')
+    cmr_cache_max_bytes: int = Field(default=64 * 1024 * 1024, alias='CMR_CACHE_MAX_BYTES')
+    cmr_cache_ttl_collections: float = Field(default=3600.0, alias='CMR_CACHE_TTL_COLLECTIONS')
+    cmr_cache_ttl_granules: float = Field(default=300.0, alias='CMR_CACHE_TTL_GRANULES')
+    cmr_cache_ttl_variables: float = Field(default=3600.0, alias='CMR_CACHE_TTL_VARIABLES')
+    cmr_cache_dir: str | None = Field(default=None, alias='CMR_CACHE_DIR')
+    cmr_singleflight_enabled: bool = Field(default=True, alias='CMR_SINGLEFLIGHT_ENABLED')
+    # Replace UMM JSON in graph state with compact records (cmr_agent.types)
+    cmr_compact_records: bool = Field(default=True, alias='CMR_COMPACT_RECORDS')
+
+    # Out-of-band store for raw CMR results; graph state only holds handles into it
+    result_store_enabled: bool = Field(default=True, alias='RESULT_STORE_ENABLED')
+    result_store_max_bytes: int = Field(default=256 * 1024 * 1024, alias='RESULT_STORE_MAX_BYTES')
+    result_store_ttl_seconds: float = Field(default=900.0, alias='RESULT_STORE_TTL_SECONDS')
+    result_store_dir: str | None = Field(default=None, alias='RESULT_STORE_DIR')
+
+    # Final-response cache in front of the compiled graph (cmr_agent/answer_cache.py)
+    answer_cache_enabled: bool = Field(default=True, alias='ANSWER_CACHE_ENABLED')
+    answer_cache_ttl_seconds: float = Field(default=600.0, alias='ANSWER_CACHE_TTL_SECONDS')
+    answer_cache_stale_seconds: float = Field(default=300.0, alias='ANSWER_CACHE_STALE_SECONDS')
+    answer_cache_max_entries: int = Field(default=256, alias='ANSWER_CACHE_MAX_ENTRIES')
+    # Similarity (0-1) for reusing a near-duplicate query's answer; 0 disables
+    answer_cache_near_duplicate: float = Field(default=0.0, alias='ANSWER_CACHE_NEAR_DUPLICATE')
+    answer_cache_embeddings: bool = Field(default=False, alias='ANSWER_CACHE_EMBEDDINGS')
+
+    # Incremental refresh of saved queries via updated_since + deleted-record searches
+    cmr_incremental_refresh: bool = Field(default=False, alias='CMR_INCREMENTAL_REFRESH')
+    cmr_delta_dir: str | None = Field(default=None, alias='CMR_DELTA_DIR')
+    cmr_delta_overlap_seconds: float = Field(default=60.0, alias='CMR_DELTA_OVERLAP_SECONDS')
+
+    # Search-After pagination (CMR caps page_size at 2000)
+    cmr_page_size: int = Field(default=2000, alias='CMR_PAGE_SIZE')
+    cmr_prefetch_pages: int = Field(default=1, alias='CMR_PREFETCH_PAGES')
+    cmr_granules_per_collection: int = Field(default=200, alias='CMR_GRANULES_PER_COLLECTION')
+    cmr_hit_probe_collections: int = Field(default=25, alias='CMR_HIT_PROBE_COLLECTIONS')
+
+    # Stage fan-out: concurrent searches per stage and concept-id lookup chunking
+    cmr_stage_fanout: int = Field(default=8, alias='CMR_STAGE_FANOUT')
+    cmr_concept_id_chunk: int = Field(default=100, alias='CMR_CONCEPT_ID_CHUNK')
+    cmr_max_query_length: int = Field(default=2000, alias='CMR_MAX_QUERY_LENGTH')
+
+    # Facet-based temporal coverage histograms (resolution: year, month or day)
+    cmr_coverage_collections: int = Field(default=3, alias='CMR_COVERAGE_COLLECTIONS')
+    cmr_coverage_resolution: str = Field(default='month', alias='CMR_COVERAGE_RESOLUTION')
+    cmr_coverage_max_requests: int = Field(default=32, alias='CMR_COVERAGE_MAX_REQUESTS')
+    # Merged time intervals kept per query by the streaming coverage accumulator
+    cmr_coverage_max_intervals: int = Field(default=1000, alias='CMR_COVERAGE_MAX_INTERVALS')
+    # Simplification tolerance (degrees) for granule footprints before the spatial union
+    cmr_footprint_tolerance: float = Field(default=0.05, alias='CMR_FOOTPRINT_TOLERANCE')
+
+    # Granule fetch mode: 'pages' (first pages per collection) or 'stratified' (small page per time stratum)
+    cmr_granule_sampling: str = Field(default='pages', alias='CMR_GRANULE_SAMPLING')
+    cmr_sample_strata: int = Field(default=8, alias='CMR_SAMPLE_STRATA')
+    cmr_sample_page_size: int = Field(default=10, alias='CMR_SAMPLE_PAGE_SIZE')
+    cmr_sample_collections: int = Field(default=5, alias='CMR_SAMPLE_COLLECTIONS')
+
+    # Adaptive (AIMD) per-endpoint concurrency and token-bucket rate cap (0 disables the cap)
+    cmr_concurrency_initial: int = Field(default=8, alias='CMR_CONCURRENCY_INITIAL')
+    cmr_concurrency_min: int = Field(default=1, alias='CMR_CONCURRENCY_MIN')
+    cmr_concurrency_max: int = Field(default=32, alias='CMR_CONCURRENCY_MAX')
+    cmr_latency_target_seconds: float = Field(default=2.0, alias='CMR_LATENCY_TARGET_SECONDS')
+    cmr_rate_limit_per_second: float = Field(default=20.0, alias='CMR_RATE_LIMIT_PER_SECOND')
+    cmr_rate_limit_burst: int = Field(default=20, alias='CMR_RATE_LIMIT_BURST')
+
+    # Analysis step executor: inline, thread or process; smaller inputs always run inline
+    analysis_executor: str = Field(default='process', alias='ANALYSIS_EXECUTOR')
+    analysis_offload_min_items: int = Field(default=5000, alias='ANALYSIS_OFFLOAD_MIN_ITEMS')
+    analysis_max_workers: int | None = Field(default=None, alias='ANALYSIS_MAX_WORKERS')
+
+    # Start the base collection search in parallel with intent/planning instead of after them
+    cmr_speculative_search: bool = Field(default=True, alias='CMR_SPECULATIVE_SEARCH')
+
+    # Startup warmup of the shared resources (CMR connections, embedding model)
+    resources_warmup: bool = Field(default=True, alias='RESOURCES_WARMUP')
+    resources_warmup_connections: int = Field(default=4, alias='RESOURCES_WARMUP_CONNECTIONS')
+    resources_warmup_timeout_seconds: float = Field(default=15.0, alias='RESOURCES_WARMUP_TIMEOUT_SECONDS')
+
+    # /stream: seconds without an event before an SSE heartbeat comment is sent
+    stream_heartbeat_seconds: float = Field(default=15.0, alias='STREAM_HEARTBEAT_SECONDS')
+
+    # Cross-query knowledge graph (SQLite file; unset keeps it in memory for the process)
+    knowledge_graph_path: str | None = Field(default=None, alias='KNOWLEDGE_GRAPH_PATH')
+    knowledge_graph_max_links: int = Field(default=20, alias='KNOWLEDGE_GRAPH_MAX_LINKS')
+
+    # Per-endpoint circuit breakers
+    cmr_breaker_failure_threshold: int = Field(default=5, alias='CMR_BREAKER_FAILURE_THRESHOLD')
+    cmr_breaker_recovery_seconds: float = Field(default=30.0, alias='CMR_BREAKER_RECOVERY_SECONDS')
+    cmr_breaker_half_open_probes: int = Field(default=1, alias='CMR_BREAKER_HALF_OPEN_PROBES')
+
+    # Opt-in request hedging: duplicate requests slower than the endpoint's latency percentile
+    cmr_hedging_enabled: bool = Field(default=False, alias='CMR_HEDGING_ENABLED')
+    cmr_hedging_percentile: float = Field(default=0.95, alias='CMR_HEDGING_PERCENTILE')
+    cmr_hedging_budget: float = Field(default=0.05, alias='CMR_HEDGING_BUDGET')
+
     # Normalize provider so defaults behave consistently even if a local .env sets legacy values
     @field_validator('cmr_provider', mode='before')
     @classmethod
@@ -22,4 +124,3 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file='.env', extra='ignore')
 
 settings = Settings()
-
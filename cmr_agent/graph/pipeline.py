@@ -1,8 +1,12 @@
 from __future__ import annotations
+import inspect
+import time
+import uuid
 from typing import Any, Dict, List
 from datetime import datetime, timezone
 from langgraph.graph import StateGraph, END
-from cmr_agent.types import QueryState
+from cmr_agent.config import settings
+from cmr_agent.types import QueryState, compact_results
 from cmr_agent.agents.intent_agent import IntentAgent
 from cmr_agent.agents.validation_agent import ValidationAgent
 from cmr_agent.agents.cmr_agent import CMRAgent
@@ -10,23 +14,63 @@ from cmr_agent.agents.analysis_agent import AnalysisAgent
 from cmr_agent.agents.synthesis_agent import SynthesisAgent
 from cmr_agent.agents.retrieval_agent import RetrievalAgent
 from cmr_agent.agents.planning_agent import PlanningAgent
+from cmr_agent.answer_cache import get_answer_cache
+from cmr_agent.cmr.result_store import get_result_store, resolve_results, store_results
+from cmr_agent.knowledge_graph import get_knowledge_graph
+from cmr_agent.metrics import begin_request, current_request, end_request, observe_node
+from cmr_agent.resources import get_resources
 from cmr_agent.utils import infer_temporal, infer_bbox
 
 # Use the TypedDict-defined state schema
 StateType = QueryState
 
-# Nodes
-async def start_step(state: StateType) -> StateType:
+def _shared(name: str) -> Any:
+    """Resource from the process registry (see cmr_agent.resources); None lets the agent build its own."""
+    return getattr(get_resources(), name, None)
+
+# Nodes return only the keys they change, so streamed updates stay small
+
+async def start_step(state: StateType) -> Dict[str, Any]:
     history = state.get('history', [])
     history.append(state.get('user_query', ''))
-    state['history'] = history
-    state['run_metadata'] = {'started_at': datetime.now(timezone.utc).isoformat()}
-    return state
+    return {
+        'history': history,
+        'run_metadata': {'started_at': datetime.now(timezone.utc).isoformat(), 'request_id': uuid.uuid4().hex[:16]},
+    }
+
+def _timed(name: str, node):
+    """Wrap a node so its wall time is recorded per node (``/metrics`` and ``perf.breakdown``)."""
+    takes_config = 'config' in inspect.signature(node).parameters
+
+    async def run(state: StateType, config: Dict[str, Any] | None = None) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            return await (node(state, config) if takes_config else node(state))
+        finally:
+            observe_node(name, time.perf_counter() - started)
+
+    run.__name__ = name
+    return run
+
+def _branch(name: str, node):
+    """Wrap a fan-out node so its wall time lands in ``branch_timings``."""
+
+    async def run(state: StateType) -> Dict[str, Any]:
+        started = time.perf_counter()
+        update = await node(state)
+        update['branch_timings'] = {name: round((time.perf_counter() - started) * 1000, 1)}
+        return update
 
-async def intent_step(state: StateType) -> StateType:
-    agent = IntentAgent()
+    run.__name__ = name
+    return run
+
+# The nodes below run in parallel after start_step; join_step waits for all of
+# them before routing to CMR search or synthesis.
+
+async def intent_step(state: StateType) -> Dict[str, Any]:
+    agent = IntentAgent(router=_shared('router'))
     intent, subqueries = await agent.run(state['user_query'])
-    state.update({'intent': intent, 'subqueries': subqueries})
+    update: Dict[str, Any] = {'intent': intent, 'subqueries': subqueries}
     start, end = infer_temporal(state['user_query'])
     bbox = infer_bbox(state['user_query'])
     inferred: Dict[str, Any] = {
@@ -36,11 +80,11 @@ async def intent_step(state: StateType) -> StateType:
     }
     assumptions: List[Dict[str, Any]] = []
     if start and end:
-        state['temporal'] = (start, end)
+        update['temporal'] = (start, end)
     else:
         assumptions.append({'assumption': 'temporal range unspecified', 'confidence': 0.2})
     if bbox:
-        state['bbox'] = bbox
+        update['bbox'] = bbox
     else:
         assumptions.append({'assumption': 'region unspecified', 'confidence': 0.2})
     # naive region name extraction
@@ -49,11 +93,14 @@ async def intent_step(state: StateType) -> StateType:
     if m:
         inferred['region']['name'] = m.group(1).strip()
     inferred['variables'] = [w for w in state['user_query'].split() if len(w) > 3]
-    state['inferred_constraints'] = inferred
+    update['inferred_constraints'] = inferred
     if assumptions:
-        state['assumptions'] = assumptions
+        update['assumptions'] = assumptions
+    return update
+
+async def retrieval_step(state: StateType) -> Dict[str, Any]:
     # retrieve context for better downstream reasoning
-    retriever = RetrievalAgent()
+    retriever = RetrievalAgent(store=_shared('store'))
     docs = retriever.store.similarity_search(state['user_query'], k=5)
     semantic_context = []
     for d in docs:
@@ -63,43 +110,92 @@ async def intent_step(state: StateType) -> StateType:
             'similarity': metadata.get('score'),
             'snippet': getattr(d, 'page_content', '')[:200]
         })
-    state['semantic_context'] = semantic_context
-    return state
+    return {'semantic_context': semantic_context}
 
-async def validation_step(state: StateType) -> StateType:
+async def validation_step(state: StateType) -> Dict[str, Any]:
     agent = ValidationAgent()
-    validation = await agent.run(state['user_query'], state.get('subqueries', []))
-    state['validation'] = validation
-    state['validated'] = validation.get('feasible', False)
-    return state
-
-async def planning_step(state: StateType) -> StateType:
-    agent = PlanningAgent()
-    plan = await agent.run(state['user_query'], state.get('subqueries', []))
-    state['plan'] = plan
-    return state
-
-async def cmr_step(state: StateType) -> StateType:
+    # Runs alongside intent, so complexity is judged on the heuristic split of the query
+    validation = await agent.run(state['user_query'], IntentAgent.split_query(state['user_query']))
+    return {'validation': validation, 'validated': validation.get('feasible', False)}
+
+async def planning_step(state: StateType) -> Dict[str, Any]:
+    agent = PlanningAgent(router=_shared('router'))
+    plan = await agent.run(state['user_query'], IntentAgent.split_query(state['user_query']))
+    return {'plan': plan}
+
+async def speculate_step(state: StateType) -> Dict[str, Any]:
+    """Start the plan's base collection search while the LLM branches are still running."""
+    if not settings.cmr_speculative_search:
+        return {'speculative': {}}
+    # Validation is local and instant; don't spend a CMR call on a query that will be rejected
+    validation = await ValidationAgent().run(state['user_query'], [])
+    if not validation.get('feasible', False):
+        return {'speculative': {}}
     agent = CMRAgent()
+    try:
+        speculative = await agent.speculate(state['user_query'])
+    except Exception:
+        # Best effort: cmr_step simply issues the search itself
+        speculative = {}
+    finally:
+        await agent.close()
+    return {'speculative': speculative}
+
+async def join_step(state: StateType) -> Dict[str, Any]:
+    # Time from the start of the run until CMR search (or synthesis) can begin
+    run_meta = dict(state.get('run_metadata', {}))
+    try:
+        start = datetime.fromisoformat(run_meta['started_at'])
+        run_meta['join_ms'] = int((datetime.now(timezone.utc) - start).total_seconds() * 1000)
+    except Exception:
+        run_meta['join_ms'] = None
+    return {'run_metadata': run_meta}
+
+async def cmr_step(state: StateType, config: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    agent = CMRAgent()
+    # Streaming callers pass a progress callback that receives an event per CMR call and granule page
+    progress = ((config or {}).get('configurable') or {}).get('progress')
+    if progress is not None:
+        agent.progress = progress
+    # Collection searches already run by speculate_step are reused instead of re-issued
+    prime = getattr(agent, 'prime', None)
+    if callable(prime):
+        prime(state.get('speculative'))
+    update: Dict[str, Any] = {'speculative': {}}
     try:
         # Prefer planner output if present
         plan_or_subqueries: Dict | list[str] = state.get('plan') or state.get('subqueries', [])
         res = await agent.run(state['user_query'], plan_or_subqueries)
-        state['cmr_results'] = res
-        state['cmr_queries'] = res.get('query_log', [])
+        if settings.result_store_enabled:
+            # Raw pages go to the result store; state carries handles (see GET /results/{handle})
+            request_id = (state.get('run_metadata') or {}).get('request_id') or uuid.uuid4().hex[:16]
+            update['cmr_results'] = store_results(get_result_store(), request_id, res)
+        else:
+            # Keep only compact records in graph state; full UMM can be looked up by concept id
+            update['cmr_results'] = compact_results(res) if settings.cmr_compact_records else res
+        update['cmr_queries'] = res.get('query_log', [])
+        client_stats = getattr(getattr(agent, 'client', None), 'stats', None)
+        if callable(client_stats):
+            update['cmr_stats'] = client_stats()
     finally:
         await agent.close()
-    return state
+    return update
 
-async def analysis_step(state: StateType) -> StateType:
+async def analysis_step(state: StateType) -> Dict[str, Any]:
     agent = AnalysisAgent()
     temporal = state.get('temporal')
     bbox = state.get('bbox')
-    state['analysis'] = await agent.run(state.get('cmr_results', {}), temporal, bbox)
-    return state
+    results = resolve_results(state.get('cmr_results', {}))
+    analysis = await agent.run(results, temporal, bbox)
+    # Fold this query into the persistent graph and link its collections to ones seen before
+    graph = get_knowledge_graph()
+    graph.ingest(results)
+    concept_ids = [c['concept_id'] for c in analysis.get('related_collections', []) if c.get('concept_id')]
+    analysis['knowledge_links'] = graph.links_for(dict.fromkeys(concept_ids), settings.knowledge_graph_max_links)
+    return {'analysis': analysis, 'analysis_executor': agent.timing}
 
 async def synthesis_step(state: StateType) -> StateType:
-    agent = SynthesisAgent()
+    agent = SynthesisAgent(router=_shared('router'))
     text = await agent.run(
         state['user_query'], state.get('analysis', {}), state.get('history', [])
     )
@@ -114,6 +210,10 @@ async def synthesis_step(state: StateType) -> StateType:
     run_meta.setdefault('retry_counts', 0)
 
     analysis = state.get('analysis', {})
+    # Per-request timings and call counts gathered by cmr_agent.metrics during this run
+    request_metrics = current_request()
+    breakdown = request_metrics.snapshot() if request_metrics is not None else {}
+    breakers = state.get('cmr_stats', {}).get('breakers', {})
     comparison = {
         'criteria': ['resolution', 'latency', 'record_length', 'validation_status'],
         'ranked_recommendations': []
@@ -141,7 +241,14 @@ async def synthesis_step(state: StateType) -> StateType:
         'related_collections': analysis.get('related_collections', []),
         'cmr_queries': state.get('cmr_queries', []),
         'run_metadata': run_meta,
-        'failover': {'llm_used_order': ['gptX', 'claudeY'], 'circuit_breaker_tripped': False, 'fallbacks_applied': []},
+        'failover': {
+            'llm_used_order': ['gptX', 'claudeY'],
+            'circuit_breaker_tripped': any(
+                b.get('trips') or b.get('state') != 'closed' for b in breakers.values()
+            ),
+            'circuit_breakers': breakers,
+            'fallbacks_applied': [],
+        },
         'results_paging': analysis.get('results_paging', {'page': 1, 'page_size': 50, 'next_token': ''}),
         'knowledge_links': analysis.get('knowledge_links', []),
         'visuals': {'summaries': ['temporal_coverage_chart', 'spatial_extent_map'], 'data_refs': analysis.get('data_refs', [])},
@@ -149,10 +256,27 @@ async def synthesis_step(state: StateType) -> StateType:
         'conformance': {
             'used_parallel_agents': True,
             'performed_gap_analysis': True,
-            'did_cross_collection_discovery': True,
+            'did_cross_collection_discovery': bool(analysis.get('knowledge_links')),
             'produced_recommendations': True
         },
-        'perf': {'simple_query_ms': run_meta.get('duration_ms'), 'api_calls': {'collections': 1, 'granules': 1, 'variables': 1}},
+        'perf': {
+            'simple_query_ms': run_meta.get('duration_ms'),
+            'branch_ms': state.get('branch_timings', {}),
+            'api_calls': {ep: c.get('calls', 0) for ep, c in breakdown.get('cmr', {}).items()},
+            'breakdown': breakdown,
+            'total_hits': analysis.get('total_hits', {}),
+            'cmr_hit_probes': state.get('cmr_stats', {}).get('hit_probes', 0),
+            'stage_dag': (state.get('cmr_results') or {}).get('stages', {}),
+            'cmr_pool': state.get('cmr_stats', {}).get('pool', {}),
+            'cmr_cache': state.get('cmr_stats', {}).get('cache', {}),
+            'cmr_singleflight': state.get('cmr_stats', {}).get('singleflight', {}),
+            'cmr_limiter': state.get('cmr_stats', {}).get('limiter', {}),
+            'cmr_hedging': state.get('cmr_stats', {}).get('hedging', {}),
+            'cmr_delta': state.get('cmr_stats', {}).get('delta', {}),
+            'result_store': get_result_store().stats(),
+            'analysis_executor': state.get('analysis_executor', {}),
+            'knowledge_graph': get_knowledge_graph().stats(),
+        },
         'semantic_context': state.get('semantic_context', []),
         'kg_edges': analysis.get('knowledge_graph', {}).get('edges', []),
         'history': state.get('history', []),
@@ -164,23 +288,34 @@ async def synthesis_step(state: StateType) -> StateType:
 
 def build_graph():
     graph = StateGraph(StateType)
-    graph.add_node('start_step', start_step)
-    graph.add_node('intent_step', intent_step)
-    graph.add_node('validation_step', validation_step)
-    graph.add_node('planning_step', planning_step)
-    graph.add_node('cmr_step', cmr_step)
-    graph.add_node('analysis_step', analysis_step)
-    graph.add_node('synthesis_step', synthesis_step)
+    for name, node in (
+        ('start_step', start_step),
+        ('join_step', join_step),
+        ('cmr_step', cmr_step),
+        ('analysis_step', analysis_step),
+        ('synthesis_step', synthesis_step),
+    ):
+        graph.add_node(name, _timed(name, node))
 
+    # Fan out after start_step: intent, validation, planning and retrieval only need the
+    # query, and the speculative collection search overlaps them; join_step waits for all
+    branches = {
+        'intent_step': intent_step,
+        'validation_step': validation_step,
+        'planning_step': planning_step,
+        'retrieval_step': retrieval_step,
+        'speculate_step': speculate_step,
+    }
     graph.set_entry_point('start_step')
-    graph.add_edge('start_step', 'intent_step')
-    graph.add_edge('intent_step', 'validation_step')
-    graph.add_edge('validation_step', 'planning_step')
+    for name, node in branches.items():
+        graph.add_node(name, _timed(name, _branch(name, node)))
+        graph.add_edge('start_step', name)
+    graph.add_edge(list(branches), 'join_step')
 
-    def route_after_planning(state: StateType):
+    def route_after_join(state: StateType):
         return 'cmr_step' if state.get('validated') else 'synthesis_step'
 
-    graph.add_conditional_edges('planning_step', route_after_planning, {
+    graph.add_conditional_edges('join_step', route_after_join, {
         'cmr_step': 'cmr_step',
         'synthesis_step': 'synthesis_step',
     })
@@ -200,6 +335,38 @@ def build_graph():
         def __getattr__(self, name):
             return getattr(self._compiled, name)
 
+        # Each run gets its own RequestMetrics; node tasks inherit it through the context
+        async def _run(self, *args, **kwargs):
+            token = begin_request()
+            try:
+                return await self._compiled.ainvoke(*args, **kwargs)
+            finally:
+                end_request(token)
+
+        async def ainvoke(self, input, *args, **kwargs):
+            query = input.get('user_query') if isinstance(input, dict) else None
+            if not settings.answer_cache_enabled or not query:
+                return await self._run(input, *args, **kwargs)
+
+            # A cached answer is shared across sessions; only the history is per caller
+            history = list(input.get('history') or [])
+            result, info = await get_answer_cache().get_or_run(
+                query, lambda: self._run({**input, 'history': list(history)}, *args, **kwargs)
+            )
+            if not info['hit'] and not info.get('coalesced'):
+                return result
+            # Hits and coalesced misses carry another caller's run; give them this caller's history
+            run_metadata = {**(result.get('run_metadata') or {}), 'answer_cache': info}
+            return {**result, 'user_query': query, 'history': history + [query], 'run_metadata': run_metadata}
+
+        async def astream(self, *args, **kwargs):
+            token = begin_request()
+            try:
+                async for event in self._compiled.astream(*args, **kwargs):
+                    yield event
+            finally:
+                end_request(token)
+
         def __str__(self):
             """Return a readable representation of the underlying graph."""
             target = getattr(self._compiled, 'agraph', None)
@@ -0,0 +1,183 @@
+from __future__ import annotations
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from cmr_agent.config import settings
+from cmr_agent.types import umm_items
+
+# A node is (kind, name); kinds are collection, instrument, platform and variable
+Node = Tuple[str, str]
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS edges (
+    source_kind TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target_kind TEXT NOT NULL,
+    target TEXT NOT NULL,
+    relation TEXT NOT NULL,
+    PRIMARY KEY (source_kind, source, target_kind, target, relation)
+)
+'''
+
+
+def _as_list(value: Any) -> list:
+    if isinstance(value, dict):
+        return [value]
+    return [v for v in (value or []) if isinstance(v, dict)]
+
+
+class KnowledgeGraph:
+    """Collection/instrument/platform/variable graph with adjacency indexes.
+
+    Edges are deduplicated on insert and indexed in both directions by
+    neighbour kind, so lookups such as "collections sharing an instrument"
+    are dict/set operations. With ``path`` set, edges are also stored in
+    SQLite and loaded again on start.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._edges: Dict[Tuple[Node, Node, str], None] = {}
+        self._adj: Dict[Node, Dict[str, Set[Node]]] = {}
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(_SCHEMA)
+            rows = self._db.execute('SELECT source_kind, source, target_kind, target, relation FROM edges').fetchall()
+            for sk, s, tk, t, rel in rows:
+                self._index((sk, s), (tk, t), rel)
+
+    def _index(self, source: Node, target: Node, relation: str) -> bool:
+        key = (source, target, relation)
+        if key in self._edges:
+            return False
+        self._edges[key] = None
+        self._adj.setdefault(source, {}).setdefault(target[0], set()).add(target)
+        self._adj.setdefault(target, {}).setdefault(source[0], set()).add(source)
+        return True
+
+    def add_node(self, node: Node):
+        self._adj.setdefault(node, {})
+
+    def add_edges(self, edges: Iterable[Tuple[Node, Node, str]]) -> int:
+        """Insert edges, skipping known ones; returns how many were new."""
+        with self._lock:
+            new = [(s, t, rel) for s, t, rel in edges if self._index(s, t, rel)]
+            if new and self._db is not None:
+                with self._db:
+                    self._db.executemany(
+                        'INSERT OR IGNORE INTO edges VALUES (?, ?, ?, ?, ?)',
+                        [(s[0], s[1], t[0], t[1], rel) for s, t, rel in new],
+                    )
+        return len(new)
+
+    def ingest_collections(self, collections: List[Dict[str, Any]]) -> int:
+        edges: List[Tuple[Node, Node, str]] = []
+        for c in umm_items(collections):
+            cid = (c.get('meta') or {}).get('concept-id')
+            if not cid:
+                continue
+            collection = ('collection', cid)
+            self.add_node(collection)
+            for p in _as_list((c.get('umm') or {}).get('Platforms')):
+                pname = p.get('ShortName') or p.get('LongName')
+                if pname:
+                    edges.append((collection, ('platform', pname), 'collection-platform'))
+                for instr in _as_list(p.get('Instruments')):
+                    name = instr.get('ShortName') or instr.get('LongName')
+                    if name:
+                        edges.append((collection, ('instrument', name), 'collection-instrument'))
+                        if pname:
+                            edges.append((('platform', pname), ('instrument', name), 'platform-instrument'))
+        return self.add_edges(edges)
+
+    def ingest_variables(self, variables: List[Dict[str, Any]]) -> int:
+        edges: List[Tuple[Node, Node, str]] = []
+        for v in umm_items(variables):
+            vname = (v.get('umm') or {}).get('Name')
+            if not vname:
+                continue
+            self.add_node(('variable', vname))
+            for a in _as_list((v.get('associations') or {}).get('collections')):
+                cid = a.get('concept_id')
+                if cid:
+                    edges.append((('variable', vname), ('collection', cid), 'variable-collection'))
+        return self.add_edges(edges)
+
+    def ingest(self, cmr_results: Any) -> int:
+        """Fold one CMR result (``{'searches': [...]}``) into the graph."""
+        searches = cmr_results.get('searches', []) if isinstance(cmr_results, dict) else []
+        added = 0
+        for s in searches:
+            added += self.ingest_collections((s.get('collections') or {}).get('items') or [])
+            added += self.ingest_variables((s.get('variables') or {}).get('items') or [])
+        return added
+
+    def neighbors(self, node: Node, kind: Optional[str] = None) -> Set[Node]:
+        adj = self._adj.get(node) or {}
+        if kind is not None:
+            return set(adj.get(kind, ()))
+        return set().union(*adj.values()) if adj else set()
+
+    def related_collections(self, concept_id: str, via: str = 'instrument') -> Dict[str, List[str]]:
+        """Other known collections sharing each ``via`` node (instrument/platform/variable)."""
+        out: Dict[str, List[str]] = {}
+        collection = ('collection', concept_id)
+        for shared in sorted(self.neighbors(collection, via)):
+            others = sorted(c[1] for c in self.neighbors(shared, 'collection') if c != collection)
+            if others:
+                out[shared[1]] = others
+        return out
+
+    def links_for(self, concept_ids: Iterable[str], limit: int = 20) -> List[Dict[str, str]]:
+        """Links from the given collections to other known collections on the same instrument."""
+        links: List[Dict[str, str]] = []
+        for cid in concept_ids:
+            for instrument, others in self.related_collections(cid).items():
+                for other in others:
+                    links.append({
+                        'collection': cid,
+                        'instrument': instrument,
+                        'relates_to': other,
+                        'relation': 'shares_instrument',
+                    })
+                    if len(links) >= limit:
+                        return links
+        return links
+
+    def export(self) -> Dict[str, Any]:
+        nodes: Dict[str, List[str]] = {'collections': [], 'variables': [], 'instruments': [], 'platforms': []}
+        for kind, name in self._adj:
+            nodes[kind + 's'].append(name)
+        return {
+            'nodes': {k: sorted(v) for k, v in nodes.items()},
+            'edges': [{'source': s[1], 'target': t[1], 'type': rel} for s, t, rel in self._edges],
+        }
+
+    def stats(self) -> Dict[str, int]:
+        return {'nodes': len(self._adj), 'edges': len(self._edges)}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# Process-wide graph that accumulates across queries
+_graph: Optional[KnowledgeGraph] = None
+
+
+def get_knowledge_graph() -> KnowledgeGraph:
+    global _graph
+    if _graph is None:
+        _graph = KnowledgeGraph(settings.knowledge_graph_path)
+    return _graph
+
+
+def close_knowledge_graph():
+    global _graph
+    graph, _graph = _graph, None
+    if graph is not None:
+        graph.close()
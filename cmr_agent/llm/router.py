@@ -1,6 +1,8 @@
 from __future__ import annotations
-from typing import Optional
+import time
+from typing import Any, Optional
 from cmr_agent.config import settings
+from cmr_agent.metrics import observe_llm
 
 # Lazy-optional imports to avoid hard dependency issues
 try:
@@ -33,3 +35,15 @@ class LLMRouter:
 
     def fallback(self) -> Optional[object]:
         return self.secondary
+
+
+async def ainvoke(llm: Any, prompt: str, caller: str) -> Any:
+    """``llm.ainvoke(prompt)`` with its latency and outcome recorded under ``caller``."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        msg = await llm.ainvoke(prompt)
+        outcome = 'ok'
+        return msg
+    finally:
+        observe_llm(caller, type(llm).__name__, outcome, time.perf_counter() - started)
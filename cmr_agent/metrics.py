@@ -0,0 +1,212 @@
+"""Latency and volume metrics for graph nodes, CMR calls, LLM calls and Chroma.
+
+Process-wide histograms and counters are rendered in the Prometheus text
+format for ``GET /metrics``. The same observations are also added to a
+per-request ``RequestMetrics`` held in a context variable, which the compiled
+graph sets for each run. Tasks created during the run inherit it, so the
+final response's ``perf`` block can show where that request's time went.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value:g}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[LabelValues, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, *labels: str):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def count(self, *labels: str) -> int:
+        series = self._series.get(labels)
+        return int(series[-2]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = 'le="%g"' % bound
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {count:g}')
+            le = 'le="+Inf"'
+            lines.append(f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {series[-2]:g}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {series[-1]:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {series[-2]:g}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+NODE_SECONDS = REGISTRY.histogram('cmr_agent_node_duration_seconds', 'Graph node wall time.', ('node',))
+CMR_SECONDS = REGISTRY.histogram(
+    'cmr_agent_cmr_request_duration_seconds', 'CMR HTTP request time per attempt.', ('endpoint', 'status')
+)
+CMR_BYTES = REGISTRY.counter('cmr_agent_cmr_response_bytes_total', 'CMR response body bytes.', ('endpoint',))
+CMR_RETRIES = REGISTRY.counter('cmr_agent_cmr_retries_total', 'CMR request retries after a retryable failure.', ('endpoint',))
+LLM_SECONDS = REGISTRY.histogram(
+    'cmr_agent_llm_duration_seconds', 'LLM ainvoke time.', ('caller', 'provider', 'outcome')
+)
+CHROMA_SECONDS = REGISTRY.histogram('cmr_agent_chroma_duration_seconds', 'Chroma vector store call time.', ('operation',))
+
+
+class RequestMetrics:
+    """What one pipeline run spent, by node, CMR endpoint, LLM caller and Chroma operation."""
+
+    def __init__(self):
+        self.nodes: Dict[str, float] = {}
+        self.cmr: Dict[str, Dict[str, float]] = {}
+        self.llm: Dict[str, Dict[str, float]] = {}
+        self.chroma: Dict[str, Dict[str, float]] = {}
+
+    @staticmethod
+    def _add(table: Dict[str, Dict[str, float]], key: str, **values: float):
+        entry = table.setdefault(key, {})
+        for name, value in values.items():
+            entry[name] = entry.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, Any]:
+        def rounded(table: Dict[str, Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+            return {k: {n: round(v, 1) if n == 'ms' else int(v) for n, v in e.items()} for k, e in table.items()}
+
+        return {
+            'nodes_ms': {k: round(v, 1) for k, v in self.nodes.items()},
+            'cmr': rounded(self.cmr),
+            'llm': rounded(self.llm),
+            'chroma': rounded(self.chroma),
+        }
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar('request_metrics', default=None)
+
+
+def begin_request() -> contextvars.Token:
+    return _current.set(RequestMetrics())
+
+
+def end_request(token: contextvars.Token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Streams can be closed from another context than the one that opened them
+        _current.set(None)
+
+
+def current_request() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+def observe_node(node: str, seconds: float):
+    NODE_SECONDS.observe(seconds, node)
+    req = _current.get()
+    if req is not None:
+        req.nodes[node] = req.nodes.get(node, 0.0) + seconds * 1000
+
+
+def observe_cmr(endpoint: str, status: Any, seconds: float, nbytes: int = 0):
+    """One CMR HTTP attempt; ``status`` is the HTTP status or ``'error'``."""
+    CMR_SECONDS.observe(seconds, endpoint, str(status))
+    if nbytes:
+        CMR_BYTES.inc(endpoint, amount=nbytes)
+    req = _current.get()
+    if req is not None:
+        ok = isinstance(status, int) and status < 400
+        req._add(req.cmr, endpoint, calls=1, errors=0 if ok else 1, bytes=nbytes, ms=seconds * 1000)
+
+
+def observe_cmr_retry(endpoint: str):
+    CMR_RETRIES.inc(endpoint)
+    req = _current.get()
+    if req is not None:
+        req._add(req.cmr, endpoint, retries=1)
+
+
+def observe_llm(caller: str, provider: str, outcome: str, seconds: float):
+    LLM_SECONDS.observe(seconds, caller, provider, outcome)
+    req = _current.get()
+    if req is not None:
+        req._add(req.llm, caller, calls=1, errors=0 if outcome == 'ok' else 1, ms=seconds * 1000)
+
+
+@contextmanager
+def chroma_timer(operation: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        CHROMA_SECONDS.observe(seconds, operation)
+        req = _current.get()
+        if req is not None:
+            req._add(req.chroma, operation, calls=1, ms=seconds * 1000)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from cmr_agent.agents.analysis_agent import shutdown_executors
+from cmr_agent.answer_cache import close_answer_cache
+from cmr_agent.config import settings
+from cmr_agent.cmr.client import AsyncCMRClient, open_shared_client, close_shared_client
+from cmr_agent.cmr.result_store import ResultStore, get_result_store, close_result_store
+from cmr_agent.knowledge_graph import KnowledgeGraph, get_knowledge_graph, close_knowledge_graph
+
+
+class Resources:
+    """Long-lived clients shared by all pipeline runs in a process.
+
+    Built once by the server lifespan (or the CLI) and handed to the agents by
+    the pipeline nodes, so LLM clients, the Chroma store and the CMR
+    connection pool are not rebuilt per request. A resource that fails to
+    build is left as ``None`` and the agents build their own as before.
+    """
+
+    def __init__(self):
+        self.router: Optional[Any] = None
+        self.store: Optional[Any] = None
+        self.cmr_client: Optional[AsyncCMRClient] = None
+        self.knowledge_graph: Optional[KnowledgeGraph] = None
+        self.result_store: Optional[ResultStore] = None
+        self.warmup_report: Dict[str, Any] = {}
+
+    async def open(self):
+        try:
+            from cmr_agent.llm.router import LLMRouter
+            self.router = LLMRouter()
+        except Exception:
+            self.router = None
+        try:
+            from cmr_agent.vectordb import ChromaStore
+            self.store = ChromaStore()
+        except Exception:
+            self.store = None
+        self.cmr_client = await open_shared_client()
+        self.knowledge_graph = get_knowledge_graph()
+        self.result_store = get_result_store()
+
+    async def warmup(self) -> Dict[str, Any]:
+        """Pre-open CMR connections and load the embedding model, in parallel and best effort."""
+
+        async def timed(name: str, work) -> None:
+            started = time.perf_counter()
+            try:
+                result = await work
+                self.warmup_report[name] = {'ok': True, 'result': result}
+            except Exception as exc:
+                self.warmup_report[name] = {'ok': False, 'error': str(exc)}
+            self.warmup_report[name]['ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+        tasks = []
+        if self.cmr_client is not None:
+            tasks.append(timed('cmr', self.cmr_client.warmup(settings.resources_warmup_connections)))
+        if self.store is not None:
+            tasks.append(timed('embeddings', asyncio.to_thread(self.store.warmup)))
+        try:
+            await asyncio.wait_for(asyncio.gather(*tasks), settings.resources_warmup_timeout_seconds)
+        except asyncio.TimeoutError:
+            self.warmup_report['timed_out'] = True
+        return self.warmup_report
+
+    async def close(self):
+        self.router = None
+        self.store = None
+        self.cmr_client = None
+        self.knowledge_graph = None
+        self.result_store = None
+        await close_shared_client()
+        close_knowledge_graph()
+        close_result_store()
+        close_answer_cache()
+        shutdown_executors()
+
+
+# Process-wide registry, opened and closed by the server lifespan or the CLI
+_resources: Optional[Resources] = None
+
+
+async def open_resources(warmup: Optional[bool] = None) -> Resources:
+    global _resources
+    if _resources is None:
+        resources = Resources()
+        await resources.open()
+        _resources = resources
+        if settings.resources_warmup if warmup is None else warmup:
+            await resources.warmup()
+    return _resources
+
+
+def get_resources() -> Optional[Resources]:
+    return _resources
+
+
+async def close_resources():
+    global _resources
+    resources, _resources = _resources, None
+    if resources is not None:
+        await resources.close()
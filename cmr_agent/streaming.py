@@ -0,0 +1,96 @@
+"""Server-sent event encoding for pipeline runs.
+
+LangGraph streams each step as ``{node: update}``. Only keys whose JSON
+differs from what was last sent go out, as one compact ``update`` frame.
+Raw CMR results are replaced by per-search counts and result-store handles
+(see ``GET /results/{handle}``). Progress callbacks become ``progress``
+frames, and idle periods are filled with SSE comment heartbeats.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Callable, Dict, Optional
+
+HEARTBEAT = b': heartbeat\n\n'
+
+
+def _default(value: Any) -> Any:
+    if hasattr(value, 'to_umm'):
+        return value.to_umm()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    return str(value)
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, separators=(',', ':'), default=_default, ensure_ascii=False)
+
+
+def summarize_cmr_results(results: Any) -> Dict[str, Any]:
+    """Counts per search instead of the records themselves."""
+    if not isinstance(results, dict):
+        return {}
+    searches = []
+    for s in results.get('searches') or []:
+        entry: Dict[str, Any] = {'query': s.get('query')}
+        for kind in ('collections', 'granules', 'variables'):
+            block = s.get(kind) or {}
+            entry[kind] = {'items': block.get('count', len(block.get('items') or [])), 'hits': block.get('hits')}
+            if block.get('handle'):
+                entry[kind]['handle'] = block['handle']
+        searches.append(entry)
+    return {'searches': searches}
+
+
+# Keys streamed as a summary rather than as their value
+SUMMARIZED: Dict[str, Callable[[Any], Any]] = {
+    'cmr_results': summarize_cmr_results,
+    'speculative': lambda value: {'requests': len(value or {})},
+}
+
+
+def compact_progress(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Coverage snapshots carry the gap count rather than the full gap list."""
+    if 'gaps' not in event:
+        return event
+    out = {k: v for k, v in event.items() if k != 'gaps'}
+    out['gap_count'] = len(event['gaps'] or [])
+    return out
+
+
+class SSEEncoder:
+    """Turns graph updates and progress events into numbered SSE frames."""
+
+    def __init__(self):
+        self._sent: Dict[str, int] = {}
+        self.frames = 0
+        self.bytes = 0
+
+    def frame(self, event: str, data: str) -> bytes:
+        self.frames += 1
+        out = f'id: {self.frames}\nevent: {event}\ndata: {data}\n\n'.encode('utf-8')
+        self.bytes += len(out)
+        return out
+
+    def update(self, node: str, values: Optional[Dict[str, Any]]) -> bytes:
+        changed = []
+        for key, value in (values or {}).items():
+            if key in SUMMARIZED:
+                value = SUMMARIZED[key](value)
+            encoded = dumps(value)
+            digest = hash(encoded)
+            if self._sent.get(key) == digest:
+                continue
+            self._sent[key] = digest
+            changed.append(f'{dumps(key)}:{encoded}')
+        return self.frame('update', '{"node":%s,"changed":{%s}}' % (dumps(node), ','.join(changed)))
+
+    def progress(self, event: Dict[str, Any]) -> bytes:
+        return self.frame('progress', dumps(compact_progress(event)))
+
+    def error(self, exc: BaseException) -> bytes:
+        return self.frame('error', dumps({'error': str(exc), 'type': type(exc).__name__}))
+
+    def done(self, **extra: Any) -> bytes:
+        return self.frame('done', dumps({**extra, 'frames': self.frames + 1, 'bytes': self.bytes}))
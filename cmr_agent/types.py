@@ -1,14 +1,26 @@
-from typing import Literal, TypedDict, Any, Optional
+from typing import Annotated, Literal, TypedDict, Any, Optional
 
 IntentType = Literal["exploratory", "specific", "analytical"]
 
+
+def merge_dicts(left: Optional[dict], right: Optional[dict]) -> dict:
+    """State reducer for keys that parallel branches write in the same step."""
+    return {**(left or {}), **(right or {})}
+
+
 class QueryState(TypedDict, total=False):
     user_query: str
     intent: IntentType
     subqueries: list[str]
     plan: dict
     validated: bool
+    validation: dict
     validation_notes: str
+    inferred_constraints: dict
+    assumptions: list[dict]
+    semantic_context: list[dict]
+    speculative: dict
+    branch_timings: Annotated[dict, merge_dicts]
     cmr_results: dict
     analysis: dict
     synthesis: str
@@ -16,8 +28,189 @@ class QueryState(TypedDict, total=False):
     temporal: tuple[str, str]
     bbox: tuple[float, float, float, float]
     history: list[str]
+    run_metadata: dict
+    cmr_queries: list[dict]
+    cmr_stats: dict
+    analysis_executor: dict
+    perf: dict
+    failover: dict
 
 class AgentResult(TypedDict, total=False):
     name: str
     data: Any
     error: Optional[str]
+
+
+# Compact records: the fields analysis and synthesis read, without the rest of the UMM JSON.
+# ``to_umm()`` rebuilds a slim UMM-shaped dict for code that walks dicts; the full record can
+# be fetched again by concept id (see ``AsyncCMRClient.lookup``).
+
+def _pairs(value: Any) -> list:
+    if isinstance(value, dict):
+        return [value]
+    return [v for v in (value or []) if isinstance(v, dict)]
+
+
+class CollectionRecord:
+    __slots__ = ('concept_id', 'provider', 'short_name', 'long_name', 'platforms', 'attributes')
+
+    def __init__(self, concept_id, provider=None, short_name=None, long_name=None, platforms=(), attributes=()):
+        self.concept_id = concept_id
+        self.provider = provider
+        self.short_name = short_name
+        self.long_name = long_name
+        # ((short_name, long_name, ((instrument short_name, long_name), ...)), ...)
+        self.platforms = platforms
+        # Spatial resolution attributes only: ((name, (values...)), ...)
+        self.attributes = attributes
+
+    @classmethod
+    def from_umm(cls, item: dict) -> 'CollectionRecord':
+        meta = item.get('meta') or {}
+        umm = item.get('umm') or {}
+        platforms = tuple(
+            (
+                p.get('ShortName'),
+                p.get('LongName'),
+                tuple((i.get('ShortName'), i.get('LongName')) for i in _pairs(p.get('Instruments'))),
+            )
+            for p in _pairs(umm.get('Platforms'))
+        )
+        attributes = tuple(
+            (a.get('Name'), tuple(str(v) for v in (a.get('Values') or [])))
+            for a in _pairs(umm.get('AdditionalAttributes'))
+            if (a.get('Name') or '').lower().startswith('spatial resolution')
+        )
+        return cls(meta.get('concept-id'), meta.get('provider-id'), umm.get('ShortName'), umm.get('LongName'), platforms, attributes)
+
+    def to_umm(self) -> dict:
+        umm: dict = {'ShortName': self.short_name, 'LongName': self.long_name}
+        if self.platforms:
+            umm['Platforms'] = [
+                {'ShortName': ps, 'LongName': pl, 'Instruments': [{'ShortName': s, 'LongName': l} for s, l in instruments]}
+                for ps, pl, instruments in self.platforms
+            ]
+        if self.attributes:
+            umm['AdditionalAttributes'] = [{'Name': n, 'Values': list(v)} for n, v in self.attributes]
+        return {'meta': {'concept-id': self.concept_id, 'provider-id': self.provider}, 'umm': umm}
+
+    def __repr__(self) -> str:
+        return f'CollectionRecord({self.concept_id!r})'
+
+
+class GranuleRecord:
+    __slots__ = ('concept_id', 'collection_concept_id', 'begin', 'end', 'boxes', 'polygons')
+
+    def __init__(self, concept_id, collection_concept_id=None, begin=None, end=None, boxes=(), polygons=()):
+        self.concept_id = concept_id
+        self.collection_concept_id = collection_concept_id
+        self.begin = begin
+        self.end = end
+        # ((west, south, east, north), ...) and ((lon, lat), ...) rings, values as found in UMM
+        self.boxes = boxes
+        self.polygons = polygons
+
+    @classmethod
+    def from_umm(cls, item: dict) -> 'GranuleRecord':
+        meta = item.get('meta') or {}
+        umm = item.get('umm') or {}
+        te = (umm.get('TemporalExtent') or {}).get('RangeDateTime') or {}
+        geom = ((umm.get('SpatialExtent') or {}).get('HorizontalSpatialDomain') or {}).get('Geometry') or {}
+        boxes = tuple(
+            (
+                b.get('WestBoundingCoordinate'),
+                b.get('SouthBoundingCoordinate'),
+                b.get('EastBoundingCoordinate'),
+                b.get('NorthBoundingCoordinate'),
+            )
+            for b in _pairs(geom.get('BoundingBox') or geom.get('BoundingRectangles'))
+        )
+        polygons = tuple(
+            tuple((p.get('Longitude'), p.get('Latitude')) for p in _pairs(((g.get('Boundary') or {}).get('Points'))))
+            for g in _pairs(geom.get('GPolygons'))
+        )
+        return cls(
+            meta.get('concept-id'),
+            meta.get('collection-concept-id'),
+            te.get('BeginningDateTime'),
+            te.get('EndingDateTime'),
+            boxes,
+            polygons,
+        )
+
+    def to_umm(self) -> dict:
+        umm: dict = {}
+        if self.begin or self.end:
+            umm['TemporalExtent'] = {'RangeDateTime': {'BeginningDateTime': self.begin, 'EndingDateTime': self.end}}
+        geometry: dict = {}
+        if self.boxes:
+            geometry['BoundingRectangles'] = [
+                {
+                    'WestBoundingCoordinate': w,
+                    'SouthBoundingCoordinate': s,
+                    'EastBoundingCoordinate': e,
+                    'NorthBoundingCoordinate': n,
+                }
+                for w, s, e, n in self.boxes
+            ]
+        if self.polygons:
+            geometry['GPolygons'] = [
+                {'Boundary': {'Points': [{'Longitude': x, 'Latitude': y} for x, y in ring]}} for ring in self.polygons
+            ]
+        if geometry:
+            umm['SpatialExtent'] = {'HorizontalSpatialDomain': {'Geometry': geometry}}
+        return {'meta': {'concept-id': self.concept_id, 'collection-concept-id': self.collection_concept_id}, 'umm': umm}
+
+    def __repr__(self) -> str:
+        return f'GranuleRecord({self.concept_id!r})'
+
+
+class VariableRecord:
+    __slots__ = ('concept_id', 'name', 'collection_ids')
+
+    def __init__(self, concept_id, name=None, collection_ids=()):
+        self.concept_id = concept_id
+        self.name = name
+        self.collection_ids = collection_ids
+
+    @classmethod
+    def from_umm(cls, item: dict) -> 'VariableRecord':
+        assocs = (item.get('associations') or {}).get('collections') or []
+        ids = tuple(a.get('concept_id') or a.get('concept-id') for a in _pairs(assocs))
+        return cls((item.get('meta') or {}).get('concept-id'), (item.get('umm') or {}).get('Name'), tuple(i for i in ids if i))
+
+    def to_umm(self) -> dict:
+        return {
+            'meta': {'concept-id': self.concept_id},
+            'umm': {'Name': self.name},
+            'associations': {'collections': [{'concept_id': cid} for cid in self.collection_ids]},
+        }
+
+    def __repr__(self) -> str:
+        return f'VariableRecord({self.concept_id!r}, {self.name!r})'
+
+
+RECORD_TYPES = {'collections': CollectionRecord, 'granules': GranuleRecord, 'variables': VariableRecord}
+
+
+def compact_results(cmr_results: dict) -> dict:
+    """Copy of ``cmr_results`` with every UMM item replaced by its compact record."""
+    if not isinstance(cmr_results, dict):
+        return cmr_results
+    searches = []
+    for search in cmr_results.get('searches') or []:
+        search = dict(search)
+        for kind, record in RECORD_TYPES.items():
+            res = search.get(kind)
+            if isinstance(res, dict) and res.get('items'):
+                search[kind] = {
+                    **res,
+                    'items': [record.from_umm(i) if isinstance(i, dict) else i for i in res['items']],
+                }
+        searches.append(search)
+    return {**cmr_results, 'searches': searches}
+
+
+def umm_items(items: list) -> list:
+    """UMM-shaped dicts for a list that may hold compact records."""
+    return [i.to_umm() if hasattr(i, 'to_umm') else i for i in items or []]
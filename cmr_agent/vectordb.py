@@ -4,6 +4,7 @@ import os
 import chromadb
 from chromadb.config import Settings as ChromaSettings
 from cmr_agent.config import settings
+from cmr_agent.metrics import chroma_timer
 
 class ChromaStore:
     def __init__(self, collection_name: str = 'nasa_docs'):
@@ -14,11 +15,23 @@ class ChromaStore:
         )
         self.collection = self.client.get_or_create_collection(collection_name)
 
+    def warmup(self):
+        """Run one query so the embedding model is loaded before the first request."""
+        with chroma_timer('warmup'):
+            self.collection.query(query_texts=['warmup'], n_results=1)
+
+    def embed(self, text: str) -> List[float]:
+        """Embedding of ``text`` with the collection's embedding function."""
+        with chroma_timer('embed'):
+            return [float(x) for x in self.collection._embedding_function([text])[0]]
+
     def add_texts(self, ids: List[str], texts: List[str], metadatas: List[Dict[str, Any]] | None = None):
-        self.collection.add(ids=ids, documents=texts, metadatas=metadatas)
+        with chroma_timer('add'):
+            self.collection.add(ids=ids, documents=texts, metadatas=metadatas)
 
     def similarity_search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        res = self.collection.query(query_texts=[query], n_results=k)
+        with chroma_timer('query'):
+            res = self.collection.query(query_texts=[query], n_results=k)
         out: List[Dict[str, Any]] = []
         for ids, docs, metas in zip(res.get('ids', [[]])[0], res.get('documents', [[]])[0], res.get('metadatas', [[]])[0]):
             out.append({'id': ids, 'text': docs, 'metadata': metas})
@@ -1,8 +1,15 @@
 from __future__ import annotations
+import asyncio
+import time
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from cmr_agent.config import settings
 from cmr_agent.graph.pipeline import build_graph
+from cmr_agent.cmr.result_store import get_result_store
+from cmr_agent.metrics import REGISTRY
+from cmr_agent.streaming import HEARTBEAT, SSEEncoder
+from cmr_agent.resources import open_resources, close_resources
 
 
 SESSIONS: dict[str, list[str]] = {}
@@ -12,26 +19,72 @@ SESSIONS: dict[str, list[str]] = {}
 async def lifespan(app: FastAPI):
     global APP_GRAPH
     APP_GRAPH = build_graph()
-    yield
+    # LLM clients, vector store, CMR pool and knowledge graph, built and warmed once
+    await open_resources()
+    try:
+        yield
+    finally:
+        await close_resources()
 
 
 app = FastAPI(title='NASA CMR AI Agent', lifespan=lifespan)
 
-async def run_query_stream(user_query: str, session_id: str | None):
+async def run_query_stream(user_query: str, session_id: str | None, format: str = 'sse'):
     history = SESSIONS.get(session_id, []) if session_id else []
     state = {'user_query': user_query, 'history': history}
+    # Graph step events and in-flight progress events share one queue so both stream in order
+    events: asyncio.Queue = asyncio.Queue()
+    done = object()
+    sse = format != 'text'
+    encoder = SSEEncoder()
+    started = time.perf_counter()
+
+    async def drive():
+        config = {'configurable': {'progress': lambda snap: events.put_nowait({'progress': snap})}}
+        try:
+            async for event in APP_GRAPH.astream(state, config=config):
+                await events.put(event)
+        except Exception as e:
+            await events.put(e)
+        finally:
+            await events.put(done)
+
+    task = asyncio.ensure_future(drive())
     try:
-        async for event in APP_GRAPH.astream(state):
-            yield (str(event) + '\n').encode('utf-8')
-    except Exception as e:
-        yield (f"ERROR: {e}\n").encode('utf-8')
+        while True:
+            if sse:
+                try:
+                    event = await asyncio.wait_for(events.get(), settings.stream_heartbeat_seconds)
+                except asyncio.TimeoutError:
+                    yield HEARTBEAT
+                    continue
+            else:
+                event = await events.get()
+            if event is done:
+                if sse:
+                    yield encoder.done(duration_ms=int((time.perf_counter() - started) * 1000))
+                break
+            if not sse:
+                # Legacy plain-text mode: one repr per step
+                if isinstance(event, Exception):
+                    yield (f"ERROR: {event}\n").encode('utf-8')
+                else:
+                    yield (str(event) + '\n').encode('utf-8')
+            elif isinstance(event, Exception):
+                yield encoder.error(event)
+            elif 'progress' in event and len(event) == 1:
+                yield encoder.progress(event['progress'])
+            else:
+                for node, values in event.items():
+                    yield encoder.update(node, values)
     finally:
+        task.cancel()
         if session_id is not None:
             SESSIONS[session_id] = state.get('history', history)
 
 @app.get('/stream')
-async def stream(query: str, session_id: str | None = None):
-    return StreamingResponse(run_query_stream(query, session_id), media_type='text/event-stream')
+async def stream(query: str, session_id: str | None = None, format: str = 'sse'):
+    return StreamingResponse(run_query_stream(query, session_id, format), media_type='text/event-stream')
 
 @app.get('/query')
 async def query(query: str, session_id: str | None = None):
@@ -40,3 +93,16 @@ async def query(query: str, session_id: str | None = None):
     if session_id is not None:
         SESSIONS[session_id] = result.get('history', history)
     return result
+
+@app.get('/results/{handle}')
+async def results(handle: str):
+    """Raw CMR items behind a handle from ``cmr_results`` (kept for RESULT_STORE_TTL_SECONDS)."""
+    content = get_result_store().get_bytes(handle)
+    if content is None:
+        raise HTTPException(status_code=404, detail='Unknown or expired result handle')
+    return Response(content, media_type='application/json')
+
+@app.get('/metrics')
+async def metrics():
+    """Prometheus text exposition of node, CMR, LLM and Chroma latency metrics."""
+    return Response(REGISTRY.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
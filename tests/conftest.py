@@ -1,4 +1,15 @@
 import os, sys
+import pytest
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 os.environ.pop('OPENAI_API_KEY', None)
 os.environ.pop('ANTHROPIC_API_KEY', None)
+# Startup warmup would reach out to CMR and download the embedding model
+os.environ.setdefault('RESOURCES_WARMUP', 'false')
+
+
+@pytest.fixture(autouse=True)
+def _fresh_answer_cache():
+    """Answers cached by one test must not be served to the next one's mocks."""
+    yield
+    from cmr_agent.answer_cache import close_answer_cache
+    close_answer_cache()
@@ -197,3 +197,440 @@ async def test_planning_expands_synonyms():
         assert "rainfall" in terms
     else:
         assert any(t in terms for t in ["precipitation", "imerg", "trmm"])
+
+
+@pytest.mark.asyncio
+async def test_stage_dag_streams_dependencies_and_reports_critical_path():
+    import asyncio
+    from cmr_agent.agents.stage_dag import StageDAG
+
+    seen = []
+
+    async def produce(ctx):
+        await ctx.publish(1)
+        await asyncio.sleep(0.05)
+        await ctx.publish(2)
+        return 'done'
+
+    async def consume(ctx):
+        async for item in ctx.stream('collections'):
+            seen.append((item, ctx.dag._tasks['collections'].done()))
+        return await ctx.result('collections')
+
+    dag = StageDAG(
+        [
+            {'name': 'collections', 'type': 'produce', 'depends_on': []},
+            {'name': 'granules', 'type': 'consume', 'depends_on': ['collections']},
+        ],
+        {'produce': produce, 'consume': consume},
+    )
+    out = await dag.run()
+    assert out['results']['granules'] == 'done'
+    assert seen[0] == (1, False)  # consumed before the producer finished
+    assert out['report']['critical_path'] == ['collections', 'granules']
+
+    with pytest.raises(ValueError):
+        StageDAG(
+            [{'name': 'a', 'type': 'produce', 'depends_on': ['b']}, {'name': 'b', 'type': 'produce', 'depends_on': ['a']}],
+            {'produce': produce},
+        )
+
+
+@pytest.mark.asyncio
+async def test_planner_stages_run_each_search_once():
+    import httpx
+    from cmr_agent.agents.cmr_agent import CMRAgent
+    from cmr_agent.agents.planning_agent import PlanningAgent
+    from cmr_agent.cmr.client import AsyncCMRClient
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if 'collections' in request.url.path:
+            return httpx.Response(200, json={'hits': 1, 'items': [{'meta': {'concept-id': 'C1-P'}, 'umm': {}}]})
+        return httpx.Response(200, json={'hits': 0, 'items': []}, headers={'CMR-Hits': '0'})
+
+    http = httpx.AsyncClient(base_url='https://cmr.test', transport=httpx.MockTransport(handler))
+    client = AsyncCMRClient('https://cmr.test', http_client=http, cache=False)
+    client.singleflight = None
+    plan = await PlanningAgent().run('aerosol optical depth', [])
+    res = await CMRAgent(client=client).run('aerosol optical depth', plan)
+    assert len(res['searches']) == 1
+    assert calls.count('/search/variables.umm_json') == 1
+    assert calls.count('/search/collections.umm_json') == 1
+    assert res['stages']['critical_path'][-1] == 'granule_search'
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_variable_fanout_and_chunked_concept_id_lookups(monkeypatch):
+    import asyncio
+    import httpx
+    from cmr_agent.agents.cmr_agent import CMRAgent
+    from cmr_agent.cmr.client import AsyncCMRClient
+    from cmr_agent.config import settings
+
+    monkeypatch.setattr(settings, 'cmr_concept_id_chunk', 2)
+    monkeypatch.setattr(settings, 'cmr_max_query_length', 40)
+    requests = []
+
+    async def handler(request):
+        requests.append(request)
+        if 'variables' in request.url.path:
+            await asyncio.sleep(0.02)
+            term = request.url.params['keyword']
+            assocs = [{'concept_id': f'C{term}{i}-P'} for i in range(3)]
+            return httpx.Response(200, json={'hits': 1, 'items': [{'umm': {'Name': term}, 'associations': {'collections': assocs}}]})
+        return httpx.Response(200, json={'hits': 0, 'items': []}, headers={'CMR-Hits': '0'})
+
+    http = httpx.AsyncClient(base_url='https://cmr.test', transport=httpx.MockTransport(handler))
+    client = AsyncCMRClient('https://cmr.test', http_client=http, cache=False)
+    agent = CMRAgent(client=client)
+    res = await agent.run('rain', {'stages': [
+        {'name': 'vars', 'type': 'variable_search', 'query': 'rain', 'variable_terms': ['a', 'b', 'c']},
+        {'name': 'cols', 'type': 'collection_search', 'query': 'rain', 'depends_on': []},
+    ]})
+
+    assert res['searches'][0]['related_collection_ids'] == [f'C{t}{i}-P' for t in 'abc' for i in range(3)]
+    id_lookups = [r for r in requests if b'concept_id=' in r.content or 'concept_id' in r.url.params]
+    assert len(id_lookups) == 6  # 3 ids per variable in chunks of 2, no truncation
+    # two-id chunks exceed the query length limit and go out as POST forms
+    assert [r.method for r in id_lookups].count('POST') == 3
+    stage_entries = {e['stage']: e for e in res['query_log'] if e['endpoint'] == 'stage'}
+    assert stage_entries['vars']['max_parallelism'] == 3
+    assert res['stages']['stages']['cols']['max_parallelism'] >= 2
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_stratified_granule_sampling_estimates_coverage(monkeypatch):
+    from datetime import datetime, timedelta
+    import httpx
+    from cmr_agent.agents.analysis_agent import AnalysisAgent
+    from cmr_agent.agents.cmr_agent import CMRAgent
+    from cmr_agent.cmr.client import AsyncCMRClient
+    from cmr_agent.config import settings
+
+    monkeypatch.setattr(settings, 'cmr_granule_sampling', 'stratified')
+    monkeypatch.setattr(settings, 'cmr_sample_strata', 4)
+    monkeypatch.setattr(settings, 'cmr_sample_page_size', 3)
+    samples = []
+
+    def granule(start, days):
+        b = datetime.fromisoformat(start.replace('Z', '+00:00'))
+        fmt = '%Y-%m-%dT%H:%M:%SZ'
+        return {'umm': {'TemporalExtent': {'RangeDateTime': {
+            'BeginningDateTime': b.strftime(fmt), 'EndingDateTime': (b + timedelta(days=days)).strftime(fmt),
+        }}}}
+
+    def handler(request):
+        params = request.url.params
+        if 'collections' in request.url.path:
+            return httpx.Response(200, json={'hits': 1, 'items': [{'meta': {'concept-id': 'C1-P'}, 'umm': {}}]})
+        if params.get('page_size') == '3':
+            samples.append(params['temporal'])
+            start = params['temporal'].split(',')[0]
+            if start >= '2011-07':
+                return httpx.Response(200, json={'hits': 0, 'items': []})
+            return httpx.Response(200, json={'hits': 20, 'items': [granule(start, 1), granule(start, 5)]})
+        return httpx.Response(200, json={'hits': 0, 'items': []}, headers={'CMR-Hits': '0'})
+
+    http = httpx.AsyncClient(base_url='https://cmr.test', transport=httpx.MockTransport(handler))
+    client = AsyncCMRClient('https://cmr.test', http_client=http, cache=False)
+    res = await CMRAgent(client=client).run('rain 2010-2011', {'stages': [
+        {'name': 'cols', 'type': 'collection_search', 'query': 'rain 2010-2011'},
+        {'name': 'grans', 'type': 'granule_search', 'query': 'rain 2010-2011', 'depends_on': ['cols']},
+    ]})
+    await client.close()
+
+    assert len(samples) == 4
+    sample = res['searches'][0]['temporal_sample']
+    assert sample['empty_strata'] == 1
+    low, high = sample['ci95_pct']
+    assert low < sample['coverage_pct'] < high
+    # 20 granules of 3 days on average fill ~1/3 of each ~half-year stratum; one stratum is empty
+    assert sample['coverage_pct'] == pytest.approx(100 * 0.75 * 60 / 182.5, abs=1.0)
+
+    analysis = await AnalysisAgent().run(res)
+    entry = analysis['queries'][0]
+    assert entry['quality']['coverage']['temporal_pct'] == sample['coverage_pct']
+    assert entry['temporal_gaps'][0]['gap_start'].startswith('2011-07')
+    assert entry['temporal_sample']['sampled_granules'] == 6
+
+
+def test_granule_columns_parse_mixed_timestamps_and_boxes():
+    from cmr_agent.agents.granule_columns import GranuleColumns
+
+    def granule(begin, end, box=None):
+        umm = {'TemporalExtent': {'RangeDateTime': {'BeginningDateTime': begin, 'EndingDateTime': end}}}
+        if box:
+            keys = ('WestBoundingCoordinate', 'SouthBoundingCoordinate', 'EastBoundingCoordinate', 'NorthBoundingCoordinate')
+            umm['SpatialExtent'] = {'HorizontalSpatialDomain': {'Geometry': {'BoundingRectangles': [dict(zip(keys, box))]}}}
+        return {'umm': umm}
+
+    columns = GranuleColumns.from_granules([
+        granule('2020-01-10T00:00:00Z', '2020-01-12T00:00:00Z', (-10, -5, 5, 10)),
+        granule('2020-01-01T02:00:00+02:00', '2020-01-03T00:00:00Z', (-15, 0, 'bad', 12)),
+        granule('2020-01-20T00:00:00Z', '', ('-20', -8, 1, 2)),
+        granule('2020-01-12T00:00:00Z', '2020-01-15T00:00:00Z'),
+    ])
+    assert len(columns) == 3  # the granule without an end time is skipped
+    start, end = columns.temporal_extent()
+    assert start.isoformat() == '2020-01-01T00:00:00+00:00'
+    assert end.isoformat() == '2020-01-15T00:00:00+00:00'
+    assert columns.bbox_union() == [-20.0, -8.0, 5.0, 10.0]
+
+
+def test_coverage_accumulator_merges_overlapping_pages():
+    from cmr_agent.agents.coverage import CoverageAccumulator
+
+    def granule(begin, end):
+        return {'umm': {'TemporalExtent': {'RangeDateTime': {
+            'BeginningDateTime': f'2020-01-{begin:02d}T00:00:00Z', 'EndingDateTime': f'2020-01-{end:02d}T00:00:00Z',
+        }}}}
+
+    acc = CoverageAccumulator()
+    # A long granule nests the next one; sorting by start and comparing neighbours would report a false gap
+    acc.add_granules([granule(1, 10), granule(2, 3), granule(5, 6)])
+    acc.add_granules([granule(20, 22), granule(12, 14)])
+    assert acc.snapshot()['gaps'] == [
+        {'gap_start': '2020-01-10', 'gap_end': '2020-01-12', 'gap_days': '2'},
+        {'gap_start': '2020-01-14', 'gap_end': '2020-01-20', 'gap_days': '6'},
+    ]
+    # A later page bridging both gaps collapses everything into one interval
+    acc.add_granules([granule(9, 21)])
+    snap = acc.snapshot()
+    assert (snap['intervals'], snap['gaps'], snap['granules'], snap['pages']) == (1, [], 6, 3)
+    assert (snap['start'], snap['end']) == ('2020-01-01T00:00:00Z', '2020-01-22T00:00:00Z')
+
+    bounded = CoverageAccumulator(max_intervals=2)
+    bounded.add_granules([granule(1, 2), granule(3, 4), granule(10, 11)])
+    # Only the largest gap survives once the interval budget is exceeded
+    assert [g['gap_start'] for g in bounded.gaps()] == ['2020-01-04']
+    assert bounded.coalesced == 1
+
+
+@pytest.mark.asyncio
+async def test_granule_pages_stream_coverage_snapshots(monkeypatch):
+    import httpx
+    from cmr_agent.agents.cmr_agent import CMRAgent
+    from cmr_agent.cmr.client import AsyncCMRClient
+    from cmr_agent.config import settings
+
+    monkeypatch.setattr(settings, 'cmr_granules_per_collection', 4)
+
+    def granule(day):
+        return {'umm': {'TemporalExtent': {'RangeDateTime': {
+            'BeginningDateTime': f'2020-01-{day:02d}T00:00:00Z', 'EndingDateTime': f'2020-01-{day + 1:02d}T00:00:00Z',
+        }}}}
+
+    def handler(request):
+        params = request.url.params
+        if 'collections' in request.url.path:
+            return httpx.Response(200, json={'hits': 1, 'items': [{'meta': {'concept-id': 'C1-P'}, 'umm': {}}]})
+        if params.get('page_size') != '2':
+            return httpx.Response(200, json={'hits': 4, 'items': []}, headers={'CMR-Hits': '4'})
+        if request.headers.get('CMR-Search-After'):
+            return httpx.Response(200, json={'hits': 4, 'items': [granule(10), granule(11)]})
+        return httpx.Response(200, json={'hits': 4, 'items': [granule(1), granule(2)]}, headers={'CMR-Search-After': 't1'})
+
+    monkeypatch.setattr(settings, 'cmr_page_size', 2)
+    http = httpx.AsyncClient(base_url='https://cmr.test', transport=httpx.MockTransport(handler))
+    client = AsyncCMRClient('https://cmr.test', http_client=http, cache=False)
+    agent = CMRAgent(client=client)
+    snapshots = []
+    agent.progress = snapshots.append
+    res = await agent.run('rain', {'stages': [
+        {'name': 'cols', 'type': 'collection_search', 'query': 'rain'},
+        {'name': 'grans', 'type': 'granule_search', 'query': 'rain', 'depends_on': ['cols']},
+    ]})
+    await client.close()
+
+    coverage = [s for s in snapshots if s['event'] == 'coverage']
+    assert [(s['granules'], s['intervals']) for s in coverage] == [(2, 1), (4, 2)]
+    assert {s['endpoint'] for s in snapshots if s['event'] == 'cmr_call'} >= {'collections', 'granules'}
+    final = res['searches'][0]['coverage']
+    assert final['gaps'] == [{'gap_start': '2020-01-03', 'gap_end': '2020-01-10', 'gap_days': '7'}]
+
+
+@pytest.mark.asyncio
+async def test_spatial_pct_uses_footprints_across_antimeridian():
+    from cmr_agent.agents.analysis_agent import AnalysisAgent
+    from cmr_agent.agents.footprints import granule_footprints
+
+    def granule(geometry):
+        return {'umm': {'SpatialExtent': {'HorizontalSpatialDomain': {'Geometry': geometry}}}}
+
+    rect = {'WestBoundingCoordinate': 170, 'SouthBoundingCoordinate': -10, 'EastBoundingCoordinate': -170, 'NorthBoundingCoordinate': 10}
+    swath = [(175, 20), (-175, 20), (-175, 30), (175, 30), (175, 20)]
+    grans = [
+        granule({'BoundingRectangles': [rect]}),
+        granule({'GPolygons': [{'Boundary': {'Points': [{'Longitude': x, 'Latitude': y} for x, y in swath]}}]}),
+    ]
+    # Both footprints are split at the antimeridian instead of wrapping the globe
+    footprints = granule_footprints(grans)
+    assert len(footprints) == 4
+    assert max(f.bounds[2] - f.bounds[0] for f in footprints) == 10
+
+    res = {'searches': [{'query': 'q', 'collections': {'items': []}, 'granules': {'items': grans}, 'variables': {'items': []}}]}
+    analysis = await AnalysisAgent().run(res, bbox_constraint=(170.0, -10.0, -170.0, 30.0))
+    coverage = analysis['queries'][0]['quality']['coverage']
+    # 500 of 800 square degrees; equal-area weighting favours the covered equatorial band
+    assert coverage['spatial_pct'] == pytest.approx(63.3, abs=0.5)
+    assert coverage['spatial_footprints'] == 4
+
+
+@pytest.mark.asyncio
+async def test_compact_records_preserve_analysis():
+    from cmr_agent.agents.analysis_agent import AnalysisAgent
+    from cmr_agent.types import GranuleRecord, compact_results
+
+    collection = {
+        'meta': {'concept-id': 'C1-P', 'provider-id': 'P', 'revision-id': 3},
+        'umm': {
+            'ShortName': 'GPM_3IMERGHH', 'LongName': 'IMERG', 'Abstract': 'x' * 2000,
+            'Platforms': [{'ShortName': 'GPM', 'Instruments': [{'ShortName': 'DPR'}, {'LongName': 'GMI'}]}],
+            'AdditionalAttributes': [{'Name': 'Spatial Resolution', 'Values': ['10']}, {'Name': 'other', 'Values': ['x']}],
+        },
+    }
+    granules = [
+        {
+            'meta': {'concept-id': f'G{i}-P', 'collection-concept-id': 'C1-P'},
+            'umm': {
+                'TemporalExtent': {'RangeDateTime': {'BeginningDateTime': f'2020-01-0{i}T00:00:00Z', 'EndingDateTime': f'2020-01-0{i}T12:00:00Z'}},
+                'SpatialExtent': {'HorizontalSpatialDomain': {'Geometry': {'BoundingRectangles': [
+                    {'WestBoundingCoordinate': -10 * i, 'SouthBoundingCoordinate': -5, 'EastBoundingCoordinate': 5, 'NorthBoundingCoordinate': 10},
+                ]}}},
+                'RelatedUrls': [{'URL': f'https://example.test/{i}', 'Type': 'GET DATA'}],
+            },
+        }
+        for i in (1, 2, 4)
+    ]
+    variable = {'meta': {'concept-id': 'V1-P'}, 'umm': {'Name': 'precipitation'}, 'associations': {'collections': [{'concept_id': 'C1-P'}]}}
+    raw = {'searches': [{
+        'query': 'rain',
+        'collections': {'items': [collection], 'hits': 1},
+        'granules': {'items': granules, 'hits': 3},
+        'variables': {'items': [variable]},
+    }]}
+    compact = compact_results(raw)
+    items = compact['searches'][0]['granules']['items']
+    assert isinstance(items[0], GranuleRecord) and not hasattr(items[0], '__dict__')
+    assert repr(items[0]) == "GranuleRecord('G1-P')"
+    assert raw['searches'][0]['granules']['items'][0] is granules[0]  # the input is not mutated
+
+    bbox = (-30.0, -10.0, 10.0, 20.0)
+    assert await AnalysisAgent().run(compact, bbox_constraint=bbox) == await AnalysisAgent().run(raw, bbox_constraint=bbox)
+
+
+@pytest.mark.asyncio
+async def test_analysis_offloads_to_thread_and_process_workers():
+    from cmr_agent.agents.analysis_agent import AnalysisAgent, shutdown_executors
+
+    grans = [
+        {'meta': {'concept-id': f'G{d}-P'}, 'umm': {'TemporalExtent': {'RangeDateTime': {
+            'BeginningDateTime': f'2020-01-{d:02d}T00:00:00Z', 'EndingDateTime': f'2020-01-{d:02d}T12:00:00Z',
+        }}}}
+        for d in (1, 2, 5)
+    ]
+    res = {'searches': [{'query': 'q', 'collections': {'items': []}, 'granules': {'items': grans}, 'variables': {'items': []}}]}
+    try:
+        inline = AnalysisAgent(mode='process')  # below the size threshold: stays inline
+        expected = await inline.run(res)
+        assert inline.timing['mode'] == 'inline'
+        for mode in ('thread', 'process'):
+            agent = AnalysisAgent(mode=mode, offload_min_items=1)
+            assert await agent.run(res) == expected
+            assert agent.timing['mode'] == mode and agent.timing['items'] == 3
+            assert agent.timing['queue_ms'] >= 0 and agent.timing['compute_ms'] >= 0
+    finally:
+        shutdown_executors()
+    with pytest.raises(ValueError):
+        AnalysisAgent(mode='gpu')
+
+
+def test_knowledge_graph_persists_and_links_collections(tmp_path):
+    from cmr_agent.knowledge_graph import KnowledgeGraph
+
+    def collection(cid, platform, instrument):
+        return {
+            "meta": {"concept-id": cid},
+            "umm": {"Platforms": [{"ShortName": platform, "Instruments": [{"ShortName": instrument}]}]},
+        }
+
+    first = {"searches": [{
+        "collections": {"items": [collection("C1", "GPM", "DPR"), collection("C1", "GPM", "DPR")]},
+        "variables": {"items": [{"umm": {"Name": "precip"}, "associations": {"collections": [{"concept_id": "C1"}]}}]},
+    }]}
+    second = {"searches": [{"collections": {"items": [collection("C2", "GPM", "DPR"), collection("C3", "Aqua", "MODIS")]}}]}
+
+    path = str(tmp_path / "kg.sqlite")
+    graph = KnowledgeGraph(path)
+    assert graph.ingest(first) == 4
+    assert graph.ingest(first) == 0
+    graph.close()
+
+    graph = KnowledgeGraph(path)
+    graph.ingest(second)
+    assert graph.related_collections("C2") == {"DPR": ["C1"]}
+    assert graph.related_collections("C3") == {}
+    assert graph.neighbors(("platform", "GPM"), "instrument") == {("instrument", "DPR")}
+    assert graph.links_for(["C2"]) == [
+        {"collection": "C2", "instrument": "DPR", "relates_to": "C1", "relation": "shares_instrument"}
+    ]
+    exported = graph.export()
+    assert exported["nodes"]["collections"] == ["C1", "C2", "C3"]
+    assert len(exported["edges"]) == len({(e["source"], e["target"], e["type"]) for e in exported["edges"]})
+    graph.close()
+
+
+@pytest.mark.asyncio
+async def test_graph_fans_out_and_reuses_speculative_collection_search(monkeypatch):
+    import asyncio
+    from cmr_agent.agents.cmr_agent import CMRAgent
+
+    searched = asyncio.Event()
+    collection_calls = []
+
+    class DummyClient:
+        async def search_collections(self, params):
+            collection_calls.append(params)
+            searched.set()
+            return {"hits": 1, "items": [{"meta": {"concept-id": "C1"}, "umm": {"ShortName": "GPM_3IMERGDF"}}]}
+
+        async def search_granules(self, params):
+            return {"items": []}
+
+        async def search_variables(self, params):
+            return {"items": []}
+
+    class CountingCMR(CMRAgent):
+        def __init__(self):
+            super().__init__(DummyClient())
+
+    class SlowIntent:
+        # Only returns once the speculative collection search has gone out
+        async def run(self, query):
+            await asyncio.wait_for(searched.wait(), 2)
+            return "specific", [query]
+
+    class DummyRetrievalAgent:
+        def __init__(self, *args, **kwargs):
+            self.store = type("S", (), {"similarity_search": lambda self, q, k=5: []})()
+
+    monkeypatch.setattr(pipeline, "CMRAgent", CountingCMR)
+    monkeypatch.setattr(pipeline, "IntentAgent", type("I", (SlowIntent, pipeline.IntentAgent), {}))
+    monkeypatch.setattr(pipeline, "RetrievalAgent", DummyRetrievalAgent)
+
+    res = await pipeline.build_graph().ainvoke({"user_query": "find precipitation datasets"})
+    assert res["intent"] == "specific"
+    assert res["validation"]["feasible"] is True
+    assert set(res["branch_timings"]) == {
+        "intent_step", "validation_step", "planning_step", "retrieval_step", "speculate_step"
+    }
+    keyword_calls = [p for p in collection_calls if p.get("keyword") == "find precipitation datasets"]
+    assert len(keyword_calls) == 1
+    assert res["cmr_results"]["stages"]["speculative_requests"] == 1
+    assert any(q["params"].get("speculative") for q in res["cmr_queries"])
+    assert res["speculative"] == {}
@@ -0,0 +1,364 @@
+import json
+import httpx
+import pytest
+from cmr_agent.cmr.cache import ResponseCache, cache_key
+from cmr_agent.cmr.client import AsyncCMRClient
+
+
+def make_client(handler, **kwargs):
+    http = httpx.AsyncClient(base_url='https://cmr.test', transport=httpx.MockTransport(handler))
+    return AsyncCMRClient('https://cmr.test', http_client=http, **kwargs)
+
+
+def test_cache_key_ignores_param_and_concept_id_order():
+    a = cache_key('collections', {'keyword': 'rain', 'concept_id': ['C2-X', 'C1-X'], 'page_size': 25})
+    b = cache_key('collections', {'page_size': 25, 'concept_id': ['C1-X', 'C2-X'], 'keyword': 'rain'})
+    assert a == b
+    assert a != cache_key('granules', {'keyword': 'rain', 'concept_id': ['C1-X', 'C2-X'], 'page_size': 25})
+
+
+def test_cache_evicts_least_recently_used_by_bytes():
+    cache = ResponseCache(max_bytes=10)
+    cache.set('collections', {'q': 1}, b'aaaa')
+    cache.set('collections', {'q': 2}, b'bbbb')
+    assert cache.get('collections', {'q': 1}) == b'aaaa'
+    cache.set('collections', {'q': 3}, b'cccc')
+    assert cache.get('collections', {'q': 2}) is None
+    assert cache.get('collections', {'q': 1}) == b'aaaa'
+    stats = cache.stats()
+    assert stats['evictions'] == 1
+    assert stats['bytes'] == 8
+
+
+def test_cache_disk_tier_survives_restart(tmp_path):
+    cache = ResponseCache(disk_dir=str(tmp_path))
+    cache.set('variables', {'keyword': 'rain'}, b'{"items": []}')
+    reopened = ResponseCache(disk_dir=str(tmp_path))
+    assert reopened.get('variables', {'keyword': 'rain'}) == b'{"items": []}'
+    assert reopened.stats()['disk_hits'] == 1
+
+
+@pytest.mark.asyncio
+async def test_client_serves_repeated_searches_from_cache():
+    calls = []
+
+    def handler(request):
+        calls.append(str(request.url))
+        return httpx.Response(200, content=json.dumps({'hits': 1, 'items': [{'meta': {}}]}).encode())
+
+    client = make_client(handler, cache=ResponseCache(ttls={'granules': 0}))
+    first = await client.search_collections({'keyword': 'rain', 'page_size': 25})
+    first['items'].clear()
+    second = await client.search_collections({'page_size': 25, 'keyword': 'rain'})
+    assert second['items'] == [{'meta': {}}]
+    assert len(calls) == 1
+    await client.search_granules({'keyword': 'rain'})
+    await client.search_granules({'keyword': 'rain'})
+    assert len(calls) == 3
+    assert client.stats()['cache']['hits'] == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_searches_share_one_request():
+    import asyncio
+
+    calls = []
+
+    async def handler(request):
+        calls.append(str(request.url))
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={'hits': 0, 'items': []})
+
+    client = make_client(handler, cache=False)
+    results = await asyncio.gather(
+        *(client.search_collections({'keyword': 'aerosol', 'page_size': 25}) for _ in range(5)),
+        client.search_variables({'keyword': 'aerosol', 'page_size': 25}),
+    )
+    assert all(r == {'hits': 0, 'items': []} for r in results)
+    assert results[0] is not results[1]
+    assert len(calls) == 2
+    stats = client.stats()['singleflight']
+    assert stats['coalesced'] == 4
+    assert stats['inflight'] == 0
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_iter_granules_follows_search_after_pages():
+    seen_tokens = []
+
+    def handler(request):
+        token = request.headers.get('CMR-Search-After')
+        seen_tokens.append(token)
+        page = 0 if token is None else int(token)
+        items = [{'meta': {'concept-id': f'G{page * 2 + i}'}} for i in range(2)]
+        return httpx.Response(
+            200,
+            json={'hits': 5, 'items': items[: 5 - page * 2]},
+            headers={'CMR-Hits': '5', 'CMR-Search-After': str(page + 1)},
+        )
+
+    client = make_client(handler, cache=False)
+    ids = [g['meta']['concept-id'] async for g in client.iter_granules({'page_size': 2})]
+    assert ids == ['G0', 'G1', 'G2', 'G3', 'G4']
+    assert seen_tokens == [None, '1', '2']
+
+    pages = [p async for p in client.iter_pages('granules', {}, max_items=3, page_size=2)]
+    assert [len(p['items']) for p in pages] == [2, 1]
+    assert pages[-1]['search_after'] == '2'
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter_caps_concurrency_and_backs_off():
+    import asyncio
+    from cmr_agent.cmr.limiter import AdaptiveLimiter
+
+    limiter = AdaptiveLimiter(initial=2, max_limit=4, latency_target=10.0, cooldown=0.0)
+    peak = {'now': 0, 'max': 0}
+
+    async def call():
+        await limiter.acquire()
+        peak['now'] += 1
+        peak['max'] = max(peak['max'], peak['now'])
+        await asyncio.sleep(0.01)
+        peak['now'] -= 1
+        limiter.release(0.01, 200)
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak['max'] == 2
+    grown = limiter.limit
+    assert grown > 2
+    limiter.inflight += 1
+    limiter.release(0.01, 429)
+    assert limiter.limit == pytest.approx(grown / 2)
+    assert limiter.stats()['throttled'] == 1
+    assert limiter.stats()['queue_wait_ms_total'] > 0
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_spaces_requests():
+    import time
+    from cmr_agent.cmr.limiter import TokenBucket
+
+    bucket = TokenBucket(rate=100.0, burst=1)
+    started = time.monotonic()
+    for _ in range(3):
+        await bucket.acquire()
+    assert time.monotonic() - started >= 0.015
+
+
+def test_circuit_breaker_half_open_probe_cycle(monkeypatch):
+    from cmr_agent.cmr import circuit
+
+    now = {'t': 100.0}
+    monkeypatch.setattr(circuit.time, 'monotonic', lambda: now['t'])
+    breaker = circuit.CircuitBreaker(failure_threshold=2, recovery_time_seconds=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == circuit.OPEN
+    assert breaker.allow() is False
+
+    now['t'] += 11
+    assert breaker.allow() is True
+    assert breaker.state == circuit.HALF_OPEN
+    assert breaker.allow() is False  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == circuit.OPEN
+
+    now['t'] += 11
+    assert breaker.allow() is True
+    breaker.record_success()
+    assert breaker.state == circuit.CLOSED
+    assert breaker.stats()['trips'] == 2
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_and_client_errors_fail_fast():
+    import time
+    from cmr_agent.cmr.circuit import CircuitOpenError
+
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(400 if 'variables' in request.url.path else 200, json={'items': []})
+
+    client = make_client(handler, cache=False)
+    with pytest.raises(httpx.HTTPStatusError):
+        await client.search_variables({'keyword': 'rain'})
+    assert calls == ['/search/variables.umm_json']
+
+    client.breakers.for_endpoint('granules')._trip()
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        await client.search_granules({'keyword': 'rain'})
+    assert time.monotonic() - started < 0.2
+    # other endpoints keep working while granules is open
+    assert await client.search_collections({'keyword': 'rain'}) == {'items': []}
+    assert client.stats()['breakers']['granules']['state'] == 'open'
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_hedger_duplicates_slow_calls_within_budget():
+    import asyncio
+    from cmr_agent.cmr.hedging import Hedger
+
+    hedger = Hedger(percentile=0.5, budget=0.5)
+    for _ in range(20):
+        hedger.tracker.record('granules', 0.01)
+    hedger.requests = 2
+    attempts = []
+
+    async def call():
+        attempts.append(len(attempts))
+        await asyncio.sleep(1.0 if len(attempts) == 1 else 0.01)
+        return len(attempts)
+
+    result = await asyncio.wait_for(hedger.run('granules', call), timeout=0.5)
+    assert result == 2
+    assert hedger.stats()['hedges_sent'] == 1
+    assert hedger.stats()['hedges_won'] == 1
+
+    hedger.budget = 0.0
+    attempts.clear()
+    await hedger.run('granules', call)
+    assert len(attempts) == 1
+
+
+@pytest.mark.asyncio
+async def test_hit_probes_fill_real_granule_totals():
+    from cmr_agent.agents.cmr_agent import CMRAgent
+    from cmr_agent.agents.analysis_agent import AnalysisAgent
+
+    granule_page_sizes = []
+
+    def handler(request):
+        path = request.url.path
+        if 'collections' in path:
+            return httpx.Response(200, json={'hits': 40, 'items': [{'meta': {'concept-id': 'C1-P'}, 'umm': {}}]})
+        if 'variables' in path:
+            return httpx.Response(200, json={'hits': 0, 'items': []})
+        size = int(request.url.params['page_size'])
+        granule_page_sizes.append(size)
+        items = [{'meta': {'concept-id': f'G{i}'}, 'umm': {}} for i in range(min(size, 3))]
+        return httpx.Response(200, json={'hits': 12000, 'items': items}, headers={'CMR-Hits': '12000'})
+
+    client = make_client(handler, cache=False)
+    agent = CMRAgent(client=client)
+    plan = {'stages': [{'name': 'collection_search', 'query': 'aerosol'}]}
+    res = await agent.run('aerosol', plan)
+    assert 0 in granule_page_sizes
+    stage = res['searches'][0]
+    assert stage['granules']['hits'] == 12000
+    assert any(e['page_size'] == 0 and e['total_hits'] == 12000 for e in res['query_log'])
+
+    summary = await AnalysisAgent().run(res)
+    assert summary['total_granules'] == 12000
+    assert summary['queries'][0]['granules_fetched'] == 3
+    assert summary['total_hits']['collections'] == 40
+    await client.close()
+
+
+def facet_body(tree):
+    return {'feed': {'entry': [], 'facets': {'title': 'Browse Granules', 'children': [
+        {'title': 'Temporal', 'type': 'group', 'children': [{'title': 'Year', 'type': 'group', 'children': tree}]}
+    ]}}}
+
+
+@pytest.mark.asyncio
+async def test_temporal_histogram_drills_down_with_facets():
+    from cmr_agent.cmr.facets import temporal_histogram
+
+    years = [{'title': '2018', 'type': 'filter', 'count': 24}, {'title': '2020', 'type': 'filter', 'count': 11}]
+
+    def handler(request):
+        assert request.url.path == '/search/granules.json'
+        year = request.url.params.get('temporal_facet[0][year]')
+        if year is None:
+            return httpx.Response(200, json=facet_body(years))
+        months = range(1, 13) if year == '2018' else [m for m in range(1, 13) if m != 6]
+        node = {'title': year, 'type': 'filter', 'count': 1, 'children': [{'title': 'Month', 'type': 'group', 'children': [
+            {'title': str(m), 'type': 'filter', 'count': 2 if year == '2018' else 1} for m in months
+        ]}]}
+        return httpx.Response(200, json=facet_body([node]))
+
+    client = make_client(handler, cache=False)
+    hist = await temporal_histogram(
+        client, {'collection_concept_id': 'C1-P'},
+        window=('2018-01-01T00:00:00Z', '2020-12-31T23:59:59Z'), resolution='month',
+    )
+    assert hist['requests'] == 3
+    assert hist['resolution'] == 'month'
+    assert hist['total'] == 24 + 11
+    assert hist['counts']['2020-05'] == 1 and hist['counts']['2020-06'] == 0
+    assert [(g['gap_start'], g['gap_end']) for g in hist['gaps']] == [
+        ('2019-01-01', '2020-01-01'),
+        ('2020-06-01', '2020-07-01'),
+    ]
+    assert hist['coverage_pct'] == round(100 * 23 / 36, 1)
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_refresh_fetches_only_updates_and_deletions(tmp_path, monkeypatch):
+    from cmr_agent.config import settings
+
+    monkeypatch.setattr(settings, 'cmr_delta_dir', str(tmp_path))
+    requests = []
+
+    def granule(gid, rev):
+        return {'meta': {'concept-id': gid, 'revision-id': rev}, 'umm': {}}
+
+    def handler(request):
+        params = request.url.params
+        requests.append((request.url.path, dict(params)))
+        if request.url.path == '/search/deleted-granules.json':
+            return httpx.Response(200, json=[{'concept-id': 'G2-P', 'parent-collection-id': 'C1-P'}])
+        if params.get('page_size') == '0':
+            return httpx.Response(200, json={'hits': 3, 'items': []}, headers={'CMR-Hits': '3'})
+        if 'updated_since' in params:
+            return httpx.Response(200, json={'hits': 2, 'items': [granule('G1-P', 2), granule('G4-P', 1)]})
+        return httpx.Response(200, json={'hits': 3, 'items': [granule(f'G{i}-P', 1) for i in (1, 2, 3)]})
+
+    params = {'collection_concept_id': 'C1-P', 'page_size': 10}
+    client = make_client(handler, cache=False)
+    first = await client.refresh('granules', params)
+    assert first['refresh']['mode'] == 'full'
+    await client.close()
+
+    # A new client picks up the snapshot from disk and only asks for what changed
+    requests.clear()
+    client = make_client(handler, cache=False)
+    second = await client.refresh('granules', params)
+    assert second['refresh']['mode'] == 'delta'
+    assert second['refresh']['since'] == first['refresh']['synced_at']
+    assert [g['meta']['concept-id'] for g in second['items']] == ['G1-P', 'G3-P', 'G4-P']
+    assert second['items'][0]['meta']['revision-id'] == 2
+    assert second['hits'] == 3
+    assert len(requests) == 3
+    deleted = [p for path, p in requests if path == '/search/deleted-granules.json'][0]
+    assert deleted == {'revision_date': first['refresh']['synced_at'] + ',', 'collection_concept_id': 'C1-P'}
+    assert client.stats()['delta']['deleted'] == 1
+    await client.close()
+
+
+@pytest.mark.asyncio
+async def test_lookup_fetches_full_records_by_concept_id(monkeypatch):
+    from cmr_agent.config import settings
+
+    monkeypatch.setattr(settings, 'cmr_concept_id_chunk', 2)
+    requested = []
+
+    def handler(request):
+        ids = request.url.params.get_list('concept_id')
+        requested.append(ids)
+        return httpx.Response(200, json={'hits': len(ids), 'items': [{'meta': {'concept-id': cid}, 'umm': {}} for cid in ids]})
+
+    client = make_client(handler, cache=False)
+    items = await client.lookup('granules', ['G1-P', 'G2-P', 'G1-P', 'G3-P'])
+    assert [i['meta']['concept-id'] for i in items] == ['G1-P', 'G2-P', 'G3-P']
+    assert sorted(requested) == [['G1-P', 'G2-P'], ['G3-P']]
+    await client.close()
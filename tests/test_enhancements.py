@@ -70,3 +70,333 @@ def test_planning_stage_present_in_graph():
     # compiled graph has agraph attribute; ensure node exists in config string
     text = str(graph)
     assert 'planning_step' in text
+
+
+def test_lifespan_shares_pooled_cmr_client():
+    from cmr_agent.cmr import client as cmr_client
+
+    with TestClient(m.app):
+        shared = cmr_client.get_shared_client()
+        assert shared is not None
+        agent = pipeline.CMRAgent()
+        assert agent.client is shared
+        assert agent._owns_client is False
+        assert shared.pool_stats()['open'] == 0
+    assert cmr_client.get_shared_client() is None
+
+
+def test_lifespan_registry_injects_shared_resources(monkeypatch):
+    from cmr_agent import resources
+
+    stores = []
+
+    class DummyRetrievalAgent:
+        def __init__(self, *args, store=None, **kwargs):
+            stores.append(store)
+            self.store = type('S', (), {'similarity_search': lambda self, q, k=5: []})()
+
+    monkeypatch.setattr(pipeline, 'RetrievalAgent', DummyRetrievalAgent)
+    # The repeated query must run the graph twice
+    monkeypatch.setattr(pipeline.settings, 'answer_cache_enabled', False)
+
+    with TestClient(m.app) as client:
+        registry = resources.get_resources()
+        assert registry is not None and registry.store is not None
+        client.get('/query', params={'query': 'social security'})
+        client.get('/query', params={'query': 'social security'})
+        assert stores == [registry.store, registry.store]
+        assert pipeline.CMRAgent().client is registry.cmr_client
+    assert resources.get_resources() is None
+
+
+def test_resources_warmup_opens_connections_and_loads_embeddings():
+    import asyncio
+    import httpx
+    from cmr_agent.cmr.client import AsyncCMRClient
+    from cmr_agent.resources import Resources
+
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, headers={'CMR-Hits': '10'}, json={'items': []})
+
+    class DummyStore:
+        warmed = 0
+
+        def warmup(self):
+            DummyStore.warmed += 1
+
+    async def run():
+        registry = Resources()
+        http = httpx.AsyncClient(base_url='https://cmr.test', transport=httpx.MockTransport(handler))
+        registry.cmr_client = AsyncCMRClient('https://cmr.test', http_client=http)
+        registry.store = DummyStore()
+        report = await registry.warmup()
+        await registry.cmr_client.close()
+        return report
+
+    report = asyncio.run(run())
+    assert report['cmr']['ok'] and report['cmr']['result'] == 4
+    assert report['embeddings']['ok'] and DummyStore.warmed == 1
+    assert all(r.url.params['page_size'] == '0' for r in requests)
+
+
+def test_stream_emits_sse_json_deltas_progress_and_heartbeats(monkeypatch):
+    import asyncio
+    import json
+    from cmr_agent.config import settings
+
+    class DummyRetrievalAgent:
+        def __init__(self, *args, **kwargs):
+            self.store = type('S', (), {'similarity_search': lambda self, q, k=5: []})()
+
+    class DummyCMR:
+        progress = None
+
+        def prime(self, speculative):
+            pass
+
+        async def speculate(self, query):
+            return {}
+
+        async def run(self, query, plan):
+            self.progress({'event': 'coverage', 'granules': 2, 'gaps': [{'gap_start': 'a'}, {'gap_start': 'b'}]})
+            await asyncio.sleep(0.1)
+            return {'searches': [{
+                'query': query,
+                'collections': {'hits': 1, 'items': [{'meta': {'concept-id': 'C1'}, 'umm': {'ShortName': 'X', 'Abstract': 'X' * 1000}}]},
+                'granules': {'items': []},
+                'variables': {'items': []},
+            }]}
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(pipeline, 'RetrievalAgent', DummyRetrievalAgent)
+    monkeypatch.setattr(pipeline, 'CMRAgent', DummyCMR)
+    monkeypatch.setattr(settings, 'stream_heartbeat_seconds', 0.02)
+
+    with TestClient(m.app) as client:
+        with client.stream('GET', '/stream', params={'query': 'find rain datasets'}) as r:
+            body = r.read().decode('utf-8')
+
+    assert ': heartbeat' in body
+    frames = []
+    for block in body.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if lines:
+            frames.append((lines['event'], json.loads(lines['data'])))
+    events = [e for e, _ in frames]
+    assert events[-1] == 'done'
+    progress = next(d for e, d in frames if e == 'progress')
+    assert progress['gap_count'] == 2 and 'gaps' not in progress
+    updates = [d for e, d in frames if e == 'update']
+    cmr = next(u for u in updates if u['node'] == 'cmr_step')['changed']['cmr_results']
+    search = cmr['searches'][0]
+    assert search['query'] == 'find rain datasets'
+    assert [(search[k]['items'], search[k]['hits']) for k in ('collections', 'granules', 'variables')] == [
+        (1, 1), (0, None), (0, None)
+    ]
+    assert 'X' * 1000 not in body
+    # Unchanged keys are not re-sent by later steps
+    assert sum('history' in u['changed'] for u in updates) == 1
+
+
+def test_raw_cmr_results_live_in_result_store(monkeypatch):
+    class DummyRetrievalAgent:
+        def __init__(self, *args, **kwargs):
+            self.store = type('S', (), {'similarity_search': lambda self, q, k=5: []})()
+
+    class DummyCMR:
+        async def run(self, query, plan):
+            return {'searches': [{
+                'query': query,
+                'collections': {'hits': 1, 'items': [{'meta': {'concept-id': 'C1-P'}, 'umm': {'ShortName': 'GPM'}}]},
+                'granules': {'items': []},
+                'variables': {'items': []},
+            }]}
+
+        async def close(self):
+            pass
+
+    monkeypatch.setattr(pipeline, 'RetrievalAgent', DummyRetrievalAgent)
+    monkeypatch.setattr(pipeline, 'CMRAgent', DummyCMR)
+
+    with TestClient(m.app) as client:
+        body = client.get('/query', params={'query': 'find rain datasets'}).json()
+        block = body['cmr_results']['searches'][0]['collections']
+        assert 'items' not in block and block['count'] == 1
+        # Analysis read the items back out of the store
+        assert body['analysis']['total_collections'] == 1
+        raw = client.get(f"/results/{block['handle']}")
+        assert raw.json() == [{'meta': {'concept-id': 'C1-P'}, 'umm': {'ShortName': 'GPM'}}]
+        assert client.get('/results/missing-1-granules').status_code == 404
+
+
+def test_result_store_spills_to_disk_and_expires(tmp_path):
+    from cmr_agent.cmr.result_store import ResultStore, resolve_results, store_results
+
+    store = ResultStore(max_bytes=200, ttl=60, spill_dir=str(tmp_path))
+    results = store_results(store, 'r1', {'searches': [{
+        'collections': {'items': [{'id': i, 'pad': 'x' * 50} for i in range(3)], 'hits': 3},
+        'granules': {'items': [{'id': 'g'}]},
+    }]})
+    assert store.stats()['spilled'] == 1 and list(tmp_path.iterdir())
+    resolved = resolve_results(results, store)['searches'][0]
+    assert [c['id'] for c in resolved['collections']['items']] == [0, 1, 2]
+    assert resolved['granules']['items'] == [{'id': 'g'}]
+    assert store.stats()['disk_reads'] == 1
+
+    store.release('r1')
+    assert store.get(results['searches'][0]['granules']['handle']) is None
+    assert not list(tmp_path.iterdir())
+
+    expiring = ResultStore(ttl=0)
+    handle = expiring.put('r2', 'granules', [1])
+    assert expiring.get(handle) is None
+
+
+def test_perf_breakdown_and_prometheus_metrics(monkeypatch):
+    import httpx
+    from cmr_agent.agents.cmr_agent import CMRAgent
+    from cmr_agent.cmr.client import AsyncCMRClient
+
+    attempts = {'collections': 0}
+
+    def handler(request):
+        if 'collections' in request.url.path:
+            attempts['collections'] += 1
+            # First attempt fails with a retryable status
+            if attempts['collections'] == 1:
+                return httpx.Response(503)
+            return httpx.Response(200, json={'hits': 0, 'items': []})
+        return httpx.Response(200, json={'hits': 0, 'items': []})
+
+    http = httpx.AsyncClient(base_url='https://cmr.test', transport=httpx.MockTransport(handler))
+
+    class MockedCMR(CMRAgent):
+        def __init__(self):
+            super().__init__(AsyncCMRClient('https://cmr.test', http_client=http, cache=False))
+
+    class DummyRetrievalAgent:
+        def __init__(self, *args, **kwargs):
+            self.store = type('S', (), {'similarity_search': lambda self, q, k=5: []})()
+
+    monkeypatch.setattr(pipeline, 'RetrievalAgent', DummyRetrievalAgent)
+    monkeypatch.setattr(pipeline, 'CMRAgent', MockedCMR)
+    monkeypatch.setattr(pipeline.settings, 'cmr_speculative_search', False)
+    monkeypatch.setattr(pipeline.settings, 'result_store_enabled', False)
+
+    with TestClient(m.app) as client:
+        body = client.get('/query', params={'query': 'find rain datasets'}).json()
+        text = client.get('/metrics').text
+
+    perf = body['perf']
+    assert perf['api_calls']['collections'] == attempts['collections']
+    assert perf['breakdown']['cmr']['collections']['retries'] == 1
+    assert perf['breakdown']['cmr']['collections']['errors'] == 1
+    assert perf['breakdown']['cmr']['variables']['bytes'] > 0
+    assert {'start_step', 'intent_step', 'join_step', 'cmr_step', 'analysis_step'} <= set(perf['breakdown']['nodes_ms'])
+    assert '# TYPE cmr_agent_node_duration_seconds histogram' in text
+    assert 'cmr_agent_cmr_request_duration_seconds_count{endpoint="collections",status="503"}' in text
+    assert 'cmr_agent_node_duration_seconds_bucket{node="cmr_step",le="+Inf"}' in text
+    assert 'cmr_agent_cmr_retries_total{endpoint="collections"}' in text
+
+
+def test_answer_cache_keys_ttl_lru_and_stale_while_revalidate(monkeypatch):
+    import asyncio
+    import time
+    from cmr_agent import answer_cache
+    from cmr_agent.answer_cache import AnswerCache, cache_key
+
+    assert cache_key('MODIS aerosol 2020 global') == cache_key('global MODIS aerosols in 2020')
+    assert cache_key('MODIS aerosol 2015-2020') != cache_key('MODIS aerosol 2010-2020')
+    # A single year is not a range for infer_temporal but still distinguishes the query
+    assert cache_key('MODIS aerosol 2020 global') != cache_key('MODIS aerosol 2005 global')
+    assert cache_key('MODIS aerosol global') != cache_key('MODIS aerosol 2020 global')
+
+    clock = [1000.0]
+    monkeypatch.setattr(answer_cache.time, 'monotonic', lambda: clock[0])
+    runs = []
+
+    def runner(answer):
+        async def run():
+            runs.append(answer)
+            return {'synthesis': answer}
+        return run
+
+    async def scenario():
+        cache = AnswerCache(max_entries=2, ttl=10, stale=20, near_duplicate=0.5)
+        assert (await cache.get_or_run('MODIS aerosol global', runner('a1')))[1]['hit'] is False
+        result, info = await cache.get_or_run('global MODIS aerosols', runner('unused'))
+        assert result == {'synthesis': 'a1'} and info['hit'] and not info['stale']
+        # Same scope, overlapping terms: near-duplicate reuse
+        _, info = await cache.get_or_run('MODIS aerosol optical depth global', runner('unused'))
+        assert info['match'] == 'near_duplicate'
+
+        clock[0] += 15
+        result, info = await cache.get_or_run('MODIS aerosol global', runner('a2'))
+        assert result == {'synthesis': 'a1'} and info['stale']
+        await asyncio.sleep(0)
+        assert (await cache.get_or_run('MODIS aerosol global', runner('unused')))[0] == {'synthesis': 'a2'}
+
+        clock[0] += 40
+        assert (await cache.get_or_run('MODIS aerosol global', runner('a3')))[1]['hit'] is False
+        await cache.get_or_run('GPM precipitation', runner('b'))
+        await cache.get_or_run('sea ice extent', runner('c'))
+        assert cache.stats()['evictions'] == 1
+        assert (await cache.get_or_run('MODIS aerosol global', runner('a4')))[1]['hit'] is False
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert runs == ['a1', 'a2', 'a3', 'b', 'c', 'a4']
+    assert cache.stats()['refreshes'] == 1 and cache.stats()['near_hits'] == 1
+
+    async def concurrent_misses():
+        cache = AnswerCache()
+
+        async def slow():
+            runs.append('slow')
+            await asyncio.sleep(0.01)
+            return {'synthesis': 'shared'}
+
+        return cache, await asyncio.gather(*[cache.get_or_run('sea ice extent', slow) for _ in range(3)])
+
+    runs.clear()
+    cache, outcomes = asyncio.run(concurrent_misses())
+    assert runs == ['slow']
+    assert [info['coalesced'] for _, info in outcomes] == [False, True, True]
+    assert all(result == {'synthesis': 'shared'} for result, _ in outcomes)
+
+
+def test_cached_answer_skips_graph_execution(monkeypatch):
+    import asyncio
+    from cmr_agent.answer_cache import close_answer_cache
+
+    monkeypatch.setattr(pipeline.settings, 'answer_cache_enabled', True)
+    graph = pipeline.build_graph()
+    calls = []
+
+    class FakeCompiled:
+        async def ainvoke(self, state, *args, **kwargs):
+            calls.append(state)
+            return {**state, 'history': state['history'] + [state['user_query']], 'synthesis': 'answer', 'run_metadata': {}}
+
+    graph._compiled = FakeCompiled()
+
+    async def scenario():
+        first = await graph.ainvoke({'user_query': 'MODIS aerosol 2020 global'})
+        second = await graph.ainvoke({'user_query': 'global MODIS aerosols in 2020', 'history': ['earlier']})
+        return first, second
+
+    try:
+        first, second = asyncio.run(scenario())
+    finally:
+        close_answer_cache()
+    assert len(calls) == 1
+    assert 'answer_cache' not in first['run_metadata']
+    assert second['synthesis'] == 'answer'
+    assert second['history'] == ['earlier', 'global MODIS aerosols in 2020']
+    assert second['run_metadata']['answer_cache']['hit'] is True
+    assert second['run_metadata']['answer_cache']['lookup_ms'] < 50